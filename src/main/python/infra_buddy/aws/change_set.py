@@ -0,0 +1,58 @@
+CHANGE_ADD = 'add'
+CHANGE_REMOVE = 'remove'
+CHANGE_REPLACEMENT = 'replacement'
+CHANGE_IN_PLACE = 'in-place'
+CHANGE_TAGS = 'tags'
+CHANGE_METADATA = 'metadata'
+
+CHANGE_CLASSES = [CHANGE_ADD, CHANGE_REMOVE, CHANGE_REPLACEMENT, CHANGE_IN_PLACE, CHANGE_TAGS, CHANGE_METADATA]
+
+
+def iter_change_set_changes(client, description):
+    # type: (object, dict) -> iter
+    """
+    Lazily yields every change of a change set starting with the changes of an already loaded
+    description, the remaining pages are only requested if the caller keeps iterating.
+    """
+    res = description
+    while True:
+        for change in res.get('Changes', []):
+            yield change
+        next_ = res.get('NextToken', None)
+        if not next_:
+            return
+        res = client.describe_change_set(ChangeSetName=description['ChangeSetId'], NextToken=next_)
+
+
+def classify_change(change):
+    # type: (dict) -> str
+    """
+    :return: One of CHANGE_CLASSES based on the Action, Replacement, Scope and Details of the change
+    """
+    resource = change.get('ResourceChange', {})
+    action = resource.get('Action', None)
+    if action in ['Add', 'Import']:
+        return CHANGE_ADD
+    if action == 'Remove':
+        return CHANGE_REMOVE
+    if action != 'Modify':
+        # Dynamic or unknown so assume it matters
+        return CHANGE_IN_PLACE
+    if resource.get('Replacement', 'False') in ['True', 'Conditional']:
+        return CHANGE_REPLACEMENT
+    scope = set(resource.get('Scope', []))
+    if not scope:
+        return CHANGE_IN_PLACE
+    if scope == {'Metadata'}:
+        return CHANGE_METADATA
+    if 'Properties' in scope:
+        details = resource.get('Details', [])
+        # tags are also reported as a change to the 'Tags' property of the resource
+        if not details or any(detail.get('Target', {}).get('Name', None) != 'Tags' for detail in details
+                              if detail.get('Target', {}).get('Attribute', None) == 'Properties'):
+            return CHANGE_IN_PLACE
+        scope.discard('Properties')
+        scope.add('Tags')
+    if scope <= {'Tags', 'Metadata'}:
+        return CHANGE_TAGS
+    return CHANGE_IN_PLACE
@@ -0,0 +1,104 @@
+import threading
+
+import boto3
+from botocore.config import Config
+
+from infra_buddy.aws.rate_limiter import get_rate_limiter
+
+# sized for the worker pools used by introspect and deploy-service so threads do not queue for connections
+MAX_POOL_CONNECTIONS = 50
+
+_session = None
+_clients = {}
+# bumped by clear so every thread drops the resources it cached
+_generation = 0
+_lock = threading.Lock()
+# building from the shared session is not thread safe, this is held separately so that lookups of
+# cached clients do not wait for a client to be built
+_create_lock = threading.Lock()
+# boto3 resources are not thread safe so unlike clients they are only shared within a thread
+_local = threading.local()
+
+
+def _get_config():
+    return Config(max_pool_connections=MAX_POOL_CONNECTIONS,
+                  retries={'mode': 'adaptive', 'max_attempts': 10})
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        _session = boto3.session.Session()
+    return _session
+
+
+def _get_key(session, service, region):
+    credentials = session.get_credentials()
+    return service, region or session.region_name, credentials.access_key if credentials else None
+
+
+def get_access_key():
+    # type: () -> str
+    """
+    :return: The access key id of the credentials in use or None, i.e. to tell accounts apart without a call to STS
+    """
+    with _lock:
+        credentials = _get_session().get_credentials()
+    return credentials.access_key if credentials else None
+
+
+def get_client(service, region=None):
+    # type: (str, str) -> botocore.client.BaseClient
+    """
+    :return: A client shared by every caller in the process for the service, region and credentials.
+    Clients are thread safe and reuse their connection pool so building one per buddy is wasted work.
+    Calls made by the client are throttled by the process wide rate limiter.
+    """
+    with _lock:
+        session = _get_session()
+        generation = _generation
+        key = _get_key(session, service, region)
+        client = _clients.get(key, None)
+    if client is not None:
+        return client
+    with _create_lock:
+        client = session.client(service, region_name=region, config=_get_config())
+    with _lock:
+        if generation != _generation:
+            # cleared while building, do not cache a client for the old credentials
+            return client
+        if key not in _clients:
+            _clients[key] = client
+            get_rate_limiter().register(client)
+        return _clients[key]
+
+
+def get_resource(service, region=None):
+    # type: (str, str) -> boto3.resources.base.ServiceResource
+    """
+    :return: A resource shared by the callers on the current thread for the service, region and credentials
+    """
+    with _lock:
+        session = _get_session()
+        generation = _generation
+        key = _get_key(session, service, region)
+    if getattr(_local, 'generation', None) != generation:
+        _local.resources = {}
+        _local.generation = generation
+    if key not in _local.resources:
+        with _create_lock:
+            resource = session.resource(service, region_name=region, config=_get_config())
+        get_rate_limiter().register(resource.meta.client)
+        _local.resources[key] = resource
+    return _local.resources[key]
+
+
+def clear():
+    """
+    Drops every cached client, i.e. after the credentials in the environment change
+    """
+    global _session, _generation
+    with _lock:
+        _session = None
+        _clients.clear()
+        _generation += 1
@@ -1,15 +1,24 @@
 import json
+import time
+import uuid
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pprint import pformat
 
-import boto3
 import botocore
 import pydash as pydash
-from botocore.exceptions import WaiterError
 
+from infra_buddy.aws import clients
+from infra_buddy.aws.change_set import iter_change_set_changes, classify_change
+from infra_buddy.aws.export_cache import ExportCache
+from infra_buddy.aws.stack_waiter import StackEventWaiter, ChangeSetWaiter, format_stack_event, iter_stack_events, \
+    failed_resource_events
 from infra_buddy.utility import print_utility
 from infra_buddy.utility.exception import NOOPException
-from infra_buddy.utility.waitfor import waitfor
+from infra_buddy.utility.waitfor import waitfor, backoff_intervals
+
+# change set creation has not finished yet
+_PENDING_CHANGE_SET_STATUSES = ['CREATE_PENDING', 'CREATE_IN_PROGRESS']
 
 
 def _load_file_to_json(parameter_file):
@@ -17,17 +26,26 @@ def _load_file_to_json(parameter_file):
         return json.load(source)
 
 
+def _get_template_args(template_file_url, template_body):
+    if template_body is not None:
+        return {'TemplateBody': template_body}
+    return {'TemplateURL': template_file_url}
+
+
 class CloudFormationBuddy(object):
     def __init__(self, deploy_ctx):
         super(CloudFormationBuddy, self).__init__()
-        self.exports = {}
+        self.export_cache = None
         self.resources = []
         self.deploy_ctx = deploy_ctx
-        self.client = boto3.client('cloudformation', region_name=self.deploy_ctx.region)
+        self.client = clients.get_client('cloudformation', self.deploy_ctx.region)
         self.existing_change_set_id = None
         self.stack_id = None
         self.change_set_description = None
         self.stack_description = None
+        self.last_request_token = None
+        self.last_cancel_token = None
+        self.root_cause_event = None
         self.stack_name = self.deploy_ctx.stack_name
 
     def does_stack_exist(self):
@@ -60,31 +78,54 @@ class CloudFormationBuddy(object):
         print_utility.info(
             "Deleted ChangeSet - ChangeSetID: {} Response: {}".format(self.existing_change_set_id, response))
 
-    def create_change_set(self, template_file_url, parameter_file):
+    def create_change_set(self, template_file_url=None, parameter_file=None, template_body=None):
+        self.start_change_set(template_file_url=template_file_url,
+                              parameter_file=parameter_file,
+                              template_body=template_body)
+        self.finish_change_set()
+
+    def start_change_set(self, template_file_url=None, parameter_file=None, template_body=None):
         resp = self.client.create_change_set(
             StackName=self.stack_name,
-            TemplateURL=template_file_url,
             Parameters=_load_file_to_json(parameter_file),
             Capabilities=[
                 'CAPABILITY_IAM', 'CAPABILITY_NAMED_IAM'
             ],
-            ChangeSetName=self.deploy_ctx.change_set_name
+            ChangeSetName=self.deploy_ctx.change_set_name,
+            **_get_template_args(template_file_url, template_body)
         )
         self.existing_change_set_id = resp['Id']
         self.stack_id = resp['StackId']
+        self.change_set_description = None
         print_utility.info("Created ChangeSet:\nChangeSetID: {}\nStackID: {}\n{}".format(resp['Id'],
                                                                                         resp['StackId'],
                                                                                         pformat(resp,indent=1)))
-        waiter = self.client.get_waiter('change_set_create_complete')
-        try:
-            waiter.wait(ChangeSetName=self.deploy_ctx.change_set_name, StackName=self.stack_id)
-        except WaiterError as we:
-            self.change_set_description = we.last_response
+
+    def finish_change_set(self):
+        """
+        Waits for the change set unless its description has already been loaded and cleans up failures
+        """
+        self._validate_changeset_operation_ready('finish_change_set')
+        if not self.change_set_description or \
+                self.change_set_description['Status'] in _PENDING_CHANGE_SET_STATUSES:
+            self.change_set_description = self._wait_for_change_set()
+        if self.change_set_description['Status'] != 'CREATE_COMPLETE':
             noop = self._is_noop_changeset()
-            print_utility.info("ChangeSet Failed to Create - {}".format(self.change_set_description['StatusReason']))
+            print_utility.info("ChangeSet Failed to Create - {}".format(
+                self.change_set_description.get('StatusReason', self.change_set_description['Status'])))
             if not noop:
                 self.log_changeset_status()
-                self._clean_change_set_and_exit()
+                # there is nothing left to execute
+                self._clean_change_set_and_exit(failed=True)
+
+    def is_failed_change_set(self):
+        self._validate_changeset_operation_ready('is_failed_change_set')
+        self.describe_change_set()
+        return self.change_set_description['Status'] == 'FAILED' and not self._is_noop_changeset()
+
+    def _wait_for_change_set(self):
+        waiter = ChangeSetWaiter(client=self.client, timeout_seconds=self.deploy_ctx.get_change_set_wait_timeout())
+        return waiter.wait([self.existing_change_set_id])[self.existing_change_set_id]
 
     def _is_noop_changeset(self):
         message = self.change_set_description.get('StatusReason', '')
@@ -110,17 +151,38 @@ class CloudFormationBuddy(object):
         self._validate_changeset_operation_ready('execute changeset')
         action = 'update-stack'
         self._start_update_event(action)
-        self.client.execute_change_set(ChangeSetName=self.existing_change_set_id)
-        waiter = self.client.get_waiter('stack_update_complete')
-        try:
-            waiter.wait(StackName=self.stack_id)
-            success = True
-        except WaiterError as we:
-            success = False
+        token = self._generate_request_token()
+        self.client.execute_change_set(ChangeSetName=self.existing_change_set_id, ClientRequestToken=token)
+        success = self._wait_for_stack_operation(token, ['UPDATE_COMPLETE'],
+                                                 cancel_on_failure=self.deploy_ctx.should_cancel_on_failure())
+        self._invalidate_exports()
         self._finish_update_event(action, success)
         if not success:
             self._clean_change_set_and_exit(failed=True,failure_stage='execute')
 
+    def _generate_request_token(self):
+        self.last_request_token = "infra-buddy-{}".format(uuid.uuid4())
+        self.last_cancel_token = None
+        self.root_cause_event = None
+        return self.last_request_token
+
+    def _wait_for_stack_operation(self, token, success_statuses, cancel_on_failure=False):
+        waiter = StackEventWaiter(client=self.client,
+                                  stack_name=self.stack_id,
+                                  client_request_token=token,
+                                  timeout_seconds=self.deploy_ctx.get_stack_wait_timeout(),
+                                  cancel_on_failure=cancel_on_failure)
+        success = waiter.wait(success_statuses)
+        self.last_cancel_token = waiter.cancel_token
+        if not success:
+            self.root_cause_event = waiter.root_cause_event
+        self._describe_stack()
+        return success
+
+    def _invalidate_exports(self):
+        # stack operations may add, change or remove exports
+        self._get_export_cache().invalidate()
+
     def _validate_changeset_operation_ready(self, operation):
         if not self.existing_change_set_id:
             raise Exception("Attempted to {} before create was called".format(operation))
@@ -130,8 +192,8 @@ class CloudFormationBuddy(object):
         self.describe_change_set()
         if self._is_noop_changeset():
             return False
-        changes_ = self.change_set_description['Changes']
-        if len(changes_) == 2:
+        changes_ = self.change_set_description.get('Changes', [])
+        if len(changes_) == 2 and not self.change_set_description.get('NextToken', None):
             if pydash.get(changes_[0], 'ResourceChange.ResourceType') == "AWS::ECS::Service":
                 if pydash.get(changes_[1], 'ResourceChange.ResourceType') == "AWS::ECS::TaskDefinition":
                     if self.deploy_ctx.should_skip_ecs_trivial_update():
@@ -139,7 +201,24 @@ class CloudFormationBuddy(object):
                             "WARN: Skipping changeset update because no computed changes except to service & task "
                             "rerun with SKIP_ECS=True to force")
                         return False
-        return True
+        return self._matches_change_set_policy()
+
+    def _matches_change_set_policy(self):
+        policy = self.deploy_ctx.get_change_set_policy()
+        counts = defaultdict(int)
+        for change in iter_change_set_changes(self.client, self.change_set_description):
+            change_class = classify_change(change)
+            if change_class in policy:
+                print_utility.info("ChangeSet contains a change worth executing - {} {}".format(
+                    change_class, pydash.get(change, 'ResourceChange.LogicalResourceId')))
+                return True
+            counts[change_class] += 1
+        if not counts:
+            # nothing to classify, let CloudFormation decide
+            return True
+        print_utility.warn("Skipping ChangeSet - no changes match the execution policy {} - {}".format(
+            policy, dict(counts)))
+        return False
 
     def should_create_change_set(self):
         exists = self.does_stack_exist()
@@ -150,45 +229,57 @@ class CloudFormationBuddy(object):
                                     raise_exception=True)
         return exists
 
-    def create_stack(self, template_file_url, parameter_file):
+    def create_stack(self, template_file_url=None, parameter_file=None, template_body=None):
         action = 'create-stack'
         self._start_update_event(action)
-        print_utility.info("Template URL: " + template_file_url)
+        print_utility.info("Template URL: {}".format(template_file_url if template_file_url else "<inline>"))
+        token = self._generate_request_token()
         resp = self.client.create_stack(
             StackName=self.stack_name,
-            TemplateURL=template_file_url,
             Parameters=_load_file_to_json(parameter_file),
             Capabilities=[
                 'CAPABILITY_IAM', 'CAPABILITY_NAMED_IAM'
             ],
-            Tags=[
-                {
-                    'Key': 'Environment',
-                    'Value': self.deploy_ctx.environment
-                },
-                {
-                    'Key': 'Application',
-                    'Value': self.deploy_ctx.application
-                },
-                {
-                    'Key': 'Role',
-                    'Value': self.deploy_ctx.role
-                }
-            ]
+            ClientRequestToken=token,
+            Tags=self._get_new_stack_tags(),
+            **_get_template_args(template_file_url, template_body)
         )
         self.stack_id = resp['StackId']
-        waiter = self.client.get_waiter('stack_create_complete')
-        try:
-            waiter.wait(StackName=self.stack_id)
-            success = True
-        except WaiterError as we:
-            self.stack_description = we.last_response
-            success = False
+        success = self._wait_for_stack_operation(token, ['CREATE_COMPLETE'])
+        self._invalidate_exports()
         self._finish_update_event(action, success)
         print_utility.info("Created Stack -  StackID: {}".format(resp['StackId']))
         if not success:
             raise Exception("Cloudformation stack failed to create")
 
+    def _get_new_stack_tags(self):
+        tags = [
+            {
+                'Key': 'Environment',
+                'Value': self.deploy_ctx.environment
+            },
+            {
+                'Key': 'Application',
+                'Value': self.deploy_ctx.application
+            },
+            {
+                'Key': 'Role',
+                'Value': self.deploy_ctx.role
+            }
+        ]
+        return tags
+
+    def get_stack_version(self, refresh=False):
+        # type: (bool) -> str
+        """
+        :return: Identifies the stack and its last update, any stack operation changes it
+        """
+        if not self.stack_description or refresh: self._describe_stack()
+        if not self.stack_description:
+            return None
+        return "{}@{}".format(self.stack_description['StackId'],
+                              self.stack_description.get('LastUpdatedTime', self.stack_description['CreationTime']))
+
     def log_stack_status(self, print_stack_events=False):
         print_utility.banner_warn("Stack Details: {}".format(self.stack_id), pformat(self.stack_description,indent=2))
         if print_stack_events:
@@ -224,28 +315,50 @@ class CloudFormationBuddy(object):
             self.deploy_ctx.notify_event(title=msg,
                                          type="error")
             self.log_stack_status(print_stack_events=True)
+            if self.root_cause_event:
+                print_utility.banner_warn("Root Cause: {}".format(self.stack_name),
+                                          format_stack_event(self.root_cause_event))
 
     def get_export_value(self, param=None, fully_qualified_param_name=None):
         if not fully_qualified_param_name:
             fully_qualified_param_name = "{stack_name}-{param}".format(stack_name=self.stack_name, param=param)
-        if len(self.exports) == 0: self._load_export_values()
-        val = self.exports.get(fully_qualified_param_name, None)
+        val = self._get_export_cache().get_export_value(self.client, fully_qualified_param_name)
         if val is None:
             print_utility.warn("Could not locate export value - {}".format(fully_qualified_param_name))
         return val
 
-    def _load_export_values(self):
-        export_results = self.client.list_exports()
-        export_list = export_results['Exports']
-        while export_list is not None:
-            for export in export_list:
-                self.exports[export['Name']] = export['Value']
-            next_ = export_results.get('NextToken', None)
-            if next_:
-                export_results = self.client.list_exports(NextToken=next_)
-                export_list = export_results.get('Exports', None)
-            else:
-                export_list = None
+    def resolve_exports(self, required, optional=None, initial_interval_seconds=1, max_interval_seconds=8,
+                        max_attempts=5):
+        # type: (list, list, float, float, int) -> dict
+        """
+        Resolves a batch of export names from a single export scan.  Immediately after a stack create the
+        exports may not be visible yet, so the scan is repeated with backoff while any required export is
+        missing.  Missing optional exports do not cause a retry.
+        :return: The export values keyed by name, None for exports that could not be found
+        """
+        names = list(required) + list(optional or [])
+        intervals = backoff_intervals(initial_interval_seconds, max_interval_seconds)
+        exports = self._get_export_cache().get_exports(self.client)
+        attempt = 1
+        while attempt < max_attempts:
+            missing = [name for name in required if name not in exports]
+            if not missing:
+                break
+            print_utility.info("Waiting for exports - {}".format(missing))
+            time.sleep(next(intervals))
+            self._invalidate_exports()
+            exports = self._get_export_cache().get_exports(self.client)
+            attempt += 1
+        ret = {name: exports.get(name, None) for name in names}
+        for name in required:
+            if ret[name] is None:
+                print_utility.warn("Could not locate export value - {}".format(name))
+        return ret
+
+    def _get_export_cache(self):
+        if self.export_cache is None:
+            self.export_cache = ExportCache.for_context(self.deploy_ctx)
+        return self.export_cache
 
     def get_existing_parameter_value(self, param_val):
         self._describe_stack()
@@ -275,6 +388,10 @@ class CloudFormationBuddy(object):
         return ret
 
     def list_stacks(self, filter=None):
+        pluck = pydash.pluck(self.list_stack_summaries(), "StackName")
+        return [stack for stack in pluck if filter and stack.startswith(filter)]
+
+    def list_stack_summaries(self):
         ret = []
         res = self.client.list_stacks(StackStatusFilter=['UPDATE_COMPLETE', 'CREATE_COMPLETE'])
         res_stack_list = res['StackSummaries']
@@ -286,30 +403,66 @@ class CloudFormationBuddy(object):
                 res_stack_list = res['StackSummaries']
             else:
                 res_stack_list = None
-        pluck = pydash.pluck(ret, "StackName")
-        return [stack for stack in pluck if filter and stack.startswith(filter)]
+        return ret
 
     def load_resources_for_stack_list(self, stacks):
         resources = defaultdict(list)
-        for stack in stacks:
-            resources[stack] = self.load_stack_resources(stack)
+        for stack, stack_resources in self.iter_resources_for_stack_list(stacks):
+            resources[stack] = stack_resources
         return resources
 
+    def iter_resources_for_stack_list(self, stacks, type_filter=None, max_workers=10):
+        """
+        Loads the resources of each stack on a bounded thread pool and yields (stack_name, resources)
+        as each stack completes.  Only max_workers stacks are in flight at a time and the type filter
+        is applied in the worker so only matching resources are retained.
+        """
+        stacks = iter(stacks)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            in_flight = {}
+            while True:
+                for stack in stacks:
+                    in_flight[executor.submit(self._load_filtered_stack_resources, stack, type_filter)] = stack
+                    if len(in_flight) >= max_workers:
+                        break
+                if not in_flight:
+                    return
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield in_flight.pop(future), future.result()
+
+    def _load_filtered_stack_resources(self, stack, type_filter):
+        resources = self.load_stack_resources(stack)
+        if not type_filter:
+            return resources
+        return [resource for resource in resources if type_filter in resource['ResourceType']]
+
+    def get_operation_events(self, since=None):
+        # type: (datetime) -> list
+        """
+        :return: The events of the most recent stack operation in chronological order.  The operation is
+                 identified by the request token used to start it, otherwise by since (or the latest
+                 stack level start event).
+        """
+        token = None
+        if since is None and self.last_request_token:
+            token = [t for t in [self.last_request_token, self.last_cancel_token] if t]
+        events = list(iter_stack_events(self.client,
+                                        self.stack_id or self.stack_name,
+                                        client_request_token=token,
+                                        since=since))
+        events.reverse()
+        return events
+
+    def get_failed_resource_events(self, since=None):
+        return failed_resource_events(self.get_operation_events(since=since))
+
     def _print_stack_events(self):
-        events = []
-        res = self.client.describe_stack_events(StackName=self.stack_name)
-        res_list = res['StackEvents']
-        while res_list is not None:
-            events.extend(res_list)
-            next_ = res.get('NextToken', None)
-            if next_:
-                res = self.client.describe_stack_events(StackName=self.stack_name, NextToken=next_)
-                res_list = res['StackEvents']
-            else:
-                res_list = None
+        events = self.get_operation_events()
         for ev in events:
-            if "ResourceStatusReason" in ev:
-                template = "{Timestamp}\t{ResourceStatus}\t{ResourceType}\t{LogicalResourceId}\t{ResourceStatusReason}"
-            else:
-                template = "{Timestamp}\t{ResourceStatus}\t{ResourceType}\t{LogicalResourceId}"
-            print_utility.warn(template.format(**ev))
+            print_utility.warn(format_stack_event(ev))
+        failed = failed_resource_events(events)
+        if failed:
+            print_utility.banner("Failed Resources:")
+            for ev in failed:
+                print_utility.error(format_stack_event(ev))
@@ -0,0 +1,79 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from infra_buddy.utility import print_utility
+from infra_buddy.utility.waitfor import backoff_intervals
+
+_TERMINAL_DETECTION_STATUSES = ['DETECTION_COMPLETE', 'DETECTION_FAILED']
+_DRIFTED_RESOURCE_STATUSES = ['MODIFIED', 'DELETED', 'NOT_CHECKED']
+
+
+class StackDriftDetector(object):
+    """
+    Detects drift on many stacks at once.  Detection is started on every stack concurrently and all the
+    detection ids are polled from a single loop so results stream back as each stack finishes.
+    """
+
+    def __init__(self, client, initial_interval_seconds=1, max_interval_seconds=10, timeout_seconds=900):
+        super(StackDriftDetector, self).__init__()
+        self.client = client
+        self.initial_interval_seconds = initial_interval_seconds
+        self.max_interval_seconds = max_interval_seconds
+        self.timeout_seconds = timeout_seconds
+
+    def start(self, stack_names, max_workers=10):
+        # type: (list, int) -> dict
+        """
+        :return: The stack name keyed by detection id, stacks that could not be checked are reported and skipped
+        """
+        def start_detection(stack_name):
+            try:
+                return self.client.detect_stack_drift(StackName=stack_name)['StackDriftDetectionId']
+            except ClientError as err:
+                # i.e. the stack is being updated
+                print_utility.warn("Could not detect drift for stack {} - {}".format(stack_name, err))
+                return None
+
+        if not stack_names:
+            return {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(stack_names)))) as executor:
+            detection_ids = list(executor.map(start_detection, stack_names))
+        return {detection_id: stack for detection_id, stack in zip(detection_ids, stack_names) if detection_id}
+
+    def iter_results(self, detections):
+        # type: (dict) -> iter
+        """
+        :param detections: The stack name keyed by detection id as returned by start
+        :return: (stack_name, detection status, drifted resources) as each detection finishes
+        """
+        deadline = time.time() + self.timeout_seconds
+        intervals = backoff_intervals(self.initial_interval_seconds, self.max_interval_seconds)
+        pending = dict(detections)
+        while pending:
+            for detection_id, stack_name in list(pending.items()):
+                status = self.client.describe_stack_drift_detection_status(StackDriftDetectionId=detection_id)
+                if status['DetectionStatus'] in _TERMINAL_DETECTION_STATUSES:
+                    del pending[detection_id]
+                    drifts = self.load_resource_drifts(stack_name) \
+                        if status.get('StackDriftStatus', None) == 'DRIFTED' else []
+                    yield stack_name, status, drifts
+            if not pending:
+                return
+            if time.time() > deadline:
+                print_utility.error("Timed out waiting for drift detection - {}".format(sorted(pending.values())))
+                return
+            time.sleep(next(intervals))
+
+    def load_resource_drifts(self, stack_name):
+        # type: (str) -> list
+        args = {'StackName': stack_name, 'StackResourceDriftStatusFilters': _DRIFTED_RESOURCE_STATUSES}
+        ret = []
+        while True:
+            res = self.client.describe_stack_resource_drifts(**args)
+            ret.extend(res['StackResourceDrifts'])
+            next_ = res.get('NextToken', None)
+            if not next_:
+                return ret
+            args['NextToken'] = next_
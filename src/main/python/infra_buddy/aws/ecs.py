@@ -1,50 +1,131 @@
-import boto3
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import pydash
 
-from infra_buddy.utility import print_utility, waitfor
+from infra_buddy.aws import clients
+from infra_buddy.aws.ecs_waiter import ServiceDeploymentWaiter
+from infra_buddy.aws.image_digest import ImageDigestResolver, split_image
+from infra_buddy.aws.target_health import TargetHealthGate
+from infra_buddy.utility import print_utility
 
 from infra_buddy.aws.cloudformation import CloudFormationBuddy
 
+DEFINITION_HASH_TAG = 'infra-buddy:definition-hash'
+# the number of recent active revisions of the family searched for a matching definition
+_RECENT_REVISIONS = 5
+# list_task_definitions matches families by prefix so request enough to find the family's own revisions
+_LIST_PAGE_SIZE = 100
+
+# task definition arn keyed by (region, family, definition hash) for revisions seen by this process
+_task_definition_cache = {}
+_task_definition_lock = threading.Lock()
+
+
+def compute_task_definition_hash(task_definition):
+    # type: (dict) -> str
+    canonical = json.dumps(task_definition, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
 
 class ECSBuddy(object):
     def __init__(self, deploy_ctx):
         # type: (DeployContext) -> None
         super(ECSBuddy, self).__init__()
         self.deploy_ctx = deploy_ctx
-        self.client = boto3.client('ecs', region_name=self.deploy_ctx.region)
-        cf = CloudFormationBuddy(deploy_ctx)
-        ecs_cluster_export_key = "{}-ECSCluster".format(self.deploy_ctx.cluster_stack_name)
-        self.cluster = self._wait_for_export(cf=cf, fully_qualified_param_name=ecs_cluster_export_key)
-        ecs_service_export_key = "{}-ECSService".format(self.deploy_ctx.stack_name)
-        self.ecs_service = self._wait_for_export(cf=cf, fully_qualified_param_name=ecs_service_export_key)
-        ecs_task_family_export_key = "{}-ECSTaskFamily".format(self.deploy_ctx.stack_name)
-        self.ecs_task_family = self._wait_for_export(cf=cf, fully_qualified_param_name=ecs_task_family_export_key)
-        ecs_task_execution_role_export_key = "{}-ECSTaskExecutionRole".format(self.deploy_ctx.stack_name)
-        self.ecs_task_execution_role = self._wait_for_export(cf=cf, fully_qualified_param_name=ecs_task_execution_role_export_key)
-        ecs_task_role_export_key = "{}-ECSTaskRole".format(self.deploy_ctx.stack_name)
-        self.ecs_task_role = self._wait_for_export(cf=cf, fully_qualified_param_name=ecs_task_role_export_key)
+        self.client = clients.get_client('ecs', self.deploy_ctx.region)
+        # exports are resolved on first use so building the execution plan makes no AWS calls
+        self.exports = {}
         self.task_definition_description = None
         self.new_image = None
+        self.new_image_digest = None
+        self._image_digest_resolver = None
+
+    def _get_export(self, name):
+        if name not in self.exports:
+            self._resolve_exports()
+        return self.exports[name]
 
-    @classmethod
-    def _wait_for_export(cls, cf, fully_qualified_param_name):
+    def _resolve_exports(self):
+        cf = CloudFormationBuddy(self.deploy_ctx)
+        keys = {
+            'cluster': "{}-ECSCluster".format(self.deploy_ctx.cluster_stack_name),
+            'ecs_service': "{}-ECSService".format(self.deploy_ctx.stack_name),
+            'ecs_task_family': "{}-ECSTaskFamily".format(self.deploy_ctx.stack_name),
+            'ecs_task_execution_role': "{}-ECSTaskExecutionRole".format(self.deploy_ctx.stack_name),
+            'ecs_task_role': "{}-ECSTaskRole".format(self.deploy_ctx.stack_name)
+        }
         # we are seeing an issue where immediately after stack create the export values are not
-        # immediately available
-        value = waitfor.waitfor(
-            function_pointer=cf.get_export_value,
-            expected_result=None,
-            interval_seconds=2,
-            max_attempts=5,
-            negate=True,
-            args={"fully_qualified_param_name": fully_qualified_param_name},
-            exception=False
-        )
-
-        print_utility.info("[wait_for_export] {}={}".format(fully_qualified_param_name, value))
-        return value
-
-    def set_container_image(self, location, tag):
-        self.new_image = "{location}:{tag}".format(location=location, tag=tag)
+        # immediately available, the roles are not exported by every stack so never wait for them
+        exports = cf.resolve_exports(required=[keys['cluster'], keys['ecs_service'], keys['ecs_task_family']],
+                                     optional=[keys['ecs_task_execution_role'], keys['ecs_task_role']])
+        for name, key in keys.items():
+            print_utility.info("[resolve_exports] {}={}".format(key, exports[key]))
+            # values assigned explicitly take precedence
+            self.exports.setdefault(name, exports[key])
+
+    @property
+    def cluster(self):
+        return self._get_export('cluster')
+
+    @cluster.setter
+    def cluster(self, value):
+        self.exports['cluster'] = value
+
+    @property
+    def ecs_service(self):
+        return self._get_export('ecs_service')
+
+    @ecs_service.setter
+    def ecs_service(self, value):
+        self.exports['ecs_service'] = value
+
+    @property
+    def ecs_task_family(self):
+        return self._get_export('ecs_task_family')
+
+    @ecs_task_family.setter
+    def ecs_task_family(self, value):
+        self.exports['ecs_task_family'] = value
+
+    @property
+    def ecs_task_execution_role(self):
+        return self._get_export('ecs_task_execution_role')
+
+    @ecs_task_execution_role.setter
+    def ecs_task_execution_role(self, value):
+        self.exports['ecs_task_execution_role'] = value
+
+    @property
+    def ecs_task_role(self):
+        return self._get_export('ecs_task_role')
+
+    @ecs_task_role.setter
+    def ecs_task_role(self, value):
+        self.exports['ecs_task_role'] = value
+
+    @property
+    def image_digest_resolver(self):
+        if self._image_digest_resolver is None:
+            self._image_digest_resolver = ImageDigestResolver(
+                cache_path=self.deploy_ctx.get_image_digest_cache_file())
+        return self._image_digest_resolver
+
+    @image_digest_resolver.setter
+    def image_digest_resolver(self, value):
+        self._image_digest_resolver = value
+
+    def set_container_image(self, location, tag, digest=None):
+        if digest is None and self.deploy_ctx.should_resolve_image_digest():
+            digest = self.image_digest_resolver.resolve(location, tag)
+        self.new_image_digest = digest
+        if digest:
+            # pinned so every task of the deployment runs the same image even if the tag is moved
+            self.new_image = "{location}@{digest}".format(location=location, digest=digest)
+        else:
+            self.new_image = "{location}:{tag}".format(location=location, tag=tag)
 
     def requires_update(self):
         if not self.new_image:
@@ -57,7 +138,32 @@ class ECSBuddy(object):
         existing = pydash.get(self.task_definition_description, "containerDefinitions[0].image")
         print_utility.info("ECS task existing image - {}".format(existing))
         print_utility.info("ECS task desired image - {}".format(self.new_image))
-        return existing != self.new_image
+        if existing == self.new_image:
+            return False
+        if self.new_image_digest and existing:
+            # retagging an image does not change its digest so there is nothing to roll out
+            existing_digests = self._get_existing_image_digests(existing)
+            print_utility.info("ECS task existing image digests - {}".format(existing_digests))
+            if existing_digests == {self.new_image_digest}:
+                return False
+        return True
+
+    def _get_existing_image_digests(self, existing):
+        # type: (str) -> set
+        """
+        :return: The digests the service runs for the existing image.  A tag may have been moved since the
+        tasks started so unless the image is pinned the digests reported by the running tasks are used.
+        """
+        digest = split_image(existing)[2]
+        if digest:
+            return {digest}
+        task_arns = self.client.list_tasks(cluster=self.cluster, serviceName=self.ecs_service,
+                                           desiredStatus='RUNNING')['taskArns']
+        if not task_arns:
+            return set()
+        tasks = self.client.describe_tasks(cluster=self.cluster, tasks=task_arns[:100])['tasks']
+        return {container.get('imageDigest', None) for task in tasks for container in task.get('containers', [])
+                if container.get('image', None) == existing}
 
     def perform_update(self):
         self._describe_task_definition(refresh=True)
@@ -106,34 +212,95 @@ class ECSBuddy(object):
         for k, v in new_task_def.items():
             print_utility.info('[new_task_def] {} = {}'.format(k, repr(v)))
 
-        updated_task_definition = self.client.register_task_definition(**new_task_def)['taskDefinition']
-        new_task_def_arn = updated_task_definition['taskDefinitionArn']
+        definition_hash = compute_task_definition_hash(new_task_def)
+        new_task_def_arn = self._find_task_definition(new_task_def['family'], definition_hash)
+        if new_task_def_arn:
+            print_utility.progress("Reusing task definition with identical definition - {}".format(new_task_def_arn))
+        else:
+            new_task_def['tags'] = [{'key': DEFINITION_HASH_TAG, 'value': definition_hash}]
+            updated_task_definition = self.client.register_task_definition(**new_task_def)['taskDefinition']
+            new_task_def_arn = updated_task_definition['taskDefinitionArn']
+            self._cache_task_definition(new_task_def['family'], definition_hash, new_task_def_arn)
 
         self.deploy_ctx.notify_event(
             title="Update of ecs service {service} started".format(service=self.ecs_service),
             type="success")
-        self.client.update_service(
+        service = self.client.update_service(
             cluster=self.cluster,
             service=self.ecs_service,
-            taskDefinition=new_task_def_arn)
-        waiter = self.client.get_waiter('services_stable')
-        success = True
+            taskDefinition=new_task_def_arn)['service']
+        readiness_gate = None
+        if self.deploy_ctx.should_use_readiness_gate():
+            readiness_gate = TargetHealthGate(ecs_client=self.client,
+                                              elb_client=clients.get_client('elbv2', self.deploy_ctx.region),
+                                              cluster=self.cluster,
+                                              service_description=service)
+            if not readiness_gate.target_groups:
+                print_utility.warn("No target groups found for {} - waiting for the deployment to "
+                                   "complete".format(self.ecs_service))
+        waiter = ServiceDeploymentWaiter(client=self.client,
+                                         cluster=self.cluster,
+                                         service=self.ecs_service,
+                                         timeout_seconds=self.deploy_ctx.get_ecs_wait_timeout(),
+                                         readiness_gate=readiness_gate)
+        success = False
         try:
-            waiter.wait(
-                cluster=self.cluster,
-                services=[self.ecs_service]
-            )
-        except Exception as e:
-            success = False
-            print_utility.error("Error waiting for service to stabilize - {}".format(e.message), raise_exception=True)
+            success = waiter.wait(service, new_task_def_arn)
         finally:
             self.deploy_ctx.notify_event(
                 title="Update of ecs service {service} completed".format(service=self.ecs_service,
                                                                          success="Success" if success else "Failed"),
                 type="success" if success else "error")
+        if not success:
+            print_utility.error("Error waiting for service to stabilize - {}".format(waiter.failure_reason),
+                                raise_exception=True)
+
+    def _find_task_definition(self, family, definition_hash):
+        # type: (str, str) -> str
+        """
+        :return: The arn of an active revision registered from the same definition, i.e. when redeploying
+        or rolling back to a previously used image, otherwise None
+        """
+        with _task_definition_lock:
+            arn = _task_definition_cache.get((self.deploy_ctx.region, family, definition_hash), None)
+        if arn:
+            return arn
+        arns = self.client.list_task_definitions(familyPrefix=family, status='ACTIVE', sort='DESC',
+                                                 maxResults=_LIST_PAGE_SIZE)['taskDefinitionArns']
+        # other families may start with the name of this one
+        arns = [arn for arn in arns if arn.split('/')[-1].rsplit(':', 1)[0] == family][:_RECENT_REVISIONS]
+        if not arns:
+            return None
+        with ThreadPoolExecutor(max_workers=len(arns)) as executor:
+            descriptions = list(executor.map(
+                lambda revision: self.client.describe_task_definition(taskDefinition=revision, include=['TAGS']),
+                arns))
+        found = None
+        for arn, res in zip(arns, descriptions):
+            tags = {tag['key']: tag['value'] for tag in res.get('tags', [])}
+            if DEFINITION_HASH_TAG in tags:
+                self._cache_task_definition(family, tags[DEFINITION_HASH_TAG], arn)
+            if found is None and tags.get(DEFINITION_HASH_TAG, None) == definition_hash:
+                found = arn
+        return found
+
+    def _cache_task_definition(self, family, definition_hash, arn):
+        with _task_definition_lock:
+            _task_definition_cache[(self.deploy_ctx.region, family, definition_hash)] = arn
 
     def _describe_task_definition(self, refresh=False):
         if self.task_definition_description and not refresh:
             return
-        self.task_definition_description = self.client.describe_task_definition(taskDefinition=self.ecs_task_family)[
-            'taskDefinition']
+        self.task_definition_description = self.client.describe_task_definition(
+            taskDefinition=self._get_running_task_definition())['taskDefinition']
+
+    def _get_running_task_definition(self):
+        # type: () -> str
+        """
+        :return: The revision the service runs, after a rollback to a reused revision this is not the latest
+        revision of the family
+        """
+        services = self.client.describe_services(cluster=self.cluster, services=[self.ecs_service])['services']
+        if services and services[0].get('taskDefinition', None):
+            return services[0]['taskDefinition']
+        return self.ecs_task_family
@@ -0,0 +1,105 @@
+import time
+
+from infra_buddy.utility import print_utility
+from infra_buddy.utility.waitfor import backoff_intervals
+
+
+def format_service_event(ev):
+    return "{createdAt}\t{message}".format(**ev)
+
+
+def find_deployment(service, task_definition_arn):
+    # type: (dict, str) -> dict
+    deployments = [deployment for deployment in service.get('deployments', [])
+                   if deployment['taskDefinition'] == task_definition_arn]
+    # an older deployment of the same revision may still be draining
+    deployments.sort(key=lambda deployment: deployment.get('status', None) != 'PRIMARY')
+    return deployments[0] if deployments else None
+
+
+def format_stopped_task(task):
+    reasons = [task.get('stoppedReason', 'unknown reason')]
+    for container in task.get('containers', []):
+        if 'reason' in container:
+            reasons.append("{name}: {reason}".format(**container))
+        elif container.get('exitCode', 0):
+            reasons.append("{name}: exit code {exitCode}".format(**container))
+    return "{} - {}".format(task['taskArn'], "; ".join(reasons))
+
+
+class ServiceDeploymentWaiter(object):
+    """
+    Waits for the deployment created by update_service rather than for the whole service to become stable.
+    Service events are streamed while waiting and the wait fails as soon as a task of the new deployment
+    stops, instead of waiting out the budget of the services_stable waiter.
+    An optional readiness gate (i.e. TargetHealthGate) can declare the deployment ready before ECS does.
+    """
+
+    def __init__(self, client, cluster, service, initial_interval_seconds=2, max_interval_seconds=15,
+                 timeout_seconds=600, readiness_gate=None):
+        super(ServiceDeploymentWaiter, self).__init__()
+        self.client = client
+        self.readiness_gate = readiness_gate
+        self.cluster = cluster
+        self.service = service
+        self.initial_interval_seconds = initial_interval_seconds
+        self.max_interval_seconds = max_interval_seconds
+        self.timeout_seconds = timeout_seconds
+        self.seen_event_ids = set()
+        self.failure_reason = None
+
+    def wait(self, service_description, task_definition_arn):
+        # type: (dict, str) -> bool
+        """
+        :param service_description: The service returned by update_service, its events are already old news
+        :param task_definition_arn: Identifies the new deployment
+        :return: True once the new deployment has completed, failure_reason describes why it did not
+        """
+        self.seen_event_ids.update(ev['id'] for ev in service_description.get('events', []))
+        deadline = time.time() + self.timeout_seconds
+        intervals = backoff_intervals(self.initial_interval_seconds, self.max_interval_seconds)
+        while True:
+            service = self.client.describe_services(cluster=self.cluster, services=[self.service])['services'][0]
+            self._print_new_events(service)
+            deployment = find_deployment(service, task_definition_arn)
+            if deployment is None:
+                self.failure_reason = "Deployment of {} was replaced".format(task_definition_arn)
+                return False
+            if self._is_complete(deployment):
+                return True
+            if deployment.get('rolloutState', None) == 'FAILED':
+                self.failure_reason = deployment.get('rolloutStateReason', 'Deployment failed')
+                return False
+            if deployment.get('failedTasks', 0):
+                self.failure_reason = self._describe_failed_tasks(deployment)
+                return False
+            if self.readiness_gate is not None and self.readiness_gate.is_ready(deployment):
+                return True
+            if time.time() > deadline:
+                self.failure_reason = "Timed out waiting for deployment ({runningCount}/{desiredCount} " \
+                                      "running)".format(**deployment)
+                return False
+            time.sleep(next(intervals))
+
+    def _is_complete(self, deployment):
+        rollout_state = deployment.get('rolloutState', None)
+        if rollout_state is not None:
+            return rollout_state == 'COMPLETED'
+        return deployment['runningCount'] == deployment['desiredCount'] and deployment.get('pendingCount', 0) == 0
+
+    def _print_new_events(self, service):
+        # events are returned newest first
+        new_events = [ev for ev in service.get('events', []) if ev['id'] not in self.seen_event_ids]
+        for ev in reversed(new_events):
+            self.seen_event_ids.add(ev['id'])
+            print_utility.progress(format_service_event(ev))
+
+    def _describe_failed_tasks(self, deployment):
+        # tasks started by a service are tagged with the id of their deployment
+        task_arns = self.client.list_tasks(cluster=self.cluster, startedBy=deployment['id'],
+                                           desiredStatus='STOPPED')['taskArns']
+        if not task_arns:
+            return "{} tasks failed to start".format(deployment['failedTasks'])
+        tasks = self.client.describe_tasks(cluster=self.cluster, tasks=task_arns[:100])['tasks']
+        return "Tasks of the new deployment stopped:\n{}".format("\n".join(format_stopped_task(task)
+                                                                           for task in tasks))
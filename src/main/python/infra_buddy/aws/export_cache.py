@@ -0,0 +1,140 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+from infra_buddy.aws import clients
+from infra_buddy.utility import print_utility
+
+_account_ids = {}
+_account_lock = threading.Lock()
+
+
+def get_account_id(deploy_ctx):
+    # type: (DeployContext) -> str
+    account_id = deploy_ctx.get('AWS_ACCOUNT_ID', None)
+    if account_id:
+        return account_id
+    with _account_lock:
+        if deploy_ctx.region not in _account_ids:
+            sts = clients.get_client('sts', deploy_ctx.region)
+            _account_ids[deploy_ctx.region] = sts.get_caller_identity()['Account']
+        return _account_ids[deploy_ctx.region]
+
+
+class ExportCache(object):
+    """
+    Process wide cache of the CloudFormation exports for a single region and account.  Every
+    CloudFormationBuddy for the same region/account shares one instance so the (potentially large)
+    list_exports scan is only performed once per TTL.  Optionally the exports are persisted to a
+    local file so that subsequent processes (i.e. back to back CI jobs) can reuse them.
+    """
+    _caches = {}
+    _caches_lock = threading.Lock()
+
+    @classmethod
+    def for_context(cls, deploy_ctx):
+        # type: (DeployContext) -> ExportCache
+        key = (deploy_ctx.region, get_account_id(deploy_ctx))
+        with cls._caches_lock:
+            cache = cls._caches.get(key, None)
+            if cache is None:
+                cache = ExportCache(region=key[0],
+                                    account_id=key[1],
+                                    ttl_seconds=deploy_ctx.get_export_cache_ttl(),
+                                    persist_path=deploy_ctx.get_export_cache_file())
+                cls._caches[key] = cache
+            return cache
+
+    @classmethod
+    def clear_all(cls):
+        with cls._caches_lock:
+            cls._caches = {}
+
+    def __init__(self, region, account_id, ttl_seconds, persist_path=None):
+        # type: (str, str, int, str) -> None
+        super(ExportCache, self).__init__()
+        self.region = region
+        self.account_id = account_id
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self.exports = {}
+        self.loaded_at = None
+        self._lock = threading.RLock()
+        if self.persist_path:
+            self._load_from_file()
+
+    def get_exports(self, client):
+        with self._lock:
+            if self._is_stale():
+                self._load_export_values(client)
+            return self.exports
+
+    def get_export_value(self, client, name):
+        return self.get_exports(client).get(name, None)
+
+    def invalidate(self):
+        with self._lock:
+            print_utility.info("Invalidating export cache - {}/{}".format(self.region, self.account_id))
+            self.exports = {}
+            self.loaded_at = None
+            if self.persist_path:
+                self._save_to_file()
+
+    def _is_stale(self):
+        if self.loaded_at is None:
+            return True
+        return time.time() - self.loaded_at > self.ttl_seconds
+
+    def _load_export_values(self, client):
+        exports = {}
+        export_results = client.list_exports()
+        export_list = export_results['Exports']
+        while export_list is not None:
+            for export in export_list:
+                exports[export['Name']] = export['Value']
+            next_ = export_results.get('NextToken', None)
+            if next_:
+                export_results = client.list_exports(NextToken=next_)
+                export_list = export_results.get('Exports', None)
+            else:
+                export_list = None
+        print_utility.info("Loaded {} export values - {}/{}".format(len(exports), self.region, self.account_id))
+        self.exports = exports
+        self.loaded_at = time.time()
+        if self.persist_path:
+            self._save_to_file()
+
+    def _cache_key(self):
+        return "{}/{}".format(self.region, self.account_id)
+
+    def _read_file(self):
+        if not os.path.exists(self.persist_path):
+            return {}
+        try:
+            with open(self.persist_path, 'r') as fp:
+                return json.load(fp)
+        except (IOError, ValueError) as err:
+            print_utility.warn("Ignoring unreadable export cache file {} - {}".format(self.persist_path, err))
+            return {}
+
+    def _load_from_file(self):
+        entry = self._read_file().get(self._cache_key(), None)
+        if entry:
+            self.exports = entry.get('exports', {})
+            self.loaded_at = entry.get('loaded_at', None)
+            print_utility.info("Loaded export cache from file - {}".format(self.persist_path))
+
+    def _save_to_file(self):
+        persisted = self._read_file()
+        if self.loaded_at is None:
+            persisted.pop(self._cache_key(), None)
+        else:
+            persisted[self._cache_key()] = {'loaded_at': self.loaded_at, 'exports': self.exports}
+        directory = os.path.dirname(os.path.abspath(self.persist_path))
+        # write then rename so concurrent readers never see a partial file
+        with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as fp:
+            json.dump(persisted, fp)
+            temp_path = fp.name
+        os.replace(temp_path, self.persist_path)
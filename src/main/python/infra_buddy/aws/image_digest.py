@@ -0,0 +1,158 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+import botocore
+import requests
+
+from infra_buddy.aws import clients
+from infra_buddy.utility import print_utility
+
+_ECR_REGISTRY = re.compile(r'^(\d+)\.dkr\.ecr\.([a-z0-9-]+)\.amazonaws\.com$')
+_DOCKER_HUB_REGISTRY = 'registry-1.docker.io'
+_MANIFEST_TYPES = [
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.docker.distribution.manifest.v2+json',
+    'application/vnd.oci.image.index.v1+json',
+    'application/vnd.oci.image.manifest.v1+json'
+]
+_REQUEST_TIMEOUT_SECONDS = 10
+
+
+def is_digest(reference):
+    # type: (str) -> bool
+    return bool(reference) and reference.startswith('sha256:')
+
+
+def split_image(image):
+    # type: (str) -> tuple
+    """
+    :return: (location, tag, digest) of an image reference, i.e. registry/repo:tag or registry/repo@sha256:...
+    """
+    digest = None
+    if '@' in image:
+        image, digest = image.split('@', 1)
+    tag = None
+    # a ':' before the last '/' is the port of the registry
+    if ':' in image[image.rfind('/') + 1:]:
+        image, tag = image.rsplit(':', 1)
+    return image, tag, digest
+
+
+def split_location(location):
+    # type: (str) -> tuple
+    """
+    :return: (registry, repository) of an image location, images without a registry host are on Docker Hub
+    """
+    location = re.sub(r'^\w+://', '', location)
+    first, _, rest = location.partition('/')
+    if rest and ('.' in first or ':' in first or first == 'localhost'):
+        return first, rest
+    return _DOCKER_HUB_REGISTRY, location if rest else "library/{}".format(location)
+
+
+class ImageDigestResolver(object):
+    """
+    Resolves image tags to the digest of the manifest they point to, using the ECR API for ECR repositories
+    and the registry v2 API otherwise.  Tags can be moved so resolved digests are only cached for ttl_seconds,
+    optionally in a local file shared by subsequent processes.
+    """
+
+    def __init__(self, cache_path=None, ttl_seconds=300):
+        # type: (str, int) -> None
+        super(ImageDigestResolver, self).__init__()
+        self.cache_path = cache_path
+        self.ttl_seconds = ttl_seconds
+        self.digests = {}
+        self._lock = threading.RLock()
+        if self.cache_path:
+            self.digests = self._read_file()
+
+    def resolve_image(self, image):
+        # type: (str) -> str
+        location, tag, digest = split_image(image)
+        if digest:
+            return digest
+        return self.resolve(location, tag or 'latest')
+
+    def resolve(self, location, tag):
+        # type: (str, str) -> str
+        """
+        :return: The digest of the image or None if it could not be resolved
+        """
+        if is_digest(tag):
+            return tag
+        key = "{}:{}".format(location, tag)
+        with self._lock:
+            entry = self.digests.get(key, None)
+            if entry and time.time() - entry['resolved_at'] <= self.ttl_seconds:
+                return entry['digest']
+        try:
+            digest = self._lookup(location, tag)
+        except (botocore.exceptions.BotoCoreError, botocore.exceptions.ClientError,
+                requests.RequestException, KeyError, IndexError) as err:
+            print_utility.warn("Could not resolve digest of {} - {}".format(key, err))
+            return None
+        if not digest:
+            print_utility.warn("Could not resolve digest of {}".format(key))
+            return None
+        print_utility.info("Resolved {} to {}".format(key, digest))
+        with self._lock:
+            self.digests[key] = {'digest': digest, 'resolved_at': time.time()}
+            if self.cache_path:
+                self._save_to_file()
+        return digest
+
+    def _lookup(self, location, tag):
+        registry, repository = split_location(location)
+        ecr = _ECR_REGISTRY.match(registry)
+        if ecr:
+            client = clients.get_client('ecr', ecr.group(2))
+            res = client.describe_images(registryId=ecr.group(1), repositoryName=repository,
+                                         imageIds=[{'imageTag': tag}])
+            return res['imageDetails'][0]['imageDigest']
+        return self._lookup_registry(registry, repository, tag)
+
+    def _lookup_registry(self, registry, repository, tag):
+        url = "https://{}/v2/{}/manifests/{}".format(registry, repository, tag)
+        headers = {'Accept': ', '.join(_MANIFEST_TYPES)}
+        res = requests.head(url, headers=headers, timeout=_REQUEST_TIMEOUT_SECONDS)
+        if res.status_code == 401:
+            # public registries hand out anonymous pull tokens
+            headers['Authorization'] = "Bearer {}".format(self._get_token(res.headers.get('WWW-Authenticate', '')))
+            res = requests.head(url, headers=headers, timeout=_REQUEST_TIMEOUT_SECONDS)
+        res.raise_for_status()
+        return res.headers.get('Docker-Content-Digest', None)
+
+    def _get_token(self, challenge):
+        params = dict(re.findall(r'(\w+)="([^"]*)"', challenge))
+        realm = params.pop('realm', None)
+        if not realm:
+            raise requests.RequestException("Unsupported registry authentication - {}".format(challenge))
+        res = requests.get(realm, params=params, timeout=_REQUEST_TIMEOUT_SECONDS)
+        res.raise_for_status()
+        body = res.json()
+        return body.get('token', body.get('access_token', None))
+
+    def _read_file(self):
+        if not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, 'r') as fp:
+                return json.load(fp)
+        except (IOError, ValueError) as err:
+            print_utility.warn("Ignoring unreadable image digest cache file {} - {}".format(self.cache_path, err))
+            return {}
+
+    def _save_to_file(self):
+        persisted = self._read_file()
+        persisted.update(self.digests)
+        directory = os.path.dirname(os.path.abspath(self.cache_path))
+        # write then rename so concurrent readers never see a partial file
+        with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as fp:
+            json.dump(persisted, fp)
+            temp_path = fp.name
+        os.replace(temp_path, self.cache_path)
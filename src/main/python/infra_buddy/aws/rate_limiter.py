@@ -0,0 +1,209 @@
+import threading
+import time
+from collections import defaultdict
+
+from infra_buddy.utility import print_utility
+
+_THROTTLING_ERROR_CODES = [
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottled',
+    'RequestThrottledException',
+    'TooManyRequestsException',
+    'RequestLimitExceeded',
+    'SlowDown',
+    'PriorityRequestNotAvailable'
+]
+
+# request context key used to find the api of a response
+_CONTEXT_KEY = 'infra_buddy_rate_limiter'
+
+
+def is_throttling_error(parsed_response):
+    # type: (dict) -> bool
+    if not parsed_response:
+        return False
+    return parsed_response.get('Error', {}).get('Code', None) in _THROTTLING_ERROR_CODES
+
+
+class TokenBucket(object):
+    """
+    Allows rate calls per second on average with bursts of up to capacity calls
+    """
+
+    def __init__(self, rate, capacity):
+        # type: (float, float) -> None
+        super(TokenBucket, self).__init__()
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # type: () -> float
+        """
+        :return: The number of seconds spent waiting for a token
+        """
+        waited = 0
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class AIMDLimiter(object):
+    """
+    Bounds the number of calls in flight.  The limit is halved when a call is throttled and grows back
+    by one for every limit successful calls (additive increase, multiplicative decrease).
+    """
+
+    def __init__(self, initial_limit, min_limit=1, max_limit=None, decrease_factor=0.5, cooldown_seconds=1):
+        super(AIMDLimiter, self).__init__()
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit or initial_limit
+        self.decrease_factor = decrease_factor
+        self.cooldown_seconds = cooldown_seconds
+        self.in_flight = 0
+        self.last_decrease = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        # type: () -> float
+        """
+        :return: The number of seconds spent waiting for a slot
+        """
+        start = time.time()
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+        return time.time() - start
+
+    def release(self, throttled):
+        # type: (bool) -> None
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                self.on_throttle()
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self.condition.notify_all()
+
+    def on_throttle(self):
+        with self.condition:
+            now = time.time()
+            # a burst of throttled responses is a single congestion event
+            if now - self.last_decrease >= self.cooldown_seconds:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                self.last_decrease = now
+
+
+class RateLimiter(object):
+    """
+    Process wide limiter for AWS API calls hooked into the botocore event system of every client created
+    by the client factory.  Each api (service, operation) gets its own token bucket and AIMD concurrency
+    limit so a throttled DescribeStackEvents does not slow down ListExports.
+    """
+
+    def __init__(self, rate=20, burst=40, max_concurrency=20):
+        # type: (float, float, int) -> None
+        super(RateLimiter, self).__init__()
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.buckets = {}
+        self.limiters = {}
+        self.counters = defaultdict(lambda: {'calls': 0, 'throttled': 0, 'retried': 0, 'waited_seconds': 0.0})
+        self.lock = threading.Lock()
+
+    def register(self, client):
+        events = client.meta.events
+        events.register('before-call', self._before_call)
+        events.register('response-received', self._response_received)
+        events.register('after-call', self._after_call)
+        events.register('after-call-error', self._after_call_error)
+
+    def _get_limiters(self, api):
+        with self.lock:
+            if api not in self.buckets:
+                self.buckets[api] = TokenBucket(self.rate, self.burst)
+                self.limiters[api] = AIMDLimiter(self.max_concurrency)
+            return self.buckets[api], self.limiters[api]
+
+    def _count(self, api, counter, value=1):
+        with self.lock:
+            self.counters[api][counter] += value
+
+    def _before_call(self, model, context, **kwargs):
+        api = "{}.{}".format(model.service_model.service_name, model.name)
+        bucket, limiter = self._get_limiters(api)
+        waited = limiter.acquire()
+        waited += bucket.acquire()
+        context[_CONTEXT_KEY] = {'api': api, 'attempts': 0, 'throttled': False}
+        self._count(api, 'calls')
+        self._count(api, 'waited_seconds', waited)
+
+    def _response_received(self, parsed_response, context, **kwargs):
+        state = context.get(_CONTEXT_KEY, None)
+        if state is None:
+            return
+        state['attempts'] += 1
+        if state['attempts'] > 1:
+            self._count(state['api'], 'retried')
+        if is_throttling_error(parsed_response):
+            state['throttled'] = True
+            self._count(state['api'], 'throttled')
+            # shrink right away so other threads back off while botocore retries this call
+            self.limiters[state['api']].on_throttle()
+
+    def _after_call(self, context, **kwargs):
+        self._release(context)
+
+    def _after_call_error(self, context, **kwargs):
+        self._release(context)
+
+    def _release(self, context):
+        state = context.pop(_CONTEXT_KEY, None)
+        if state is None:
+            return
+        self.limiters[state['api']].release(state['throttled'])
+
+    def get_counters(self):
+        # type: () -> dict
+        """
+        :return: The calls, throttled, retried and waited_seconds counters and the current concurrency
+        limit keyed by api
+        """
+        with self.lock:
+            ret = {}
+            for api, counters in self.counters.items():
+                ret[api] = dict(counters)
+                ret[api]['concurrency_limit'] = int(self.limiters[api].limit)
+            return ret
+
+    def print_counters(self):
+        counters = self.get_counters()
+        throttled = {api: value for api, value in counters.items()
+                     if value['throttled'] or value['waited_seconds'] >= 1}
+        if throttled:
+            print_utility.banner_warn("AWS API Throttling", "\n".join(
+                "{}: {calls} calls {throttled} throttled {retried} retried {waited_seconds:.1f}s waiting "
+                "(concurrency {concurrency_limit})".format(api, **value) for api, value in sorted(throttled.items())))
+
+
+_rate_limiter = RateLimiter()
+
+
+def get_rate_limiter():
+    # type: () -> RateLimiter
+    return _rate_limiter
@@ -0,0 +1,76 @@
+from collections import defaultdict
+
+from infra_buddy.aws import clients
+from infra_buddy.utility import print_utility
+
+_STACK_NAME_TAG = 'aws:cloudformation:stack-name'
+_LOGICAL_ID_TAG = 'aws:cloudformation:logical-id'
+
+
+def _resource_type_from_arn(arn):
+    # arn:partition:service:region:account-id:resource-type/resource-id (or resource-type:resource-id)
+    parts = arn.split(':', 5)
+    service = parts[2]
+    resource = parts[5] if len(parts) > 5 else ''
+    for separator in ['/', ':']:
+        if separator in resource:
+            return "{}:{}".format(service, resource[:resource.find(separator)])
+    return service
+
+
+class ResourceGroupsTaggingBuddy(object):
+    """
+    Discovers the resources of infra-buddy managed stacks through the Resource Groups Tagging API.
+    Stacks are tagged with Environment/Application/Role when created so the tag filters are pushed to
+    the server and each page returns up to 100 resources, regardless of how many stacks exist.
+    """
+
+    def __init__(self, deploy_ctx):
+        # type: (DeployContext) -> None
+        super(ResourceGroupsTaggingBuddy, self).__init__()
+        self.deploy_ctx = deploy_ctx
+        self.client = clients.get_client('resourcegroupstaggingapi', self.deploy_ctx.region)
+
+    def _get_tag_filters(self):
+        tag_filters = [{'Key': 'Environment', 'Values': [self.deploy_ctx.environment]}]
+        if self.deploy_ctx.application:
+            tag_filters.append({'Key': 'Application', 'Values': [self.deploy_ctx.application]})
+        if self.deploy_ctx.role:
+            tag_filters.append({'Key': 'Role', 'Values': [self.deploy_ctx.role]})
+        return tag_filters
+
+    def iter_tagged_resources(self, type_filter=None):
+        """
+        :param type_filter: A Resource Groups Tagging API resource type (service[:resourceType]) e.g. 'sqs'
+        """
+        args = {'TagFilters': self._get_tag_filters(), 'ResourcesPerPage': 100}
+        if type_filter:
+            args['ResourceTypeFilters'] = [type_filter]
+        while True:
+            res = self.client.get_resources(**args)
+            for mapping in res['ResourceTagMappingList']:
+                yield mapping
+            next_ = res.get('PaginationToken', None)
+            if not next_:
+                return
+            args['PaginationToken'] = next_
+
+    def load_resources_by_stack(self, stack_prefix=None, type_filter=None):
+        # type: (str, str) -> list
+        """
+        :return: (stack_name, resources) tuples with resources in the format of list_stack_resources
+        """
+        resources = defaultdict(list)
+        for mapping in self.iter_tagged_resources(type_filter=type_filter):
+            tags = {tag['Key']: tag['Value'] for tag in mapping.get('Tags', [])}
+            stack_name = tags.get(_STACK_NAME_TAG, None)
+            if not stack_name:
+                print_utility.info("Skipping resource not managed by CloudFormation - {}".format(
+                    mapping['ResourceARN']))
+                continue
+            if stack_prefix and not stack_name.startswith(stack_prefix):
+                continue
+            resources[stack_name].append({'LogicalResourceId': tags.get(_LOGICAL_ID_TAG, mapping['ResourceARN']),
+                                          'PhysicalResourceId': mapping['ResourceARN'],
+                                          'ResourceType': _resource_type_from_arn(mapping['ResourceARN'])})
+        return sorted(resources.items())
@@ -0,0 +1,147 @@
+import os
+import sqlite3
+import time
+
+from infra_buddy.utility import print_utility
+
+# bumped whenever the tables change, the index is only a cache so older indexes are rebuilt
+_SCHEMA_VERSION = 3
+_TABLES = ['stacks', 'resources', 'sync', 'accounts']
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS stacks (account_id TEXT, region TEXT, stack_name TEXT, stack_id TEXT, "
+    "last_updated TEXT, PRIMARY KEY (account_id, region, stack_name))",
+    "CREATE TABLE IF NOT EXISTS resources (account_id TEXT, region TEXT, stack_name TEXT, logical_id TEXT, "
+    "physical_id TEXT, resource_type TEXT)",
+    "CREATE INDEX IF NOT EXISTS resources_stack ON resources (account_id, region, stack_name)",
+    "CREATE INDEX IF NOT EXISTS resources_type ON resources (resource_type)",
+    "CREATE INDEX IF NOT EXISTS resources_logical_id ON resources (logical_id)",
+    "CREATE INDEX IF NOT EXISTS resources_physical_id ON resources (physical_id)",
+    "CREATE TABLE IF NOT EXISTS sync (account_id TEXT, region TEXT, synced_at REAL, "
+    "PRIMARY KEY (account_id, region))",
+    "CREATE TABLE IF NOT EXISTS accounts (access_key TEXT PRIMARY KEY, account_id TEXT)"
+]
+
+
+def _last_updated(summary):
+    return str(summary.get('LastUpdatedTime', summary.get('CreationTime', '')))
+
+
+class ResourceIndex(object):
+    """
+    Local SQLite index of stacks and their resources used by introspect, keyed by account and region so
+    one index file can be shared between accounts.  Syncing only reloads the resources of stacks whose
+    LastUpdatedTime changed and is skipped entirely while the index is younger than max_age_seconds.
+    The account of each access key is remembered in the index so a fresh index makes no AWS calls.
+    """
+
+    def __init__(self, path, region, account_id_resolver, access_key=None):
+        # type: (str, str, callable, str) -> None
+        """
+        :param account_id_resolver: Looks up the account id, only called when it is not known for the access key
+        :param access_key: The access key id of the credentials in use
+        """
+        super(ResourceIndex, self).__init__()
+        self.path = os.path.abspath(path)
+        self.region = region
+        self.account_id_resolver = account_id_resolver
+        self.access_key = access_key
+        self._account_id = None
+        self.connection = sqlite3.connect(self.path)
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+            for table in _TABLES:
+                self.connection.execute("DROP TABLE IF EXISTS {}".format(table))
+            self.connection.execute("PRAGMA user_version = {}".format(_SCHEMA_VERSION))
+        for statement in _SCHEMA:
+            self.connection.execute(statement)
+        self.connection.commit()
+
+    @property
+    def account_id(self):
+        if self._account_id is None:
+            row = self.connection.execute("SELECT account_id FROM accounts WHERE access_key = ?",
+                                          (self.access_key,)).fetchone() if self.access_key else None
+            if row is not None:
+                self._account_id = row[0]
+            else:
+                self._account_id = self.account_id_resolver()
+                if self.access_key:
+                    self.connection.execute("INSERT OR REPLACE INTO accounts VALUES (?, ?)",
+                                            (self.access_key, self._account_id))
+                    self.connection.commit()
+        return self._account_id
+
+    def close(self):
+        self.connection.close()
+
+    def is_fresh(self, max_age_seconds):
+        row = self.connection.execute("SELECT synced_at FROM sync WHERE account_id = ? AND region = ?",
+                                      (self.account_id, self.region)).fetchone()
+        return row is not None and time.time() - row[0] <= max_age_seconds
+
+    def sync(self, cf_buddy, max_age_seconds=300, parallelism=10):
+        # type: (CloudFormationBuddy, int, int) -> None
+        if self.is_fresh(max_age_seconds):
+            print_utility.info("Resource index is fresh - skipping sync {}".format(self.path))
+            return
+        known = dict(self.connection.execute("SELECT stack_name, last_updated FROM stacks "
+                                             "WHERE account_id = ? AND region = ?",
+                                             (self.account_id, self.region)).fetchall())
+        summaries = {summary['StackName']: summary for summary in cf_buddy.list_stack_summaries()}
+        removed = [stack for stack in known if stack not in summaries]
+        changed = [stack for stack, summary in summaries.items() if known.get(stack, None) != _last_updated(summary)]
+        print_utility.info("Syncing resource index - {} changed {} removed {} unchanged".format(
+            len(changed), len(removed), len(summaries) - len(changed)))
+        for stack in removed:
+            self._delete_stack(stack)
+        for stack, resources in cf_buddy.iter_resources_for_stack_list(changed, max_workers=parallelism):
+            self._delete_stack(stack)
+            summary = summaries[stack]
+            self.connection.execute("INSERT INTO stacks VALUES (?, ?, ?, ?, ?)",
+                                    (self.account_id, self.region, stack, summary['StackId'],
+                                     _last_updated(summary)))
+            self.connection.executemany("INSERT INTO resources VALUES (?, ?, ?, ?, ?, ?)",
+                                        [(self.account_id,
+                                          self.region,
+                                          stack,
+                                          resource['LogicalResourceId'],
+                                          resource.get('PhysicalResourceId', None),
+                                          resource['ResourceType']) for resource in resources])
+        self.connection.execute("INSERT OR REPLACE INTO sync VALUES (?, ?, ?)",
+                                (self.account_id, self.region, time.time()))
+        self.connection.commit()
+
+    def _delete_stack(self, stack):
+        key = (self.account_id, self.region, stack)
+        self.connection.execute("DELETE FROM stacks WHERE account_id = ? AND region = ? AND stack_name = ?", key)
+        self.connection.execute("DELETE FROM resources WHERE account_id = ? AND region = ? AND stack_name = ?", key)
+
+    def query(self, stack_prefix=None, type_filter=None, logical_id=None, physical_id=None):
+        # type: (str, str, str, str) -> list
+        """
+        :return: Matching resources as (stack_name, resources) tuples in the format of list_stack_resources
+        """
+        clauses = ["account_id = ?", "region = ?"]
+        params = [self.account_id, self.region]
+        if stack_prefix:
+            clauses.append("substr(stack_name, 1, ?) = ?")
+            params.extend([len(stack_prefix), stack_prefix])
+        if type_filter:
+            clauses.append("instr(resource_type, ?) > 0")
+            params.append(type_filter)
+        if logical_id:
+            clauses.append("logical_id = ?")
+            params.append(logical_id)
+        if physical_id:
+            clauses.append("physical_id = ?")
+            params.append(physical_id)
+        rows = self.connection.execute("SELECT stack_name, logical_id, physical_id, resource_type FROM resources "
+                                       "WHERE {} ORDER BY stack_name".format(" AND ".join(clauses)),
+                                       params).fetchall()
+        ret = []
+        for stack_name, logical, physical, resource_type in rows:
+            if not ret or ret[-1][0] != stack_name:
+                ret.append((stack_name, []))
+            ret[-1][1].append({'LogicalResourceId': logical,
+                               'PhysicalResourceId': physical,
+                               'ResourceType': resource_type})
+        return ret
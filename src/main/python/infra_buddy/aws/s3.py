@@ -1,6 +1,9 @@
+import hashlib
+import json
 import mimetypes
 import os
 import tempfile
+import threading
 from zipfile import ZipFile
 
 try:
@@ -9,18 +12,35 @@ except ImportError:
     from urlparse import urlparse
 
 
-import boto3
 import botocore
 from boto3.s3.transfer import S3Transfer
 
+from infra_buddy.aws import clients
 from infra_buddy.utility import print_utility
 
+_CONTENT_ADDRESSED_ROOT = "sha256"
+# smaller files are staged with a single upload, a content addressed upload and server side copy costs more
+# requests than it saves
+_STAGE_COPY_THRESHOLD = 1024 * 1024
+_FINGERPRINT_ROOT = "fingerprints"
+
+
+def _file_digest(file):
+    sha = hashlib.sha256()
+    with open(file, 'rb') as source:
+        for chunk in iter(lambda: source.read(65536), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
 
 class S3Buddy(object):
     def __init__(self, deploy_ctx, root_path, bucket_name):
         super(S3Buddy, self).__init__()
         self.deploy_ctx = deploy_ctx
-        self.s3 = boto3.resource('s3', region_name=self.deploy_ctx.region)
+        # keys known to exist, only kept for the life of this buddy as lifecycle rules may delete them
+        self._known_keys = set()
+        self._known_keys_lock = threading.Lock()
+        self.s3 = clients.get_resource('s3', self.deploy_ctx.region)
         self.bucket = self.s3.Bucket(bucket_name)
         try:
             print_utility.info("S3Buddy using bucket_name={}, root_path={}".format(bucket_name, root_path))
@@ -33,8 +53,6 @@ class S3Buddy(object):
             if 'BucketAlreadyOwnedByYou' not in str(err):
                 print_utility.info("Error during bucket create - {}".format(str(err)))
         self.bucket_name = bucket_name
-        self.deploy_ctx = deploy_ctx
-        self.s3 = boto3.resource('s3', region_name=self.deploy_ctx.region)
         self.key_root_path = root_path
         self.url_base = self._get_url_base()
 
@@ -52,6 +70,45 @@ class S3Buddy(object):
 
     def upload(self, file, key_name=None):
         key_name = self._get_upload_bucket_key_name(file, key_name)
+        self._put_object(file, key_name)
+        return "{}/{}".format(self.url_base, key_name)
+
+    def upload_content_addressed(self, file, key_name=None):
+        """
+        Uploads the file under a key derived from the SHA-256 of its contents, skipping the upload when
+        those bytes are already in the bucket.
+        :return: The url of the content addressed object
+        """
+        key_name = self._get_content_addressed_key_name(file, key_name)
+        if self._key_exists(key_name):
+            print_utility.info("Skipping upload of unchanged file - Bucket: {} Key: {}".format(self.bucket_name,
+                                                                                              key_name))
+        else:
+            self._put_object(file, key_name)
+            self._remember_key(key_name)
+        return "{}/{}".format(self.url_base, key_name)
+
+    def stage(self, file, key_name=None):
+        """
+        Makes the file available under the root path like upload.  Files of at least _STAGE_COPY_THRESHOLD
+        bytes are only sent when they are not already stored under their content addressed key, the root
+        path copy is made server side.
+        :return: The url of the object under the root path
+        """
+        if os.path.getsize(file) < _STAGE_COPY_THRESHOLD:
+            return self.upload(file, key_name)
+        content_key = self._get_content_addressed_key_name(file, key_name)
+        self.upload_content_addressed(file, key_name)
+        key_name = self._get_upload_bucket_key_name(file, key_name)
+        self.s3.meta.client.copy_object(Bucket=self.bucket_name,
+                                        Key=key_name,
+                                        CopySource={'Bucket': self.bucket_name, 'Key': content_key})
+        print_utility.info("Copied file in S3 - Bucket: {} Key: {} Source: {}".format(self.bucket_name,
+                                                                                     key_name,
+                                                                                     content_key))
+        return "{}/{}".format(self.url_base, key_name)
+
+    def _put_object(self, file, key_name):
         args = {"Key":key_name, "Body":open(file, 'rb')}
         content_type = self._guess_content_type(file)
         if content_type:
@@ -60,7 +117,28 @@ class S3Buddy(object):
         print_utility.info("Uploaded file to S3 - Bucket: {} Key: {} Content-Type: {}".format(self.bucket_name,
                                                                                               key_name,
                                                                                               content_type))
-        return "{}/{}".format(self.url_base, key_name)
+
+    def _get_content_addressed_key_name(self, file, key_name=None):
+        return "{root}/{digest}/{key_name}".format(root=_CONTENT_ADDRESSED_ROOT,
+                                                   digest=_file_digest(file),
+                                                   key_name=key_name if key_name else os.path.basename(file))
+
+    def _key_exists(self, key_name):
+        with self._known_keys_lock:
+            if key_name in self._known_keys:
+                return True
+        try:
+            self.s3.meta.client.head_object(Bucket=self.bucket_name, Key=key_name)
+        except botocore.exceptions.ClientError as err:
+            if err.response.get('Error', {}).get('Code', None) in ['404', 'NoSuchKey', 'NotFound']:
+                return False
+            raise
+        self._remember_key(key_name)
+        return True
+
+    def _remember_key(self, key_name):
+        with self._known_keys_lock:
+            self._known_keys.add(key_name)
 
     def _get_upload_bucket_key_name(self, file, key_name=None):
         key_name = (key_name if key_name else os.path.basename(file))
@@ -100,6 +178,53 @@ class S3Buddy(object):
 
 
 
+class StackFingerprintStore(object):
+    """
+    Records the fingerprint of the last deploy of each stack in the deploy resources bucket.  It is kept
+    outside of the stack so it is also recorded when a ChangeSet has no changes or is skipped, and it is
+    stored with the version of the stack it describes so any other update of the stack invalidates it.
+    """
+
+    def __init__(self, deploy_ctx):
+        super(StackFingerprintStore, self).__init__()
+        self.region = deploy_ctx.region
+        self.bucket_name = deploy_ctx.cf_bucket_name
+        self.client = clients.get_client('s3', self.region)
+
+    def _get_key_name(self, stack_name):
+        return "{root}/{region}/{stack_name}.json".format(root=_FINGERPRINT_ROOT,
+                                                           region=self.region,
+                                                           stack_name=stack_name)
+
+    def get(self, stack_name, stack_version):
+        # type: (str, str) -> str
+        """
+        :return: The recorded fingerprint or None if there is none for this version of the stack
+        """
+        try:
+            obj = self.client.get_object(Bucket=self.bucket_name, Key=self._get_key_name(stack_name))
+        except botocore.exceptions.ClientError as err:
+            print_utility.info("No fingerprint recorded for stack {} - {}".format(stack_name, err))
+            return None
+        record = json.loads(obj['Body'].read().decode('utf-8'))
+        if record.get('stack_version', None) != stack_version:
+            print_utility.info("Stack {} was updated since its fingerprint was recorded".format(stack_name))
+            return None
+        return record.get('fingerprint', None)
+
+    def put(self, stack_name, stack_version, fingerprint):
+        # type: (str, str, str) -> None
+        record = {'stack_version': stack_version, 'fingerprint': fingerprint}
+        try:
+            self.client.put_object(Bucket=self.bucket_name,
+                                   Key=self._get_key_name(stack_name),
+                                   Body=json.dumps(record).encode('utf-8'),
+                                   ContentType='application/json')
+        except botocore.exceptions.ClientError as err:
+            # only costs a redundant ChangeSet on the next deploy
+            print_utility.warn("Could not record fingerprint for stack {} - {}".format(stack_name, err))
+
+
 class CloudFormationDeployS3Buddy(S3Buddy):
     def __init__(self, deploy_ctx, ):
         super(CloudFormationDeployS3Buddy, self).__init__(deploy_ctx=deploy_ctx,
@@ -112,7 +237,7 @@ def download_zip_from_s3_url(s3_url, destination):
     parsed = urlparse(s3_url)
     bucket = parsed.hostname
     key = parsed.path[1:]  # strip leading /
-    s3 = boto3.resource('s3')
+    s3 = clients.get_resource('s3')
     with tempfile.NamedTemporaryFile() as temporary_file:
         temp_file_path = temporary_file.name
     print_utility.info("Downloading zip from s3: {} - {}:{}".format(s3_url, key, temp_file_path))
@@ -0,0 +1,213 @@
+import time
+
+from botocore.exceptions import ClientError
+
+from infra_buddy.utility import print_utility
+from infra_buddy.utility.waitfor import backoff_intervals
+
+_TERMINAL_STACK_STATUSES = [
+    'CREATE_COMPLETE',
+    'CREATE_FAILED',
+    'ROLLBACK_COMPLETE',
+    'ROLLBACK_FAILED',
+    'UPDATE_COMPLETE',
+    'UPDATE_ROLLBACK_COMPLETE',
+    'UPDATE_ROLLBACK_FAILED',
+    'DELETE_COMPLETE',
+    'DELETE_FAILED'
+]
+
+_OPERATION_START_STATUSES = [
+    'CREATE_IN_PROGRESS',
+    'UPDATE_IN_PROGRESS',
+    'DELETE_IN_PROGRESS',
+    'IMPORT_IN_PROGRESS'
+]
+
+# resource failures during an update that doom it to roll back
+_UPDATE_FAILURE_STATUSES = ['UPDATE_FAILED', 'CREATE_FAILED']
+
+_TERMINAL_CHANGE_SET_STATUSES = ['CREATE_COMPLETE', 'FAILED', 'DELETE_COMPLETE', 'DELETE_FAILED']
+
+
+def format_stack_event(ev):
+    if "ResourceStatusReason" in ev:
+        template = "{Timestamp}\t{ResourceStatus}\t{ResourceType}\t{LogicalResourceId}\t{ResourceStatusReason}"
+    else:
+        template = "{Timestamp}\t{ResourceStatus}\t{ResourceType}\t{LogicalResourceId}"
+    return template.format(**ev)
+
+
+def is_stack_event(ev):
+    return ev['LogicalResourceId'] == ev['StackName'] and ev['ResourceType'] == 'AWS::CloudFormation::Stack'
+
+
+def iter_stack_events(client, stack_name, client_request_token=None, since=None):
+    """
+    Lazily yields the events of the current stack operation, newest first.  Paging stops as soon as
+    the start of the operation is passed so the rest of the stack history is never requested.
+    :param client_request_token: Identifies the operation by the token it was started with, or a list of
+                                 tokens when the operation was followed by a cancel
+    :param since: Identifies the operation by the time it was started
+    If neither is provided the operation is bounded by the most recent stack level start event.
+    """
+    tokens = [client_request_token] if isinstance(client_request_token, str) else client_request_token
+    res = client.describe_stack_events(StackName=stack_name)
+    while True:
+        for ev in res['StackEvents']:
+            if tokens is not None and ev.get('ClientRequestToken', None) not in tokens:
+                return
+            if since is not None and ev['Timestamp'] < since:
+                return
+            yield ev
+            if client_request_token is None and since is None and is_stack_event(ev) \
+                    and ev['ResourceStatus'] in _OPERATION_START_STATUSES:
+                return
+        next_ = res.get('NextToken', None)
+        if not next_:
+            return
+        res = client.describe_stack_events(StackName=stack_name, NextToken=next_)
+
+
+def failed_resource_events(events):
+    # type: (list) -> list
+    return [ev for ev in events if ev['ResourceStatus'].endswith('_FAILED') and not is_stack_event(ev)]
+
+
+def is_cancelled_event(ev):
+    # resources still in flight when an update is cancelled fail with this reason
+    return 'cancelled' in ev.get('ResourceStatusReason', '').lower()
+
+
+def find_root_cause_event(events):
+    # type: (list) -> dict
+    """
+    :param events: The events of an operation in chronological order
+    :return: The first resource failure that was not caused by the operation being cancelled
+    """
+    for ev in failed_resource_events(events):
+        if not is_cancelled_event(ev):
+            return ev
+    return None
+
+
+class StackEventWaiter(object):
+    """
+    Waits for a stack operation by tailing describe_stack_events instead of polling describe_stacks.
+    Only events tagged with the ClientRequestToken of the operation are considered, so paging stops as
+    soon as the events of a previous operation are reached.
+    With cancel_on_failure an update is cancelled as soon as the first resource fails, rather than waiting
+    for the resources still in progress to finish before CloudFormation rolls back.
+    """
+
+    def __init__(self, client, stack_name, client_request_token, initial_interval_seconds=2,
+                 max_interval_seconds=15, timeout_seconds=3600, cancel_on_failure=False):
+        super(StackEventWaiter, self).__init__()
+        self.client = client
+        self.stack_name = stack_name
+        self.client_request_tokens = [client_request_token]
+        self.cancel_on_failure = cancel_on_failure
+        self.cancel_token = None
+        self.initial_interval_seconds = initial_interval_seconds
+        self.max_interval_seconds = max_interval_seconds
+        self.timeout_seconds = timeout_seconds
+        self.seen_event_ids = set()
+        self.events = []
+        self.final_status = None
+
+    def wait(self, success_statuses):
+        # type: (list) -> bool
+        deadline = time.time() + self.timeout_seconds
+        intervals = self._intervals()
+        while True:
+            new_events = self._fetch_new_events()
+            for ev in new_events:
+                print_utility.progress(format_stack_event(ev))
+                if self.cancel_on_failure and self.cancel_token is None and self._is_update_failure(ev):
+                    self._cancel_update(ev)
+                if self._is_terminal_stack_event(ev):
+                    self.final_status = ev['ResourceStatus']
+                    return self.final_status in success_statuses
+            if time.time() > deadline:
+                print_utility.error("Timed out waiting for stack operation to complete - {}".format(self.stack_name))
+                return False
+            if new_events:
+                # activity on the stack so look again soon
+                intervals = self._intervals()
+            time.sleep(next(intervals))
+
+    @property
+    def root_cause_event(self):
+        return find_root_cause_event(self.events)
+
+    def _is_update_failure(self, ev):
+        return not is_stack_event(ev) and ev['ResourceStatus'] in _UPDATE_FAILURE_STATUSES
+
+    def _cancel_update(self, ev):
+        print_utility.banner_warn("Cancelling update of {}".format(self.stack_name), format_stack_event(ev))
+        self.cancel_token = "{}-cancel".format(self.client_request_tokens[0])
+        try:
+            self.client.cancel_update_stack(StackName=self.stack_name, ClientRequestToken=self.cancel_token)
+        except ClientError as err:
+            # i.e. the stack is already rolling back, keep waiting for it to finish
+            print_utility.warn("Could not cancel update of {} - {}".format(self.stack_name, err))
+            return
+        # the rollback started by the cancel is tagged with the token of the cancel
+        self.client_request_tokens.append(self.cancel_token)
+
+    def _intervals(self):
+        return backoff_intervals(self.initial_interval_seconds, self.max_interval_seconds)
+
+    def _fetch_new_events(self):
+        new_events = []
+        for ev in iter_stack_events(self.client, self.stack_name, client_request_token=self.client_request_tokens):
+            # once we reach an event we have already processed everything after it is old news
+            if ev['EventId'] in self.seen_event_ids:
+                break
+            new_events.append(ev)
+        new_events.reverse()
+        for ev in new_events:
+            self.seen_event_ids.add(ev['EventId'])
+        self.events.extend(new_events)
+        return new_events
+
+    def _is_terminal_stack_event(self, ev):
+        return is_stack_event(ev) and ev['ResourceStatus'] in _TERMINAL_STACK_STATUSES
+
+
+class ChangeSetWaiter(object):
+    """
+    Polls change set creation with short adaptive intervals.  Change sets are usually ready (or have
+    failed because there is nothing to change) within a few seconds, far quicker than the 30s delay
+    of the boto change_set_create_complete waiter.
+    """
+
+    def __init__(self, client, initial_interval_seconds=0.5, max_interval_seconds=5, timeout_seconds=600):
+        super(ChangeSetWaiter, self).__init__()
+        self.client = client
+        self.initial_interval_seconds = initial_interval_seconds
+        self.max_interval_seconds = max_interval_seconds
+        self.timeout_seconds = timeout_seconds
+
+    def wait(self, change_set_ids):
+        # type: (list) -> dict
+        """
+        :param change_set_ids: The change sets to wait for
+        :return: The latest describe_change_set response for each change set keyed by id
+        """
+        deadline = time.time() + self.timeout_seconds
+        intervals = backoff_intervals(self.initial_interval_seconds, self.max_interval_seconds)
+        descriptions = {}
+        pending = list(change_set_ids)
+        while True:
+            for change_set_id in list(pending):
+                description = self.client.describe_change_set(ChangeSetName=change_set_id)
+                descriptions[change_set_id] = description
+                if description['Status'] in _TERMINAL_CHANGE_SET_STATUSES:
+                    pending.remove(change_set_id)
+            if not pending:
+                return descriptions
+            if time.time() > deadline:
+                print_utility.error("Timed out waiting for change set creation - {}".format(pending))
+                return descriptions
+            time.sleep(next(intervals))
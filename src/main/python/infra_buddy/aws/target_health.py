@@ -0,0 +1,99 @@
+from infra_buddy.utility import print_utility
+
+# states of targets that are still registered with (or leaving) the target group
+_REGISTERED_STATES = ['initial', 'healthy', 'unhealthy', 'draining', 'unavailable']
+
+
+class TargetHealthGate(object):
+    """
+    Decides if a new ECS deployment is ready from the load balancer's point of view, once every task of the
+    deployment is a healthy target of each of the service's target groups and the targets of the previous
+    tasks have drained.  This is usually well before ECS considers the deployment complete.
+    """
+
+    def __init__(self, ecs_client, elb_client, cluster, service_description):
+        # type: (object, object, str, dict) -> None
+        super(TargetHealthGate, self).__init__()
+        self.ecs_client = ecs_client
+        self.elb_client = elb_client
+        self.cluster = cluster
+        self.target_groups = [lb['targetGroupArn'] for lb in service_description.get('loadBalancers', [])
+                              if 'targetGroupArn' in lb]
+        self.instance_ids = {}
+        self.last_status = None
+
+    def is_ready(self, deployment):
+        # type: (dict) -> bool
+        if not self.target_groups:
+            return False
+        targets = self._load_deployment_targets(deployment)
+        if len(targets) < deployment['desiredCount']:
+            return False
+        for target_group in self.target_groups:
+            descriptions = self.elb_client.describe_target_health(
+                TargetGroupArn=target_group)['TargetHealthDescriptions']
+            healthy = set()
+            remaining = 0
+            for description in descriptions:
+                state = description['TargetHealth']['State']
+                task = self._find_task(targets, description['Target'])
+                if task is None:
+                    if state in _REGISTERED_STATES:
+                        remaining += 1
+                elif state == 'healthy':
+                    healthy.add(task)
+            status = "{}: {}/{} new targets healthy, {} old targets draining".format(
+                target_group, len(healthy), len(targets), remaining)
+            if status != self.last_status:
+                print_utility.progress(status)
+                self.last_status = status
+            if len(healthy) < len(targets) or remaining:
+                return False
+        return True
+
+    def _find_task(self, targets, target):
+        for task_arn, (target_id, port) in targets.items():
+            if target['Id'] == target_id and (port is None or target.get('Port', None) == port):
+                return task_arn
+        return None
+
+    def _load_deployment_targets(self, deployment):
+        # type: (dict) -> dict
+        """
+        :return: The (target id, port) of every running task of the deployment keyed by task arn, the id is
+        the ip of the task for awsvpc networking and otherwise the instance and host port it runs on
+        """
+        # tasks started by a service are tagged with the id of their deployment
+        task_arns = self.ecs_client.list_tasks(cluster=self.cluster, startedBy=deployment['id'],
+                                               desiredStatus='RUNNING')['taskArns']
+        if not task_arns:
+            return {}
+        tasks = self.ecs_client.describe_tasks(cluster=self.cluster, tasks=task_arns[:100])['tasks']
+        targets = {}
+        for task in tasks:
+            if task.get('lastStatus', None) != 'RUNNING':
+                continue
+            ip = self._get_task_ip(task)
+            if ip:
+                targets[task['taskArn']] = (ip, None)
+                continue
+            bindings = [binding for container in task.get('containers', [])
+                        for binding in container.get('networkBindings', [])]
+            if bindings and 'containerInstanceArn' in task:
+                targets[task['taskArn']] = (self._get_instance_id(task['containerInstanceArn']),
+                                            bindings[0]['hostPort'])
+        return targets
+
+    def _get_task_ip(self, task):
+        for attachment in task.get('attachments', []):
+            for detail in attachment.get('details', []):
+                if detail['name'] == 'privateIPv4Address':
+                    return detail['value']
+        return None
+
+    def _get_instance_id(self, container_instance_arn):
+        if container_instance_arn not in self.instance_ids:
+            res = self.ecs_client.describe_container_instances(cluster=self.cluster,
+                                                               containerInstances=[container_instance_arn])
+            self.instance_ids[container_instance_arn] = res['containerInstances'][0]['ec2InstanceId']
+        return self.instance_ids[container_instance_arn]
@@ -61,3 +61,7 @@ from infra_buddy.commands.generate_service_definition import command
 from infra_buddy.commands.bootstrap import command
 # noinspection PyUnresolvedReferences
 from infra_buddy.commands.introspect import command
+# noinspection PyUnresolvedReferences
+from infra_buddy.commands.deploy_fleet import command
+# noinspection PyUnresolvedReferences
+from infra_buddy.commands.detect_drift import command
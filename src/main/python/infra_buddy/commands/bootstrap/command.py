@@ -1,10 +1,10 @@
 import json
 import os
 
-import boto3
 import click
 from click import UsageError
 
+from infra_buddy.aws import clients
 from infra_buddy.commandline import cli
 from infra_buddy.context.deploy_ctx import DeployContext
 from infra_buddy.deploy.cloudformation_deploy import CloudFormationDeploy
@@ -22,7 +22,7 @@ def deploy_cloudformation(deploy_ctx, environments):
 
 def do_command(deploy_ctx, environments, destination=None):
     # type: (DeployContext,list) -> None
-    client = boto3.client('ec2', region_name=deploy_ctx.region)
+    client = clients.get_client('ec2', deploy_ctx.region)
     if len(environments) == 0:
         raise UsageError("Expected at least one environment (ci, prod)")
     for env in environments:
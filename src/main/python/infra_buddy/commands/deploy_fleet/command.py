@@ -0,0 +1,86 @@
+import datetime
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+from infra_buddy.commandline import cli
+from infra_buddy.commands.deploy_service import command as deploy_service
+from infra_buddy.context.deploy_ctx import DeployContext
+from infra_buddy.utility import print_utility
+
+_MANIFEST_ARTIFACT_DIRECTORY = 'artifact-directory'
+
+current_milli_time = lambda: int(round(time.time() * 1000))
+
+
+@cli.command(name='deploy-fleet', short_help="Deploy many services, each defined by an artifact directory, "
+                                             "in a single process.")
+@click.argument('artifact-directories', nargs=-1)
+@click.option("--manifest", type=click.File('r'),
+              help="A JSONL file with an object per service, i.e. {\"artifact-directory\": \"s3://bucket/service.zip\"}")
+@click.option("--dry-run", is_flag=True, help="Prints the execution plan and displays the evaluated "
+                                              "parameter values for each deployment.")
+@click.option("--force", is_flag=True, help="Deploy every stack even if its fingerprint shows it is unchanged.")
+@click.option("--parallelism", type=int, default=4, help="The number of services to deploy concurrently.")
+@click.option("--report", type=click.File('w'), help="Write the results of every deployment as JSON to this file.")
+@click.pass_obj
+def deploy_fleet(deploy_ctx, artifact_directories, manifest, dry_run, force, parallelism, report):
+    # type: (DeployContext,list,object,bool,bool,int,object) -> None
+    artifact_directories = list(artifact_directories)
+    if manifest:
+        artifact_directories.extend(load_manifest(manifest))
+    if not artifact_directories:
+        raise click.UsageError("Expected at least one artifact directory or a --manifest")
+    results = do_command(deploy_ctx, artifact_directories, dry_run=dry_run, force=force, parallelism=parallelism)
+    if report:
+        json.dump(results, report, indent=2)
+    failed = [result['artifact-directory'] for result in results if result['status'] != 'SUCCESS']
+    if failed:
+        print_utility.error("Deployment failed for - {}".format(", ".join(failed)), raise_exception=True)
+
+
+def load_manifest(manifest):
+    # type: (object) -> list
+    ret = []
+    for line in manifest:
+        if line.strip():
+            ret.append(json.loads(line)[_MANIFEST_ARTIFACT_DIRECTORY])
+    return ret
+
+
+def do_command(deploy_ctx, artifact_directories, dry_run=False, force=False, parallelism=4):
+    # type: (DeployContext,list,bool,bool,int) -> list
+    """
+    Deploys each artifact directory with its own context.  The contexts share the template manager, so
+    templates are downloaded once, and the process wide AWS clients and export cache.
+    :return: A result per artifact directory in the order they were provided
+    """
+    def deploy_service_artifact(artifact_directory):
+        start = current_milli_time()
+        result = {'artifact-directory': artifact_directory}
+        try:
+            service_ctx = DeployContext.create_deploy_context_artifact(artifact_directory=artifact_directory,
+                                                                       environment=deploy_ctx['ENVIRONMENT'],
+                                                                       defaults=deploy_ctx.configuration_defaults,
+                                                                       template_manager=deploy_ctx.template_manager)
+            result['stack'] = service_ctx.stack_name
+            deploy_service.do_command(service_ctx, dry_run, force=force)
+            result['status'] = 'SUCCESS'
+        except Exception as e:
+            print_utility.warn("Deployment failed for {} - {}".format(artifact_directory, e))
+            result['status'] = 'FAILED'
+            result['error'] = str(e)
+        result['duration'] = print_utility.print_time_delta(
+            datetime.timedelta(milliseconds=(current_milli_time() - start)))
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, min(parallelism, len(artifact_directories)))) as executor:
+        results = list(executor.map(deploy_service_artifact, artifact_directories))
+    print_utility.banner_warn("Fleet Results", "\n".join(
+        "{}: {}{} in {}".format(result.get('stack', result['artifact-directory']),
+                                result['status'],
+                                " - {}".format(result['error']) if 'error' in result else "",
+                                result['duration']) for result in results))
+    return results
@@ -3,10 +3,22 @@ import time
 
 import datetime
 
+from concurrent.futures import ThreadPoolExecutor
+
+from infra_buddy.aws.change_set import classify_change, iter_change_set_changes
+from infra_buddy.aws.cloudformation import CloudFormationBuddy
+from infra_buddy.aws.rate_limiter import get_rate_limiter
+from infra_buddy.aws.stack_waiter import ChangeSetWaiter
 from infra_buddy.commandline import cli
-from infra_buddy.context.deploy_ctx import DeployContext
+from infra_buddy.context.deploy_ctx import DeployContext, FORCE_DEPLOY, CANCEL_ON_FAILURE, ECS_READINESS_GATE
+from infra_buddy.deploy.cloudformation_deploy import CloudFormationDeploy
+from infra_buddy.deploy.execution_graph import ExecutionGraph
 from infra_buddy.utility import print_utility
 
+# bounds the concurrent create_change_set calls when preparing
+_PREPARE_WORKERS = 10
+_PENDING_CHANGE_SET_STATUSES = ['CREATE_PENDING', 'CREATE_IN_PROGRESS']
+
 current_milli_time = lambda: int(round(time.time() * 1000))
 
 
@@ -14,17 +26,131 @@ current_milli_time = lambda: int(round(time.time() * 1000))
                                                "and an optional artifact definition.  Operation is idempotent.")
 @click.option("--dry-run", is_flag=True, help="Prints the execution plan and displays the evaluated "
                                               "parameter values for the deployment.")
+@click.option("--force", is_flag=True, help="Deploy every stack even if its fingerprint shows it is unchanged.")
+@click.option("--cancel-on-failure", is_flag=True, help="Cancel a stack update as soon as a resource fails to update "
+                                                        "instead of waiting for the rest of the update to finish.")
+@click.option("--readiness-gate", is_flag=True, help="Consider an ECS deployment complete once its tasks are healthy "
+                                                     "in the load balancer and the old tasks have drained.")
+@click.option("--parallelism", type=int, default=1, help="The number of deployments to run concurrently.  "
+                                                         "Deployments wait for the stacks they import from.")
+@click.option("--prepare-change-sets", is_flag=True, help="Create the change sets for every existing stack in the "
+                                                          "plan up front and preview them before executing any.")
+@click.option("--regions", help="A comma separated list of regions to deploy the service to concurrently.")
+@click.option("--region-parallelism", type=int, default=4, help="The number of regions to deploy concurrently.")
 @click.pass_obj
-def deploy_cloudformation(deploy_ctx, dry_run):
-    # type: (DeployContext,bool) -> None
-    do_command(deploy_ctx, dry_run)
+def deploy_cloudformation(deploy_ctx, dry_run, force, cancel_on_failure, readiness_gate, parallelism,
+                          prepare_change_sets, regions, region_parallelism):
+    # type: (DeployContext,bool,bool,bool,bool,int,bool,str,int) -> None
+    do_command(deploy_ctx, dry_run, force=force, parallelism=parallelism, prepare_change_sets=prepare_change_sets,
+               regions=[region.strip() for region in regions.split(',') if region.strip()] if regions else None,
+               region_parallelism=region_parallelism, cancel_on_failure=cancel_on_failure,
+               readiness_gate=readiness_gate)
 
-def do_command(deploy_ctx, dry_run):
-    # type: (DeployContext,bool) -> None
+def do_command(deploy_ctx, dry_run, force=False, parallelism=1, prepare_change_sets=False, regions=None,
+               region_parallelism=4, cancel_on_failure=False, readiness_gate=False):
+    # type: (DeployContext,bool,bool,int,bool,list,int,bool,bool) -> None
+    if force:
+        deploy_ctx[FORCE_DEPLOY] = "True"
+    if cancel_on_failure:
+        deploy_ctx[CANCEL_ON_FAILURE] = "True"
+    if readiness_gate:
+        deploy_ctx[ECS_READINESS_GATE] = "True"
+    if regions:
+        _deploy_regions(deploy_ctx, regions, region_parallelism, dry_run=dry_run, parallelism=parallelism,
+                        prepare_change_sets=prepare_change_sets)
+        return
     plan = deploy_ctx.get_execution_plan()
-    for deploy in plan:
+    if parallelism > 1 or prepare_change_sets:
+        # each deploy pushes its own stack name so concurrent deploys need a context of their own
+        for deploy in plan:
+            deploy.deploy_ctx = deploy_ctx.fork()
+    stacks = [deploy for deploy in plan if isinstance(deploy, CloudFormationDeploy)]
+    try:
+        if prepare_change_sets and not dry_run:
+            _prepare_change_sets(stacks, CloudFormationBuddy(deploy_ctx).client,
+                                 timeout_seconds=deploy_ctx.get_change_set_wait_timeout())
+        if parallelism <= 1:
+            for deploy in plan:
+                _run_deploy(deploy, dry_run)
+            return
+        graph = ExecutionGraph(plan)
+        graph.print_graph()
+        graph.run(lambda deploy: _run_deploy(deploy, dry_run), parallelism)
+    finally:
+        # change sets prepared for deploys that never ran would block the next deploy
+        for deploy in stacks:
+            deploy.discard_prepared_change_set()
+        get_rate_limiter().print_counters()
+
+
+def _deploy_regions(deploy_ctx, regions, region_parallelism, **kwargs):
+    # type: (DeployContext,list,int) -> dict
+    """
+    Deploys the service to every region concurrently with a context per region.  The regional contexts
+    share the parsed artifact directory and the template manager so templates are only downloaded once.
+    :return: The error of each region keyed by region, None for regions that succeeded
+    """
+    def deploy_region(region):
         start = current_milli_time()
-        print_utility.progress("Starting Deployment: {}".format(str(deploy)))
-        deploy.do_deploy(dry_run)
-        print_utility.progress("Finished Deployment in {} ".format(
-            print_utility.print_time_delta(datetime.timedelta(milliseconds=(current_milli_time() - start)))))
+        try:
+            do_command(deploy_ctx.for_region(region), **kwargs)
+            error = None
+        except Exception as e:
+            print_utility.warn("Deployment failed for region {} - {}".format(region, e))
+            error = e
+        return error, datetime.timedelta(milliseconds=(current_milli_time() - start))
+
+    with ThreadPoolExecutor(max_workers=max(1, min(region_parallelism, len(regions)))) as executor:
+        results = dict(zip(regions, executor.map(deploy_region, regions)))
+    print_utility.banner_warn("Region Results", "\n".join(
+        "{}: {} in {}".format(region,
+                              "FAILED - {}".format(error) if error else "SUCCESS",
+                              print_utility.print_time_delta(duration))
+        for region, (error, duration) in results.items()))
+    failed = [region for region, (error, duration) in results.items() if error]
+    if failed:
+        print_utility.error("Deployment failed for regions - {}".format(", ".join(failed)), raise_exception=True)
+    return {region: error for region, (error, duration) in results.items()}
+
+
+def _prepare_change_sets(stacks, client, max_workers=_PREPARE_WORKERS, timeout_seconds=600):
+    # type: (list, object, int, int) -> None
+    """
+    Stages every stack and creates their change sets concurrently then waits for all of them in a single
+    poll loop.  Stacks that do not exist yet are created during execution as usual.
+    """
+    if not stacks:
+        return
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(stacks))) as executor:
+        change_set_ids = list(executor.map(lambda deploy: deploy.prepare_change_set(), stacks))
+    prepared = {change_set_id: deploy for change_set_id, deploy in zip(change_set_ids, stacks) if change_set_id}
+    print_utility.progress("Waiting for {} ChangeSets".format(len(prepared)))
+    descriptions = ChangeSetWaiter(client=client, timeout_seconds=timeout_seconds).wait(list(prepared.keys()))
+    print_utility.progress("ChangeSet Preview:")
+    for change_set_id, deploy in prepared.items():
+        description = descriptions[change_set_id]
+        if description['Status'] in _PENDING_CHANGE_SET_STATUSES:
+            # timed out, the deploy waits for it again before executing
+            print_utility.info_banner("\t{} - {}".format(deploy.stack_name, description['Status']))
+            continue
+        deploy.set_prepared_change_set_description(description)
+        if description['Status'] != 'CREATE_COMPLETE':
+            print_utility.info_banner("\t{} - {}".format(deploy.stack_name,
+                                                         description.get('StatusReason', description['Status'])))
+            continue
+        changes = list(iter_change_set_changes(client, description))
+        print_utility.info_banner("\t{} - {} changes".format(deploy.stack_name, len(changes)))
+        for change in changes:
+            resource = change.get('ResourceChange', {})
+            print_utility.info_banner("\t\t{} {} {} {}".format(classify_change(change),
+                                                               resource.get('Action', ''),
+                                                               resource.get('LogicalResourceId', ''),
+                                                               resource.get('ResourceType', '')))
+
+
+def _run_deploy(deploy, dry_run):
+    start = current_milli_time()
+    print_utility.progress("Starting Deployment: {}".format(str(deploy)))
+    deploy.do_deploy(dry_run)
+    print_utility.progress("Finished Deployment: {} in {} ".format(str(deploy),
+        print_utility.print_time_delta(datetime.timedelta(milliseconds=(current_milli_time() - start)))))
@@ -0,0 +1,59 @@
+import click
+
+from infra_buddy.aws.cloudformation import CloudFormationBuddy
+from infra_buddy.aws.drift import StackDriftDetector
+from infra_buddy.commandline import cli
+from infra_buddy.context.deploy_ctx import DeployContext
+from infra_buddy.utility import print_utility
+
+
+@cli.command(name='detect-drift', short_help="Detect drift on the infra-buddy managed stacks of a service.")
+@click.option("--parallelism", type=int, default=10, help="The number of drift detections to start concurrently.")
+@click.option("--timeout", type=int, default=900, help="Seconds to wait for drift detection to complete.")
+@click.pass_obj
+def detect_drift(deploy_ctx, parallelism, timeout):
+    # type: (DeployContext,int,int) -> None
+    do_command(deploy_ctx, parallelism=parallelism, timeout=timeout)
+
+
+def do_command(deploy_ctx, parallelism=10, timeout=900):
+    # type: (DeployContext,int,int) -> dict
+    """
+    :return: The drift status keyed by stack name
+    """
+    cf_buddy = CloudFormationBuddy(deploy_ctx=deploy_ctx)
+    stacks = cf_buddy.list_stacks(deploy_ctx.stack_name)
+    if not stacks:
+        print_utility.warn("No stacks found with prefix {}".format(deploy_ctx.stack_name))
+        return {}
+    detector = StackDriftDetector(cf_buddy.client, timeout_seconds=timeout)
+    detections = detector.start(stacks, max_workers=parallelism)
+    results = {}
+    for stack_name, status, drifts in detector.iter_results(detections):
+        results[stack_name] = _print_stack_drift(stack_name, status, drifts)
+    drifted = sorted(stack for stack, drift_status in results.items() if drift_status != 'IN_SYNC')
+    if drifted:
+        print_utility.banner_warn("Drift Detected", "\n".join(
+            "{}: {}".format(stack, results[stack]) for stack in drifted))
+    else:
+        print_utility.progress("No drift detected on {} stacks".format(len(results)))
+    return results
+
+
+def _print_stack_drift(stack_name, status, drifts):
+    if status['DetectionStatus'] == 'DETECTION_FAILED':
+        print_utility.warn("Drift detection failed for stack {} - {}".format(
+            stack_name, status.get('DetectionStatusReason', '')))
+        # a partial result is reported as failed rather than in sync
+        if status.get('StackDriftStatus', None) != 'DRIFTED':
+            return 'DETECTION_FAILED'
+    drift_status = status.get('StackDriftStatus', 'UNKNOWN')
+    print_utility.banner("Stack: {} - {}".format(stack_name, drift_status))
+    for drift in drifts:
+        print_utility.progress("\t{} ({}): {}".format(drift['LogicalResourceId'], drift['ResourceType'],
+                                                      drift['StackResourceDriftStatus']))
+        for difference in drift.get('PropertyDifferences', []):
+            print_utility.progress("\t\t{} {}: expected {} actual {}".format(
+                difference['PropertyPath'], difference['DifferenceType'],
+                difference['ExpectedValue'], difference['ActualValue']))
+    return drift_status
@@ -1,8 +1,11 @@
 import click
 
+import os
+
+from infra_buddy.aws.image_digest import ImageDigestResolver
 from infra_buddy.commandline import cli
-from infra_buddy.context.artifact_definition import ArtifactDefinition
-from infra_buddy.context.deploy_ctx import DeployContext
+from infra_buddy.context.artifact_definition import ArtifactDefinition, ECSArtifactDefinition
+from infra_buddy.context.deploy_ctx import DeployContext, IMAGE_DIGEST_CACHE_FILE
 from infra_buddy.utility import print_utility
 
 
@@ -14,16 +17,26 @@ from infra_buddy.utility import print_utility
               help="The location of the artifact referenced in the manifest (Docker registry or S3 bucket and path).")
 @click.option("--artifact-identifier",
               help="The identifier for the artifact. (Docker tag or filename excluding 'zip' extension).")
-def deploy_cloudformation(artifact_type, artifact_location, artifact_identifier):
-    # type: (str,str,str) -> None
-    path  = do_command(artifact_type, artifact_location, artifact_identifier)
+@click.option("--resolve-digest", is_flag=True,
+              help="Resolve the Docker tag to the digest of the image and pin the deployment to it.")
+def deploy_cloudformation(artifact_type, artifact_location, artifact_identifier, resolve_digest):
+    # type: (str,str,str,bool) -> None
+    path  = do_command(artifact_type, artifact_location, artifact_identifier, resolve_digest=resolve_digest)
     print_utility.info("Artifact Manifest saved to - {}".format(path))
 
 
 
 
-def do_command(artifact_type, artifact_location, artifact_identifier, destination=None):
-    # type: (str,str,str) -> str
+def do_command(artifact_type, artifact_location, artifact_identifier, destination=None, resolve_digest=False,
+               resolver=None):
+    # type: (str,str,str,str,bool,ImageDigestResolver) -> str
     ad = ArtifactDefinition.create(artifact_type, artifact_location, artifact_identifier)
+    if resolve_digest:
+        if not isinstance(ad, ECSArtifactDefinition):
+            raise click.UsageError("Digests can only be resolved for container artifacts")
+        resolver = resolver or ImageDigestResolver(cache_path=os.environ.get(IMAGE_DIGEST_CACHE_FILE, None))
+        if not ad.resolve_digest(resolver):
+            print_utility.error("Could not resolve digest of {}:{}".format(artifact_location, artifact_identifier),
+                                raise_exception=True)
     print_utility.info("Generated artifact manifest - {}".format(ad.__class__.__class__))
     return ad.save_to_file(destination_dir=destination)
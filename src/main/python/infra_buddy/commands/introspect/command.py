@@ -1,9 +1,12 @@
 import os
 from collections import defaultdict
 
-import boto3
 import click
+from infra_buddy.aws import clients
 from infra_buddy.aws.cloudformation import CloudFormationBuddy
+from infra_buddy.aws.resource_groups import ResourceGroupsTaggingBuddy
+from infra_buddy.aws.export_cache import get_account_id
+from infra_buddy.aws.resource_index import ResourceIndex
 
 from infra_buddy.commandline import cli
 from infra_buddy.context.deploy_ctx import DeployContext
@@ -13,28 +16,55 @@ from infra_buddy.utility import print_utility
 
 
 @cli.command(name='introspect', short_help="Search infra-buddy managed services for a resource.")
-@click.option("--type-filter", help="Constrain search to a AWS resource type.")
+@click.option("--type-filter", help="Constrain search to a AWS resource type.  "
+                                    "With the tagging backend use the tagging API format (service[:resourceType]).")
+@click.option("--logical-id", help="Constrain search to resources with this logical id.")
+@click.option("--physical-id", help="Constrain search to resources with this physical id.")
+@click.option("--parallelism", type=int, default=10, help="The number of stacks to inspect concurrently.")
+@click.option("--index", envvar='INTROSPECT_INDEX', type=click.Path(),
+              help="A local resource index (SQLite) to search and incrementally refresh.")
+@click.option("--index-max-age", type=int, default=300,
+              help="Seconds before the resource index is considered stale and refreshed.")
+@click.option("--backend", type=click.Choice(['cloudformation', 'tagging']), default='cloudformation',
+              help="Discover resources by walking stacks (cloudformation) or with the Resource Groups Tagging API "
+                   "(tagging).")
 @click.pass_obj
-def deploy_cloudformation(deploy_ctx,type_filter):
-    # type: (DeployContext,str) -> None
-    do_command(deploy_ctx,type_filter)
+def deploy_cloudformation(deploy_ctx,type_filter,logical_id,physical_id,parallelism,index,index_max_age,backend):
+    # type: (DeployContext,str,str,str,int,str,int,str) -> None
+    do_command(deploy_ctx,type_filter,parallelism,
+               logical_id=logical_id,physical_id=physical_id,index=index,index_max_age=index_max_age,backend=backend)
 
 
-def do_command(deploy_ctx,type_filter):
-    # type: (DeployContext,str) -> None
+def do_command(deploy_ctx,type_filter,parallelism=10,logical_id=None,physical_id=None,index=None,index_max_age=300,
+               backend='cloudformation'):
+    # type: (DeployContext,str,int,str,str,str,int,str) -> None
     cf_buddy = CloudFormationBuddy(deploy_ctx=deploy_ctx)
-    stacks = cf_buddy.list_stacks(deploy_ctx.stack_name)
-    resources = cf_buddy.load_resources_for_stack_list(stacks)
-    for stack_name, resources in resources.items():
+    if backend == 'tagging':
+        if index:
+            raise click.UsageError("The resource index is only supported by the cloudformation backend")
+        tagging_buddy = ResourceGroupsTaggingBuddy(deploy_ctx=deploy_ctx)
+        results = tagging_buddy.load_resources_by_stack(stack_prefix=deploy_ctx.stack_name, type_filter=type_filter)
+    elif index:
+        resource_index = ResourceIndex(index, deploy_ctx.region,
+                                       account_id_resolver=lambda: get_account_id(deploy_ctx),
+                                       access_key=clients.get_access_key())
+        try:
+            resource_index.sync(cf_buddy, max_age_seconds=index_max_age, parallelism=parallelism)
+            results = resource_index.query(stack_prefix=deploy_ctx.stack_name,
+                                           type_filter=type_filter,
+                                           logical_id=logical_id,
+                                           physical_id=physical_id)
+        finally:
+            resource_index.close()
+    else:
+        stacks = cf_buddy.list_stacks(deploy_ctx.stack_name)
+        results = cf_buddy.iter_resources_for_stack_list(stacks, type_filter=type_filter, max_workers=parallelism)
+    for stack_name, resources in results:
         print_utility.banner("Stack: {}".format(stack_name))
         for resource in resources:
-            if not type_filter or type_filter in resource['ResourceType']:
-                print_utility.info_banner("\tName: {}".format(resource['LogicalResourceId']))
-                print_utility.info_banner("\tType: {}".format(resource['ResourceType']))
-
-        
-        
-
-
-
-
+            if logical_id and resource['LogicalResourceId'] != logical_id:
+                continue
+            if physical_id and resource.get('PhysicalResourceId', None) != physical_id:
+                continue
+            print_utility.info_banner("\tName: {}".format(resource['LogicalResourceId']))
+            print_utility.info_banner("\tType: {}".format(resource['ResourceType']))
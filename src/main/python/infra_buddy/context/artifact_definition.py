@@ -16,6 +16,7 @@ _NOOP_ARTIFACT_TYPE = "noop"
 _ARTIFACT_TYPE = "artifact-type"
 _ARTIFACT_IDENTIFIER = "artifact-identifier"
 _ARTIFACT_LOCATION = "artifact-path"
+_ARTIFACT_DIGEST = "artifact-digest"
 
 
 class ArtifactDefinition(object):
@@ -24,7 +25,8 @@ class ArtifactDefinition(object):
         "properties": {
             _ARTIFACT_TYPE: {"type": "string", "enum": [_CONTAINER_ARTIFACT_TYPE, _S3_ARTIFACT_TYPE]},
             _ARTIFACT_IDENTIFIER: {"type": "string"},
-            _ARTIFACT_LOCATION: {"type": "string"}
+            _ARTIFACT_LOCATION: {"type": "string"},
+            _ARTIFACT_DIGEST: {"type": "string"}
         },
         "required": [
             _ARTIFACT_TYPE,
@@ -34,11 +36,12 @@ class ArtifactDefinition(object):
     }
 
     @classmethod
-    def create(cls, artifact_type=None, artifact_location=None, artifact_identifier=None):
-        # type: (str, str, str) -> ArtifactDefinition
+    def create(cls, artifact_type=None, artifact_location=None, artifact_identifier=None, artifact_digest=None):
+        # type: (str, str, str, str) -> ArtifactDefinition
         if artifact_type == _CONTAINER_ARTIFACT_TYPE:
             return ECSArtifactDefinition(artifact_location=artifact_location,
-                                         artifact_identifier=artifact_identifier)
+                                         artifact_identifier=artifact_identifier,
+                                         artifact_digest=artifact_digest)
         elif artifact_type == _S3_ARTIFACT_TYPE:
             return S3ArtifactDefinition(artifact_location=artifact_location,
                                         artifact_identifier=artifact_identifier)
@@ -56,7 +59,7 @@ class ArtifactDefinition(object):
         if definition:
             validate(definition, ArtifactDefinition.schema)
             return cls.create(definition[_ARTIFACT_TYPE], definition[_ARTIFACT_LOCATION],
-                              definition[_ARTIFACT_IDENTIFIER])
+                              definition[_ARTIFACT_IDENTIFIER], definition.get(_ARTIFACT_DIGEST, None))
         else:
             return cls.create()
 
@@ -65,6 +68,7 @@ class ArtifactDefinition(object):
         self.artifact_type = artifact_type
         self.artifact_location = artifact_location
         self.artifact_id = artifact_identifier
+        self.artifact_digest = None
 
     @staticmethod
     def _search_for_legacy_implementation(artifact_directory):
@@ -101,24 +105,38 @@ class ArtifactDefinition(object):
         else:
             path = _ARTIFACT_FILE
         print_utility.info("Persisting artifact manfiest - {}".format(path))
+        definition = {_ARTIFACT_TYPE: self.artifact_type,
+                      _ARTIFACT_LOCATION: self.artifact_location,
+                      _ARTIFACT_IDENTIFIER: self.artifact_id}
+        if self.artifact_digest:
+            definition[_ARTIFACT_DIGEST] = self.artifact_digest
         with open(path, 'w') as file:
-            json.dump({_ARTIFACT_TYPE: self.artifact_type,
-                       _ARTIFACT_LOCATION: self.artifact_location,
-                       _ARTIFACT_IDENTIFIER: self.artifact_id}, file)
+            json.dump(definition, file)
         return path
 
     def register_env_variables(self, deploy_ctx):
         if self.artifact_type == _CONTAINER_ARTIFACT_TYPE:
             # For first time deploys of ECS services
-            deploy_ctx['IMAGE'] = "{location}:{tag}".format(location=self.artifact_location, tag=self.artifact_id)
+            if self.artifact_digest:
+                deploy_ctx['IMAGE'] = "{location}@{digest}".format(location=self.artifact_location,
+                                                                   digest=self.artifact_digest)
+            else:
+                deploy_ctx['IMAGE'] = "{location}:{tag}".format(location=self.artifact_location,
+                                                                tag=self.artifact_id)
 
 
 class ECSArtifactDefinition(ArtifactDefinition):
-    def __init__(self, artifact_location, artifact_identifier):
+    def __init__(self, artifact_location, artifact_identifier, artifact_digest=None):
         super(ECSArtifactDefinition, self).__init__(_CONTAINER_ARTIFACT_TYPE, artifact_location, artifact_identifier)
+        self.artifact_digest = artifact_digest
+
+    def resolve_digest(self, resolver):
+        # type: (ImageDigestResolver) -> str
+        self.artifact_digest = resolver.resolve(self.artifact_location, self.artifact_id)
+        return self.artifact_digest
 
     def generate_execution_plan(self, deploy_ctx):
-        return [ECSDeploy(self.artifact_id, self.artifact_location, deploy_ctx)]
+        return [ECSDeploy(self.artifact_id, self.artifact_location, deploy_ctx, artifact_digest=self.artifact_digest)]
 
 
 class S3ArtifactDefinition(ArtifactDefinition):
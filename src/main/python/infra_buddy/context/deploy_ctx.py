@@ -1,3 +1,4 @@
+import copy
 import datetime
 import json
 import os
@@ -23,6 +24,17 @@ APPLICATION = 'APPLICATION'
 ENVIRONMENT = 'ENVIRONMENT'
 REGION = 'REGION'
 SKIP_ECS = 'SKIP_ECS'
+EXPORT_CACHE_TTL = 'EXPORT_CACHE_TTL'
+EXPORT_CACHE_FILE = 'EXPORT_CACHE_FILE'
+STACK_WAIT_TIMEOUT = 'STACK_WAIT_TIMEOUT'
+CHANGE_SET_WAIT_TIMEOUT = 'CHANGE_SET_WAIT_TIMEOUT'
+FORCE_DEPLOY = 'FORCE_DEPLOY'
+CHANGE_SET_POLICY = 'CHANGE_SET_POLICY'
+CANCEL_ON_FAILURE = 'CANCEL_ON_FAILURE'
+ECS_WAIT_TIMEOUT = 'ECS_WAIT_TIMEOUT'
+ECS_READINESS_GATE = 'ECS_READINESS_GATE'
+RESOLVE_IMAGE_DIGEST = 'RESOLVE_IMAGE_DIGEST'
+IMAGE_DIGEST_CACHE_FILE = 'IMAGE_DIGEST_CACHE_FILE'
 built_in = [DOCKER_REGISTRY, ROLE, APPLICATION, ENVIRONMENT, REGION, SKIP_ECS]
 env_variables = OrderedDict()
 env_variables['VPCAPP'] = "${VPCAPP}"
@@ -46,22 +58,23 @@ env_variables['CHANGE_SET_NAME'] = "${STACK_NAME}-deploy-cloudformation-change-s
 
 
 class DeployContext(dict):
-    def __init__(self, defaults, environment):
+    def __init__(self, defaults, environment, template_manager=None):
         super(DeployContext, self).__init__()
         self.current_deploy = None
         self.temp_files = []
-        self._initalize_defaults(defaults,environment)
+        self._initalize_defaults(defaults,environment,template_manager)
 
     @classmethod
-    def create_deploy_context_artifact(cls, artifact_directory, environment, defaults=None):
+    def create_deploy_context_artifact(cls, artifact_directory, environment, defaults=None, template_manager=None):
         # type: (str, str) -> DeployContext
         """
         :rtype DeployContext
         :param artifact_directory: Path to directory containing service definition.
                 May be a s3 URL pointing at a zip archive
         :param defaults: Path to json file containing default environment settings
+        :param template_manager: A TemplateManager to share with other contexts so templates are only downloaded once
         """
-        ret = DeployContext(defaults=defaults, environment=environment)
+        ret = DeployContext(defaults=defaults, environment=environment, template_manager=template_manager)
         ret._initialize_artifact_directory(artifact_directory)
         ret._initialize_environment_variables()
         return ret
@@ -87,7 +100,8 @@ class DeployContext(dict):
         print_utility.warn("Stack: {}".format(self.stack_name))
         if len(self.stack_name_cache)>0:
             print_utility.warn("Depth: {}".format(self.stack_name_cache))
-        if self.current_deploy:
+        # printing the context must not load the defaults of the deploy
+        if self.current_deploy and self.current_deploy.defaults_loaded:
             print_utility.banner_info("Deploy Defaults:",pformat(self.current_deploy.defaults))
         print_utility.banner_info("Environment:",pformat(self))
 
@@ -116,11 +130,13 @@ class DeployContext(dict):
             stack_template += "-${APPLICATION}"
             if self['ROLE']:
                 stack_template += "-${ROLE}"
-        env_variables[STACK_NAME] = stack_template
+        # contexts are initialized concurrently (i.e. deploy-fleet) so the shared templates are not modified
+        variables = OrderedDict(env_variables)
+        variables[STACK_NAME] = stack_template
         self['DEPLOY_DATE'] = datetime.datetime.now().strftime("%b_%d_%Y_Time_%H_%M")
         for property_name in built_in:
             self.__dict__[property_name.lower()] = self.get(property_name, None)
-        for variable, template in env_variables.items():
+        for variable, template in variables.items():
             evaluated_template = self.expandvars(template)
             self[variable] = evaluated_template
             self.__dict__[variable.lower()] = evaluated_template
@@ -131,7 +147,9 @@ class DeployContext(dict):
 
         print_utility.info("deploy_ctx = {}".format(repr(self.__dict__)))
 
-    def _initalize_defaults(self, defaults,environment):
+    def _initalize_defaults(self, defaults,environment,template_manager=None):
+        # kept so contexts for other services can be created with the same configuration
+        self.configuration_defaults = defaults
         self['DATADOG_KEY'] = ""
         self['ENVIRONMENT'] = environment.lower() if environment else "dev"
         if defaults:
@@ -142,7 +160,11 @@ class DeployContext(dict):
                                "This is probably not what you want - N. California is slow, like real slow."
                                "  Set the environment variable 'REGION' or pass a default configuration file to override. ")
             self['REGION'] = 'us-west-1'
-        self.template_manager = TemplateManager(self.get_deploy_templates(),self.get_service_modification_templates())
+        if template_manager:
+            self.template_manager = template_manager
+        else:
+            self.template_manager = TemplateManager(self.get_deploy_templates(),
+                                                    self.get_service_modification_templates())
         self.stack_name_cache = []
         if self.get('DATADOG_KEY','') != '':
             self.notifier = DataDogNotifier(key=self['DATADOG_KEY'],deploy_context=self)
@@ -184,6 +206,43 @@ class DeployContext(dict):
     def should_skip_ecs_trivial_update(self):
         return self.get(SKIP_ECS, os.environ.get(SKIP_ECS, "True")) == "True"
 
+    def get_export_cache_ttl(self):
+        return int(self.get(EXPORT_CACHE_TTL, os.environ.get(EXPORT_CACHE_TTL, 300)))
+
+    def get_export_cache_file(self):
+        return self.get(EXPORT_CACHE_FILE, os.environ.get(EXPORT_CACHE_FILE, None))
+
+    def get_stack_wait_timeout(self):
+        return int(self.get(STACK_WAIT_TIMEOUT, os.environ.get(STACK_WAIT_TIMEOUT, 3600)))
+
+    def get_change_set_wait_timeout(self):
+        return int(self.get(CHANGE_SET_WAIT_TIMEOUT, os.environ.get(CHANGE_SET_WAIT_TIMEOUT, 600)))
+
+    def get_ecs_wait_timeout(self):
+        return int(self.get(ECS_WAIT_TIMEOUT, os.environ.get(ECS_WAIT_TIMEOUT, 600)))
+
+    def should_use_readiness_gate(self):
+        return str(self.get(ECS_READINESS_GATE, os.environ.get(ECS_READINESS_GATE, "False"))) == "True"
+
+    def should_resolve_image_digest(self):
+        return str(self.get(RESOLVE_IMAGE_DIGEST, os.environ.get(RESOLVE_IMAGE_DIGEST, "False"))) == "True"
+
+    def get_image_digest_cache_file(self):
+        return self.get(IMAGE_DIGEST_CACHE_FILE, os.environ.get(IMAGE_DIGEST_CACHE_FILE, None))
+
+    def should_force_deploy(self):
+        return str(self.get(FORCE_DEPLOY, os.environ.get(FORCE_DEPLOY, "False"))) == "True"
+
+    def should_cancel_on_failure(self):
+        return str(self.get(CANCEL_ON_FAILURE, os.environ.get(CANCEL_ON_FAILURE, "False"))) == "True"
+
+    def get_change_set_policy(self):
+        # every class is executed by default, metadata (i.e. cfn-init that cfn-hup applies to running instances)
+        # or tags can be left out to skip ChangeSets that only contain those
+        policy = self.get(CHANGE_SET_POLICY, os.environ.get(CHANGE_SET_POLICY,
+                                                            "add,remove,replacement,in-place,tags,metadata"))
+        return [change_class.strip() for change_class in policy.split(',') if change_class.strip()]
+
     def render_template(self, file,destination):
         with open(file, 'r') as source:
             with open(os.path.join(destination,os.path.basename(file).replace('.tmpl','')),'w+') as destination:
@@ -252,6 +311,28 @@ class DeployContext(dict):
             return source
 
 
+    def fork(self):
+        # type: () -> DeployContext
+        """
+        :return: A copy of this context with its own deploy stack so deploys can run concurrently
+        """
+        ret = copy.copy(self)
+        ret.temp_files = []
+        ret.stack_name_cache = list(self.stack_name_cache)
+        ret.current_deploy = None
+        return ret
+
+    def for_region(self, region):
+        # type: (str) -> DeployContext
+        """
+        :return: A fork of this context targeting another region, the parsed artifact directory and
+        template manager are shared
+        """
+        ret = self.fork()
+        ret[REGION] = region
+        ret._initialize_environment_variables()
+        return ret
+
     def push_deploy_ctx(self, deploy_):
         # type: (CloudFormationDeploy) -> None
         if deploy_.stack_name:
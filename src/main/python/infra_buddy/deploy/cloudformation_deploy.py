@@ -1,3 +1,4 @@
+import hashlib
 import json
 import os
 import tempfile
@@ -9,7 +10,7 @@ from copy import deepcopy
 from jsonschema import validate
 
 from infra_buddy.aws.cloudformation import CloudFormationBuddy
-from infra_buddy.aws.s3 import S3Buddy, CloudFormationDeployS3Buddy
+from infra_buddy.aws.s3 import S3Buddy, CloudFormationDeployS3Buddy, StackFingerprintStore
 from infra_buddy.deploy.deploy import Deploy
 from infra_buddy.utility import helper_functions, print_utility
 
@@ -20,6 +21,44 @@ _PARAM_TYPE_FUNC = "func"
 
 _PARAM_TYPE_TEMPLATE = "template"
 
+# Stacks can only be skipped once an operation has completed successfully
+_FINGERPRINT_STATUSES = ['CREATE_COMPLETE', 'UPDATE_COMPLETE']
+
+# CloudFormation rejects a TemplateBody larger than this, bigger templates have to be staged in S3
+_TEMPLATE_BODY_LIMIT = 51200
+
+
+def _minify_template(template_file):
+    # type: (str) -> str
+    with open(template_file, 'r') as template:
+        contents = template.read()
+    try:
+        return json.dumps(json.loads(contents), separators=(',', ':'))
+    except ValueError:
+        # not json (i.e. yaml) so use it as is
+        return contents
+
+
+def _read_file(path):
+    # type: (str) -> str
+    with open(path, 'r') as source:
+        return source.read()
+
+
+class _StagedDeploy(object):
+    """
+    A deploy whose files have been rendered and uploaded, ready for a stack operation
+    """
+
+    def __init__(self, cloud_formation, template_args=None, unchanged=False, fingerprint=None):
+        # type: (CloudFormationBuddy, dict, bool, str) -> None
+        super(_StagedDeploy, self).__init__()
+        self.cloud_formation = cloud_formation
+        self.template_args = template_args
+        self.unchanged = unchanged
+        self.fingerprint = fingerprint
+        self.change_set_pending = False
+
 
 class CloudFormationDeploy(Deploy):
     schema = {
@@ -48,10 +87,46 @@ class CloudFormationDeploy(Deploy):
         self.parameter_file = template.get_parameter_file_path()
         self.template_file = template.get_template_file_path()
         self.default_path = template.get_defaults_file_path()
-        self._load_defaults(template.get_default_env_values())
+        self.staged = None
+        # defaults may call functions that look up AWS state so they are loaded on first use
+        self.default_env_values = template.get_default_env_values()
+        self._defaults = None
+        self._fingerprint_store = None
+
+    @property
+    def fingerprint_store(self):
+        if self._fingerprint_store is None:
+            self._fingerprint_store = StackFingerprintStore(self.deploy_ctx)
+        return self._fingerprint_store
+
+    @fingerprint_store.setter
+    def fingerprint_store(self, value):
+        self._fingerprint_store = value
+
+    @property
+    def defaults(self):
+        self._ensure_defaults()
+        return self._defaults
+
+    @defaults.setter
+    def defaults(self, value):
+        self._defaults = value
+
+    @property
+    def defaults_loaded(self):
+        return self._defaults is not None
+
+    def _ensure_defaults(self):
+        # loaded before the stack name of this deploy is pushed so they see the same context as at plan time
+        if self._defaults is None:
+            self._load_defaults(self.default_env_values)
+
+    def do_deploy(self, dry_run=False):
+        self._ensure_defaults()
+        return super(CloudFormationDeploy, self).do_deploy(dry_run)
 
     def _load_defaults(self, default_env_values):
-        self.defaults = {}
+        self._defaults = {}
         if self.default_path and os.path.exists(self.default_path):
             with open(self.default_path, 'r') as default_fp:
                 def_obj = json.load(default_fp)
@@ -278,37 +353,157 @@ class CloudFormationDeploy(Deploy):
             print_utility.banner(pformat(errs, indent=8))
 
     def _internal_deploy(self, dry_run):
-        # Initialize our buddies
-        s3 = CloudFormationDeployS3Buddy(self.deploy_ctx)
-        cloud_formation = CloudFormationBuddy(self.deploy_ctx)
         if dry_run:
             self.validate()
             return
-        # Upload our template to s3 to make things a bit easier and keep a record
-        template_file_url = s3.upload(file=(self.template_file))
-        # Upload all of our config files to S3 rendering any variables
-        config_files = self.get_rendered_config_files()
-        for rendered in config_files:
-            s3.upload(file=rendered)
-        # render our parameter files
-        parameter_file_rendered = self.get_rendered_param_file()
+        staged = self.staged or self._stage()
+        self.staged = None
+        if staged.unchanged:
+            return
+        cloud_formation = staged.cloud_formation
         # see if we are updating or creating
-        if cloud_formation.should_create_change_set():
-            cloud_formation.create_change_set(template_file_url=template_file_url,
-                                              parameter_file=parameter_file_rendered)
-            # make sure it is available and that there are no special conditions
-            if cloud_formation.should_execute_change_set():
-                print_utility.progress("Updating existing stack with ChangeSet - {}".format(self.stack_name))
-                cloud_formation.execute_change_set()
-            else:
-                print_utility.warn("No computed changes for stack - {}".format(self.stack_name))
-                # if there are no changes then clean up and exit
+        if staged.change_set_pending:
+            if cloud_formation.is_failed_change_set():
+                # most likely it depends on a stack that has been deployed since it was prepared
+                print_utility.warn("Prepared ChangeSet failed, recreating - {}".format(self.stack_name))
                 cloud_formation.delete_change_set()
-                return
+                cloud_formation.create_change_set(**staged.template_args)
+            else:
+                cloud_formation.finish_change_set()
+        elif cloud_formation.should_create_change_set():
+            cloud_formation.create_change_set(**staged.template_args)
         else:
             print_utility.progress("Creating new stack - {}".format(self.stack_name))
-            cloud_formation.create_stack(template_file_url=template_file_url,
-                                         parameter_file=parameter_file_rendered)
+            cloud_formation.create_stack(**staged.template_args)
+            self._record_fingerprint(cloud_formation, staged.fingerprint)
+            return
+        # make sure it is available and that there are no special conditions
+        if cloud_formation.should_execute_change_set():
+            print_utility.progress("Updating existing stack with ChangeSet - {}".format(self.stack_name))
+            cloud_formation.execute_change_set()
+        else:
+            print_utility.warn("No computed changes for stack - {}".format(self.stack_name))
+            # if there are no changes then clean up and exit
+            cloud_formation.delete_change_set()
+        # also recorded when nothing was executed so the next deploy of the same inputs is skipped
+        self._record_fingerprint(cloud_formation, staged.fingerprint)
+
+    def _record_fingerprint(self, cloud_formation, fingerprint):
+        # type: (CloudFormationBuddy, str) -> None
+        stack_version = cloud_formation.get_stack_version(refresh=True)
+        if cloud_formation.get_stack_status() not in _FINGERPRINT_STATUSES:
+            return
+        self.fingerprint_store.put(self.stack_name, stack_version, fingerprint)
+
+    def _stage(self):
+        # type: () -> _StagedDeploy
+        cloud_formation = self._get_cloud_formation_buddy()
+        # render our config and parameter files
+        config_files = self.get_rendered_config_files()
+        parameter_file_rendered = self.get_rendered_param_file()
+        fingerprint = self.compute_fingerprint(parameter_file_rendered, config_files)
+        if self._is_unchanged(cloud_formation, fingerprint):
+            print_utility.progress("Skipping unchanged stack - {} fingerprint {}".format(self.stack_name,
+                                                                                        fingerprint))
+            return _StagedDeploy(cloud_formation, unchanged=True)
+        s3 = self._get_s3_buddy()
+        # Small templates are sent inline, larger ones are staged in S3 under a key derived from their
+        # contents so unchanged templates are not uploaded again
+        template_body, template_file_url = self._stage_template(s3)
+        # Stage all of our config files in S3
+        for rendered in config_files:
+            s3.stage(file=rendered)
+        return _StagedDeploy(cloud_formation,
+                             template_args={'template_file_url': template_file_url,
+                                            'template_body': template_body,
+                                            'parameter_file': parameter_file_rendered},
+                             fingerprint=fingerprint)
+
+    def _get_cloud_formation_buddy(self):
+        # type: () -> CloudFormationBuddy
+        return CloudFormationBuddy(self.deploy_ctx)
+
+    def _get_s3_buddy(self):
+        # type: () -> S3Buddy
+        return CloudFormationDeployS3Buddy(self.deploy_ctx)
+
+    def prepare_change_set(self):
+        # type: () -> str
+        """
+        Stages the deploy and starts creating its change set without waiting for it, the change set is
+        finished and executed by the next do_deploy.
+        :return: The change set id or None if the stack is unchanged or does not exist yet
+        """
+        self._ensure_defaults()
+        self.deploy_ctx.push_deploy_ctx(self)
+        try:
+            self.staged = self._stage()
+            if self.staged.unchanged or not self.staged.cloud_formation.should_create_change_set():
+                return None
+            self.staged.cloud_formation.start_change_set(**self.staged.template_args)
+            self.staged.change_set_pending = True
+            return self.staged.cloud_formation.existing_change_set_id
+        finally:
+            self.deploy_ctx.pop_deploy_ctx()
+
+    def set_prepared_change_set_description(self, description):
+        self.staged.cloud_formation.change_set_description = description
+
+    def discard_prepared_change_set(self):
+        if self.staged and self.staged.change_set_pending:
+            print_utility.warn("Discarding prepared ChangeSet - {}".format(self.stack_name))
+            try:
+                self.staged.cloud_formation.delete_change_set()
+            except Exception as e:
+                print_utility.warn("Could not delete prepared ChangeSet - {}".format(e))
+        self.staged = None
+
+    def compute_fingerprint(self, parameter_file_rendered, config_files):
+        # type: (str, list) -> str
+        """
+        :return: A digest of everything that is deployed.  DEPLOY_DATE changes on every run so it is
+        replaced with a placeholder, otherwise parameters referencing the staging path would never match.
+        """
+        deploy_date = self.deploy_ctx.get('DEPLOY_DATE', None)
+        digest = hashlib.sha256()
+        contents = [('template', _minify_template(self.template_file)),
+                    ('parameters', _read_file(parameter_file_rendered))]
+        for config_file in sorted(config_files, key=os.path.basename):
+            contents.append((os.path.basename(config_file), _read_file(config_file)))
+        for name, content in contents:
+            if deploy_date:
+                content = content.replace(deploy_date, "${DEPLOY_DATE}")
+            digest.update(name.encode('utf-8'))
+            digest.update(b'\0')
+            digest.update(content.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def _is_unchanged(self, cloud_formation, fingerprint):
+        # type: (CloudFormationBuddy, str) -> bool
+        if self.deploy_ctx.should_force_deploy():
+            return False
+        if not cloud_formation.does_stack_exist():
+            return False
+        if cloud_formation.get_stack_status() not in _FINGERPRINT_STATUSES:
+            return False
+        return self.fingerprint_store.get(self.stack_name, cloud_formation.get_stack_version()) == fingerprint
+
+    def _stage_template(self, s3):
+        # type: (S3Buddy) -> (str, str)
+        """
+        :return: (template_body, template_file_url) exactly one of which is populated
+        """
+        minified = _minify_template(self.template_file)
+        if len(minified.encode('utf-8')) <= _TEMPLATE_BODY_LIMIT:
+            print_utility.info("Deploying template inline - {} bytes".format(len(minified)))
+            return minified, None
+        self._prep_render_destination()
+        minified_file = os.path.join(self.destination, os.path.basename(self.template_file))
+        with open(minified_file, 'w') as destination:
+            destination.write(minified)
+        self.deploy_ctx.temp_files.append(minified_file)
+        return None, s3.upload_content_addressed(file=minified_file)
 
     def get_default_params(self):
         return self._analyze_parameters()[0]
@@ -10,6 +10,10 @@ class Deploy(object):
         self.stack_name = None
         self.defaults = {}
 
+    @property
+    def defaults_loaded(self):
+        return True
+
     def do_deploy(self,dry_run=False):
         self.deploy_ctx.push_deploy_ctx(self)
         try:
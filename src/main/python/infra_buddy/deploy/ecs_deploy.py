@@ -4,14 +4,26 @@ from infra_buddy.utility import print_utility
 
 
 class ECSDeploy(Deploy):
-    def __init__(self, artifact_id, artifact_location, deploy_ctx):
+    def __init__(self, artifact_id, artifact_location, deploy_ctx, artifact_digest=None):
         super(ECSDeploy, self).__init__(deploy_ctx)
         self.artifact_id = artifact_id
         self.artifact_location = artifact_location
-        self.ecs_buddy = ECSBuddy(self.deploy_ctx)
+        self.artifact_digest = artifact_digest
+        self._ecs_buddy = None
+
+    @property
+    def ecs_buddy(self):
+        # built on first use so printing the execution plan makes no AWS calls
+        if self._ecs_buddy is None:
+            self._ecs_buddy = ECSBuddy(self.deploy_ctx)
+        return self._ecs_buddy
+
+    @ecs_buddy.setter
+    def ecs_buddy(self, value):
+        self._ecs_buddy = value
 
     def _internal_deploy(self, dry_run):
-        self.ecs_buddy.set_container_image(self.artifact_location, self.artifact_id)
+        self.ecs_buddy.set_container_image(self.artifact_location, self.artifact_id, digest=self.artifact_digest)
         if dry_run:
             print_utility.warn("ECS Deploy would update service {} to use image {}".format(self.ecs_buddy.ecs_service,
                                                                                            self.ecs_buddy.new_image))
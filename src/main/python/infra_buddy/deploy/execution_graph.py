@@ -0,0 +1,207 @@
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import pydash
+
+from infra_buddy.context.deploy_ctx import STACK_NAME
+from infra_buddy.deploy.cloudformation_deploy import CloudFormationDeploy
+from infra_buddy.utility import print_utility
+
+_SUB_VARIABLE = re.compile(r'\$\{([^}!]+)\}')
+# the $var and ${var} forms expanded by DeployContext.expandvars
+_CONTEXT_VARIABLE = re.compile(r'(?<!\\)\$(\w+|\{([^}]*)\})')
+
+
+class _UnresolvedValue(Exception):
+    pass
+
+
+def _resolve(node, variables):
+    # type: (object, dict) -> str
+    """
+    Best effort evaluation of the intrinsic functions commonly used to build export names.
+    :raises _UnresolvedValue: if the value depends on anything that is only known by CloudFormation
+    """
+    if isinstance(node, str):
+        return node
+    if isinstance(node, dict) and len(node) == 1:
+        func, arg = list(node.items())[0]
+        if func == 'Ref':
+            if arg in variables:
+                return variables[arg]
+        elif func == 'Fn::Sub':
+            if isinstance(arg, list):
+                template = arg[0]
+                sub_variables = dict(variables)
+                sub_variables.update({key: _resolve(value, variables) for key, value in arg[1].items()})
+            else:
+                template = arg
+                sub_variables = variables
+
+            def replace(match):
+                if match.group(1) not in sub_variables:
+                    raise _UnresolvedValue(match.group(0))
+                return sub_variables[match.group(1)]
+
+            return _SUB_VARIABLE.sub(replace, template)
+        elif func == 'Fn::Join':
+            return arg[0].join([_resolve(value, variables) for value in arg[1]])
+    raise _UnresolvedValue(json.dumps(node))
+
+
+def _expand_context(value, context):
+    # type: (str, dict) -> str
+    """
+    Expands a parameter value from the context values only, the defaults of a deploy may look up AWS
+    state so they are not loaded to build the graph.
+    :raises _UnresolvedValue: if the value refers to anything that is not in the context
+    """
+    def replace(match):
+        val = context.get(match.group(2) or match.group(1), None)
+        if val is None:
+            raise _UnresolvedValue(match.group(0))
+        return str(val).lower() if isinstance(val, bool) else str(val)
+
+    return _CONTEXT_VARIABLE.sub(replace, value)
+
+
+def _find_imports(node, imports):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == 'Fn::ImportValue':
+                imports.append(value)
+            else:
+                _find_imports(value, imports)
+    elif isinstance(node, list):
+        for value in node:
+            _find_imports(value, imports)
+    return imports
+
+
+class _StackReferences(object):
+    """
+    The export names a stack produces and the import names it consumes.  Names that can not be resolved
+    locally are counted so the graph can fall back to plan order for them.
+    """
+
+    def __init__(self, deploy):
+        # type: (CloudFormationDeploy) -> None
+        super(_StackReferences, self).__init__()
+        self.exports = set()
+        self.imports = set()
+        self.unresolved_exports = 0
+        self.unresolved_imports = 0
+        try:
+            with open(deploy.template_file, 'r') as template:
+                template_obj = json.load(template)
+        except ValueError:
+            print_utility.warn("Can not inspect template for dependencies - {}".format(deploy.template_file))
+            self.unresolved_exports = self.unresolved_imports = 1
+            return
+        variables = self._load_variables(deploy, template_obj)
+        for output in pydash.get(template_obj, 'Outputs', {}).values():
+            if 'Export' in output:
+                self._add(self.exports, output['Export'].get('Name', None), variables, 'unresolved_exports')
+        # imports may appear anywhere (i.e. Outputs or Conditions) except the Parameters
+        sections = {key: value for key, value in template_obj.items() if key != 'Parameters'}
+        for import_ in _find_imports(sections, []):
+            self._add(self.imports, import_, variables, 'unresolved_imports')
+
+    def _add(self, names, node, variables, unresolved_counter):
+        try:
+            names.add(_resolve(node, variables))
+        except _UnresolvedValue as unresolved:
+            print_utility.info("Could not resolve reference locally - {}".format(unresolved))
+            setattr(self, unresolved_counter, getattr(self, unresolved_counter) + 1)
+
+    @staticmethod
+    def _load_variables(deploy, template_obj):
+        deploy_ctx = deploy.deploy_ctx
+        variables = {'AWS::StackName': deploy.stack_name, 'AWS::Region': deploy_ctx.region}
+        for key, value in pydash.get(template_obj, 'Parameters', {}).items():
+            if 'Default' in value:
+                variables[key] = str(value['Default'])
+        context = dict(deploy_ctx)
+        context[STACK_NAME] = deploy.stack_name
+        with open(deploy.parameter_file, 'r') as params:
+            for param in json.load(params):
+                try:
+                    variables[param['ParameterKey']] = _expand_context(param['ParameterValue'], context)
+                except _UnresolvedValue:
+                    pass
+        return variables
+
+
+class ExecutionGraph(object):
+    """
+    Runs an execution plan as a DAG so independent deploys happen concurrently.  Dependencies only ever
+    point backwards in the plan so the sequential order is always a valid schedule:
+        * the first stack (the service itself) runs before everything else
+        * a stack runs after any earlier stack that exports a name it imports
+        * an import that can not be matched waits for every earlier stack with unresolved exports, an
+          import that can not be resolved waits for every earlier stack
+        * artifact and monitor deploys run after every stack that precedes them in the plan
+    """
+
+    def __init__(self, plan):
+        # type: (list) -> None
+        super(ExecutionGraph, self).__init__()
+        self.plan = plan
+        self.dependencies = [set() for _ in plan]
+        references = {}
+        for index, deploy in enumerate(plan):
+            stacks = [i for i in range(index) if isinstance(plan[i], CloudFormationDeploy)]
+            if not isinstance(deploy, CloudFormationDeploy):
+                self.dependencies[index].update(stacks)
+                continue
+            references[index] = _StackReferences(deploy)
+            if not stacks:
+                continue
+            self.dependencies[index].add(stacks[0])
+            if references[index].unresolved_imports:
+                self.dependencies[index].update(stacks)
+                continue
+            for name in references[index].imports:
+                producers = [i for i in stacks if name in references[i].exports]
+                if not producers:
+                    producers = [i for i in stacks if references[i].unresolved_exports]
+                self.dependencies[index].update(producers)
+
+    def print_graph(self):
+        print_utility.progress("Execution Graph:")
+        for index, deploy in enumerate(self.plan):
+            after = ", ".join(str(self.plan[i]) for i in sorted(self.dependencies[index]))
+            print_utility.info_banner("\t{}{}".format(deploy, " <- {}".format(after) if after else ""))
+
+    def run(self, run_deploy, parallelism):
+        # type: (callable, int) -> None
+        """
+        :param run_deploy: Called with each deploy once all of its dependencies have completed
+        :param parallelism: The maximum number of deploys to run at once
+        Once a deploy fails no new deploys are started, the running ones are allowed to finish and the
+        first failure is raised.
+        """
+        completed = set()
+        running = {}
+        failure = None
+        with ThreadPoolExecutor(max_workers=parallelism) as executor:
+            while True:
+                if failure is None:
+                    for index in range(len(self.plan)):
+                        if index in completed or index in running.values():
+                            continue
+                        if len(running) < parallelism and self.dependencies[index] <= completed:
+                            running[executor.submit(run_deploy, self.plan[index])] = index
+                if not running:
+                    break
+                done, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    if future.exception() is not None:
+                        print_utility.warn("Deployment failed: {}".format(self.plan[index]))
+                        failure = failure or future.exception()
+                    else:
+                        completed.add(index)
+        if failure is not None:
+            raise failure
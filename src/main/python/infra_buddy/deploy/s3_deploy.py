@@ -13,7 +13,18 @@ class S3Deploy(Deploy):
         super(S3Deploy, self).__init__(ctx)
         self.location = location
         self.artifact_id = artifact_id
-        self.cloud_formation_buddy = CloudFormationBuddy(self.deploy_ctx)
+        self._cloud_formation_buddy = None
+
+    @property
+    def cloud_formation_buddy(self):
+        # built on first use so printing the execution plan makes no AWS calls
+        if self._cloud_formation_buddy is None:
+            self._cloud_formation_buddy = CloudFormationBuddy(self.deploy_ctx)
+        return self._cloud_formation_buddy
+
+    @cloud_formation_buddy.setter
+    def cloud_formation_buddy(self, value):
+        self._cloud_formation_buddy = value
 
     def _internal_deploy(self, dry_run):
         mkdtemp = tempfile.mkdtemp()
@@ -1,5 +1,6 @@
 import os
 import tempfile
+import threading
 from zipfile import ZipFile
 
 import requests
@@ -20,6 +21,8 @@ class Template(object):
         self.destination = None
         self.valid = False
         self.default_env_values = values.get('default-values', {})
+        self.downloaded = False
+        self.download_lock = threading.Lock()
 
     def get_default_env_values(self):
         return self.default_env_values
@@ -57,6 +60,16 @@ class Template(object):
             return
         self.valid = True
 
+    def download_template(self):
+        # templates are shared by every context in the process (i.e. regions) so only download once
+        with self.download_lock:
+            if not self.downloaded:
+                self._download()
+                self.downloaded = True
+
+    def _download(self):
+        pass
+
     def _prep_download(self):
         if not self.destination:
             self.destination = tempfile.mkdtemp()
@@ -79,7 +92,7 @@ class URLTemplate(Template):
         super(URLTemplate, self).__init__(service_type, values)
         self.download_url = values.get('url', None)
 
-    def download_template(self):
+    def _download(self):
         self._prep_download()
         r = requests.get(self.download_url, stream=True)
         if r.status_code != 200:
@@ -143,6 +156,8 @@ class AliasTemplate(Template):
 class GitHubTemplate(URLTemplate):
     def __init__(self, service_type, values):
         super(GitHubTemplate, self).__init__(service_type=service_type, values=values)
+        # copy so the template definition can be loaded again
+        values = dict(values)
         tag = values.pop('tag', 'master')
         self.download_url = "https://github.com/{owner}/{repo}/archive/{tag}.zip".format(tag=tag, **values)
         if 'relative-path' in values:
@@ -164,7 +179,7 @@ class S3Template(Template):
         super(S3Template, self).__init__(service_type, values=values)
         self.s3_location = values['location']
 
-    def download_template(self):
+    def _download(self):
         self._prep_download()
         s3.download_zip_from_s3_url(self.s3_location, self.destination)
 
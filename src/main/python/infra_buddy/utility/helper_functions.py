@@ -1,8 +1,7 @@
 import math
 from operator import itemgetter
 
-import boto3
-
+from infra_buddy.aws import clients
 from infra_buddy.aws.cloudformation import CloudFormationBuddy
 from infra_buddy.utility import print_utility
 
@@ -189,4 +188,4 @@ def calculate_rule_priority(deploy_ctx, stack_name):
 
 
 def get_boto_client(deploy_ctx):
-    return boto3.client('elbv2', region_name=deploy_ctx.region)
+    return clients.get_client('elbv2', deploy_ctx.region)
@@ -31,3 +31,11 @@ def waitfor(function_pointer, expected_result, interval_seconds, max_attempts, n
         return None
     else:
         return latest
+
+
+def backoff_intervals(initial_seconds, max_seconds, factor=1.5):
+    # yields polling intervals starting short and backing off towards max_seconds
+    interval = initial_seconds
+    while True:
+        yield interval
+        interval = min(max_seconds, interval * factor)
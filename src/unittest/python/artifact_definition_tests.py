@@ -11,6 +11,7 @@ from infra_buddy.context.deploy_ctx import DeployContext
 from infra_buddy.deploy.cloudformation_deploy import CloudFormationDeploy
 from infra_buddy.template.template import NamedLocalTemplate
 from infra_buddy.utility import helper_functions
+from fakes import FakeImageDigestResolver, DIGEST
 from testcase_parent import ParentTestCase
 
 
@@ -59,3 +60,14 @@ class ArtifactDefinitionTestCase(ParentTestCase):
         finally:
             self.clean_dir(mkdtemp)
 
+    def test_save_manifest_digest(self):
+        mkdtemp = tempfile.mkdtemp()
+        try:
+            path = command.do_command("container", "https://docker.io/my-registry/artifact", "39", destination=mkdtemp,
+                                      resolve_digest=True, resolver=FakeImageDigestResolver())
+            art = ArtifactDefinition.create_from_directory(os.path.dirname(path))
+            self.assertEqual(art.artifact_digest, DIGEST, "Did not persist digest")
+            self.assertEqual(art.generate_execution_plan(self.test_deploy_ctx)[0].artifact_digest, DIGEST,
+                             "Did not pin deploy to digest")
+        finally:
+            self.clean_dir(mkdtemp)
@@ -0,0 +1,60 @@
+import unittest
+
+from infra_buddy.aws.change_set import classify_change, iter_change_set_changes, CHANGE_ADD, CHANGE_REMOVE, \
+    CHANGE_REPLACEMENT, CHANGE_IN_PLACE, CHANGE_TAGS, CHANGE_METADATA
+
+
+def _change(action, replacement=None, scope=None, details=None):
+    resource = {'Action': action, 'LogicalResourceId': 'Queue', 'ResourceType': 'AWS::SQS::Queue'}
+    if replacement:
+        resource['Replacement'] = replacement
+    if scope:
+        resource['Scope'] = scope
+    if details:
+        resource['Details'] = details
+    return {'Type': 'Resource', 'ResourceChange': resource}
+
+
+def _detail(attribute, name=None):
+    target = {'Attribute': attribute, 'RequiresRecreation': 'Never'}
+    if name:
+        target['Name'] = name
+    return {'Target': target, 'Evaluation': 'Static', 'ChangeSource': 'DirectModification'}
+
+
+class FakePagingClient(object):
+    def __init__(self, pages):
+        super(FakePagingClient, self).__init__()
+        self.pages = pages
+        self.calls = 0
+
+    def describe_change_set(self, ChangeSetName, NextToken):
+        self.calls += 1
+        return self.pages[int(NextToken)]
+
+
+class ChangeSetTestCase(unittest.TestCase):
+    def test_classify_change(self):
+        self.assertEqual(classify_change(_change('Add')), CHANGE_ADD)
+        self.assertEqual(classify_change(_change('Remove')), CHANGE_REMOVE)
+        self.assertEqual(classify_change(_change('Modify', 'True', ['Properties'], [_detail('Properties', 'Name')])),
+                         CHANGE_REPLACEMENT)
+        self.assertEqual(classify_change(_change('Modify', 'False', ['Properties'],
+                                                 [_detail('Properties', 'VisibilityTimeout')])), CHANGE_IN_PLACE)
+        self.assertEqual(classify_change(_change('Modify', 'False', ['Tags'], [_detail('Tags')])), CHANGE_TAGS)
+        self.assertEqual(classify_change(_change('Modify', 'False', ['Properties', 'Tags'],
+                                                 [_detail('Properties', 'Tags'), _detail('Tags')])), CHANGE_TAGS)
+        self.assertEqual(classify_change(_change('Modify', 'False', ['Metadata'], [_detail('Metadata')])),
+                         CHANGE_METADATA)
+        self.assertEqual(classify_change(_change('Dynamic')), CHANGE_IN_PLACE)
+        self.assertEqual(classify_change({'ResourceChange': {'ResourceType': 'AWS::ECS::Service'}}), CHANGE_IN_PLACE)
+
+    def test_lazy_paging(self):
+        description = {'ChangeSetId': 'id', 'Changes': [_change('Add')], 'NextToken': '0'}
+        client = FakePagingClient([{'Changes': [_change('Remove')], 'NextToken': '1'},
+                                   {'Changes': [_change('Add')]}])
+        changes = iter_change_set_changes(client, description)
+        next(changes)
+        self.assertEqual(client.calls, 0, "Requested a page before it was needed")
+        self.assertEqual(len(list(changes)), 2, "Did not page through every change")
+        self.assertEqual(client.calls, 2, "Did not page through every change")
@@ -0,0 +1,57 @@
+import threading
+import unittest
+
+from infra_buddy.aws import clients
+
+
+class ClientsTestCase(unittest.TestCase):
+    def tearDown(self):
+        clients.clear()
+
+    def test_shared_clients(self):
+        client = clients.get_client('cloudformation', 'us-west-2')
+        self.assertIs(clients.get_client('cloudformation', 'us-west-2'), client, "Did not reuse client")
+        self.assertIsNot(clients.get_client('cloudformation', 'us-east-1'), client, "Shared client across regions")
+        self.assertEqual(client.meta.config.max_pool_connections, clients.MAX_POOL_CONNECTIONS,
+                         "Did not size connection pool")
+        self.assertEqual(client.meta.config.retries['mode'], 'adaptive', "Did not use adaptive retries")
+        clients.clear()
+        self.assertIsNot(clients.get_client('cloudformation', 'us-west-2'), client, "Did not clear clients")
+
+    def test_thread_local_resources(self):
+        resource = clients.get_resource('s3', 'us-west-2')
+        self.assertIs(clients.get_resource('s3', 'us-west-2'), resource, "Did not reuse resource")
+        other = []
+        thread = threading.Thread(target=lambda: other.append(clients.get_resource('s3', 'us-west-2')))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], resource, "Shared resource across threads")
+
+    def test_clear_resources_of_every_thread(self):
+        resources = []
+        cleared = threading.Event()
+        looked_up = threading.Event()
+
+        def lookup():
+            resources.append(clients.get_resource('s3', 'us-west-2'))
+            looked_up.set()
+            cleared.wait()
+            resources.append(clients.get_resource('s3', 'us-west-2'))
+
+        thread = threading.Thread(target=lookup)
+        thread.start()
+        looked_up.wait()
+        clients.clear()
+        cleared.set()
+        thread.join()
+        self.assertIsNot(resources[1], resources[0], "Did not clear resources of other threads")
+
+    def test_concurrent_clients(self):
+        found = []
+        threads = [threading.Thread(target=lambda: found.append(clients.get_client('sqs', 'us-west-2')))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(all(client is found[0] for client in found), "Cached more than one client")
@@ -7,12 +7,97 @@ from infra_buddy.aws.cloudformation import CloudFormationBuddy
 from infra_buddy.aws.s3 import S3Buddy, CloudFormationDeployS3Buddy
 # noinspection PyUnresolvedReferences
 from infra_buddy import commandline
+from infra_buddy.deploy import cloudformation_deploy
 from infra_buddy.deploy.cloudformation_deploy import CloudFormationDeploy
 from infra_buddy.template.template import LocalTemplate
 from infra_buddy.utility.exception import NOOPException
 from testcase_parent import ParentTestCase
 
 
+class FakeS3Buddy(object):
+    def __init__(self):
+        super(FakeS3Buddy, self).__init__()
+        self.uploaded = []
+
+    def upload_content_addressed(self, file, key_name=None):
+        with open(file, 'r') as source:
+            self.uploaded.append(source.read())
+        return "https://bucket/{}".format(len(self.uploaded))
+
+    def stage(self, file, key_name=None):
+        return self.upload_content_addressed(file, key_name)
+
+
+class FakeFingerprintStore(object):
+    def __init__(self):
+        super(FakeFingerprintStore, self).__init__()
+        self.records = {}
+
+    def get(self, stack_name, stack_version):
+        return self.records.get((stack_name, stack_version), None)
+
+    def put(self, stack_name, stack_version, fingerprint):
+        self.records[(stack_name, stack_version)] = fingerprint
+
+
+class FakeNoopStackBuddy(object):
+    """
+    An existing stack whose ChangeSets never contain changes
+    """
+
+    def __init__(self, status='UPDATE_COMPLETE'):
+        super(FakeNoopStackBuddy, self).__init__()
+        self.status = status
+        self.change_sets = 0
+        self.deleted = 0
+
+    def does_stack_exist(self):
+        return True
+
+    def should_create_change_set(self):
+        return True
+
+    def get_stack_status(self):
+        return self.status
+
+    def get_stack_version(self, refresh=False):
+        return "stack-id@2020-01-01"
+
+    def create_change_set(self, template_file_url=None, parameter_file=None, template_body=None):
+        self.change_sets += 1
+
+    def should_execute_change_set(self):
+        return False
+
+    def delete_change_set(self):
+        self.deleted += 1
+
+
+class NoopStackDeploy(CloudFormationDeploy):
+    def __init__(self, stack_name, template, deploy_ctx):
+        super(NoopStackDeploy, self).__init__(stack_name, template, deploy_ctx)
+        self.cloud_formation = FakeNoopStackBuddy()
+        self.fingerprint_store = FakeFingerprintStore()
+
+    def _get_cloud_formation_buddy(self):
+        return self.cloud_formation
+
+    def _get_s3_buddy(self):
+        return FakeS3Buddy()
+
+
+class FakePendingChangeSetClient(object):
+    def __init__(self):
+        super(FakePendingChangeSetClient, self).__init__()
+        self.deleted = []
+
+    def describe_change_set(self, ChangeSetName):
+        return {'ChangeSetId': ChangeSetName, 'Status': 'CREATE_COMPLETE', 'Changes': []}
+
+    def delete_change_set(self, ChangeSetName):
+        self.deleted.append(ChangeSetName)
+
+
 class CloudFormationTestCase(ParentTestCase):
     def tearDown(self):
         pass
@@ -80,6 +165,32 @@ class CloudFormationTestCase(ParentTestCase):
             cloudformation.existing_change_set_id = cloudformation.change_set_description['ChangeSetId']
         self.assertFalse(cloudformation.should_execute_change_set(),"Failed to skip ecs special case")
 
+    def test_change_set_policy(self):
+        cloudformation = CloudFormationBuddy(self.test_deploy_ctx)
+        cloudformation.existing_change_set_id = 'id'
+        metadata = {'Type': 'Resource', 'ResourceChange': {'Action': 'Modify', 'Replacement': 'False',
+                                                           'Scope': ['Metadata'], 'LogicalResourceId': 'Queue',
+                                                           'ResourceType': 'AWS::SQS::Queue'}}
+        cloudformation.change_set_description = {'ChangeSetId': 'id', 'Status': 'CREATE_COMPLETE',
+                                                 'Changes': [metadata]}
+        self.assertTrue(cloudformation.should_execute_change_set(), "Skipped metadata only change set by default")
+        self.test_deploy_ctx['CHANGE_SET_POLICY'] = 'add,remove,replacement,in-place,tags'
+        try:
+            self.assertFalse(cloudformation.should_execute_change_set(), "Did not apply change set policy")
+        finally:
+            del self.test_deploy_ctx['CHANGE_SET_POLICY']
+
+    def test_finish_pending_change_set(self):
+        cloudformation = CloudFormationBuddy(self.test_deploy_ctx)
+        cloudformation.client = FakePendingChangeSetClient()
+        cloudformation.existing_change_set_id = 'id'
+        # prepared change set still being created when the prepare wait timed out
+        cloudformation.change_set_description = {'ChangeSetId': 'id', 'Status': 'CREATE_IN_PROGRESS'}
+        cloudformation.finish_change_set()
+        self.assertEqual(cloudformation.change_set_description['Status'], 'CREATE_COMPLETE',
+                         "Did not wait for pending change set")
+        self.assertEqual(cloudformation.client.deleted, [], "Deleted pending change set")
+
     def test_changeset_operation_ready(self):
         cloudformation = CloudFormationBuddy(self.test_deploy_ctx)
         try:
@@ -88,5 +199,60 @@ class CloudFormationTestCase(ParentTestCase):
         except:
             pass
 
+    def test_template_staging(self):
+        template = ParentTestCase._get_resource_path("cloudformation/aws-resources.template")
+        parameter_file = ParentTestCase._get_resource_path("cloudformation/aws-resources.parameters.json")
+        deploy = CloudFormationDeploy(self.test_deploy_ctx.stack_name, LocalTemplate(template, parameter_file),
+                                      self.test_deploy_ctx)
+        s3 = FakeS3Buddy()
+        template_body, template_file_url = deploy._stage_template(s3)
+        with open(template, 'r') as source:
+            self.assertEqual(json.loads(template_body), json.load(source), "Minified template changed")
+        self.assertIsNone(template_file_url, "Staged small template in S3")
+        limit = cloudformation_deploy._TEMPLATE_BODY_LIMIT
+        try:
+            cloudformation_deploy._TEMPLATE_BODY_LIMIT = 10
+            template_body, template_file_url = deploy._stage_template(s3)
+        finally:
+            cloudformation_deploy._TEMPLATE_BODY_LIMIT = limit
+        self.assertIsNone(template_body, "Sent large template inline")
+        self.assertEqual(template_file_url, "https://bucket/1", "Did not stage large template")
+        self.assertTrue("\n" not in s3.uploaded[0], "Did not minify staged template")
 
+    def test_fingerprint_skip(self):
+        template = ParentTestCase._get_resource_path("cloudformation/aws-resources.template")
+        parameter_file = ParentTestCase._get_resource_path("cloudformation/aws-resources.parameters.json")
+        deploy = CloudFormationDeploy(self.test_deploy_ctx.stack_name, LocalTemplate(template, parameter_file),
+                                      self.test_deploy_ctx)
+        fingerprint = deploy.compute_fingerprint(deploy.get_rendered_param_file(), [])
+        deploy_date = self.test_deploy_ctx['DEPLOY_DATE']
+        try:
+            self.test_deploy_ctx['DEPLOY_DATE'] = 'Jan_01_2000_Time_00_00'
+            self.assertEqual(deploy.compute_fingerprint(deploy.get_rendered_param_file(), []), fingerprint,
+                             "Deploy date changed the fingerprint")
+        finally:
+            self.test_deploy_ctx['DEPLOY_DATE'] = deploy_date
+        cloud_formation = FakeNoopStackBuddy()
+        deploy.fingerprint_store = FakeFingerprintStore()
+        deploy.fingerprint_store.put(deploy.stack_name, cloud_formation.get_stack_version(), fingerprint)
+        self.assertTrue(deploy._is_unchanged(cloud_formation, fingerprint), "Did not skip unchanged stack")
+        self.assertFalse(deploy._is_unchanged(cloud_formation, 'other'), "Skipped changed stack")
+        cloud_formation = FakeNoopStackBuddy('UPDATE_ROLLBACK_COMPLETE')
+        self.assertFalse(deploy._is_unchanged(cloud_formation, fingerprint), "Skipped failed stack")
+        cloud_formation = FakeNoopStackBuddy()
+        self.test_deploy_ctx['FORCE_DEPLOY'] = 'True'
+        try:
+            self.assertFalse(deploy._is_unchanged(cloud_formation, fingerprint), "Did not honor force")
+        finally:
+            del self.test_deploy_ctx['FORCE_DEPLOY']
 
+    def test_noop_deploy_recorded(self):
+        template = ParentTestCase._get_resource_path("cloudformation/aws-resources.template")
+        parameter_file = ParentTestCase._get_resource_path("cloudformation/aws-resources.parameters.json")
+        deploy = NoopStackDeploy(self.test_deploy_ctx.stack_name, LocalTemplate(template, parameter_file),
+                                 self.test_deploy_ctx)
+        deploy._internal_deploy(dry_run=False)
+        self.assertEqual(deploy.cloud_formation.change_sets, 1, "Did not create ChangeSet")
+        self.assertEqual(deploy.cloud_formation.deleted, 1, "Did not clean up no-op ChangeSet")
+        deploy._internal_deploy(dry_run=False)
+        self.assertEqual(deploy.cloud_formation.change_sets, 1, "Did not skip unchanged stack after no-op deploy")
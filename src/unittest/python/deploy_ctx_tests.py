@@ -6,12 +6,41 @@ import tempfile
 from infra_buddy.commandline import cli
 from infra_buddy.commands.deploy_service import command as ds_command
 from infra_buddy.context.deploy_ctx import DeployContext
-from infra_buddy.context.deploy_ctx import REGION
+from infra_buddy.context.deploy_ctx import REGION, STACK_NAME, env_variables
 from testcase_parent import ParentTestCase
 
 DIRNAME = os.path.dirname(os.path.abspath(__file__))
 
 
+class FakePreparedDeploy(object):
+    def __init__(self, stack_name, change_set_id):
+        super(FakePreparedDeploy, self).__init__()
+        self.stack_name = stack_name
+        self.change_set_id = change_set_id
+        self.description = None
+
+    def prepare_change_set(self):
+        return self.change_set_id
+
+    def set_prepared_change_set_description(self, description):
+        self.description = description
+
+
+class FakeChangeSetClient(object):
+    def __init__(self):
+        super(FakeChangeSetClient, self).__init__()
+        self.calls = 0
+
+    def describe_change_set(self, ChangeSetName):
+        self.calls += 1
+        if ChangeSetName == 'noop':
+            return {'ChangeSetId': ChangeSetName, 'Status': 'FAILED',
+                    'StatusReason': "The submitted information didn't contain changes."}
+        return {'ChangeSetId': ChangeSetName, 'Status': 'CREATE_COMPLETE',
+                'Changes': [{'ResourceChange': {'Action': 'Modify', 'LogicalResourceId': 'Queue',
+                                                'ResourceType': 'AWS::SQS::Queue', 'Replacement': 'False'}}]}
+
+
 class DeployContextTestCase(ParentTestCase):
     def tearDown(self):
         pass
@@ -28,6 +57,13 @@ class DeployContextTestCase(ParentTestCase):
                                                          defaults=self.default_config)
         self.assertEqual(deploy_ctx.vpcapp, "foo", "Failed to generate generate_short_app_name")
 
+    def test_shared_env_variables(self):
+        template = env_variables[STACK_NAME]
+        deploy_ctx = DeployContext.create_deploy_context(application="foo", role=None, environment="unit-test",
+                                                         defaults=self.default_config)
+        self.assertEqual(deploy_ctx.stack_name, "unit-test-foo", "Failed to render partial stack name")
+        self.assertEqual(env_variables[STACK_NAME], template, "Modified shared env variables")
+
     def test_s3_config_url_path(self):
         east_deploy_ctx = DeployContext.create_deploy_context(application="foo", role="bar-{}".format(self.run_random_word), environment="unit-test",
                                             defaults=self.east_config)
@@ -36,6 +72,28 @@ class DeployContextTestCase(ParentTestCase):
                                             defaults=self.default_config)
         self.assertTrue("s3-us-west-1." in test_deploy_ctx.config_templates_url)
 
+    def test_fork(self):
+        deploy_ctx = DeployContext.create_deploy_context(application="foo", role="bar", environment="unit-test",
+                                                         defaults=self.default_config)
+        fork = deploy_ctx.fork()
+        self.assertEqual(fork.stack_name, deploy_ctx.stack_name, "Fork did not copy the context")
+        fork._update_stack_name("unit-test-foo-bar-mod")
+        fork.temp_files.append("foo")
+        self.assertEqual(deploy_ctx.stack_name, "unit-test-foo-bar", "Fork modified the parent stack name")
+        self.assertEqual(deploy_ctx['STACK_NAME'], "unit-test-foo-bar", "Fork modified the parent context")
+        self.assertEqual(deploy_ctx.temp_files, [], "Fork shares temp files")
+        fork.temp_files.remove("foo")
+
+    def test_for_region(self):
+        deploy_ctx = DeployContext.create_deploy_context(application="foo", role="bar", environment="unit-test",
+                                                         defaults=self.default_config)
+        east = deploy_ctx.for_region('us-east-1')
+        self.assertEqual(east.region, 'us-east-1', "Did not change region")
+        self.assertEqual(east['REGION'], 'us-east-1', "Did not change region")
+        self.assertTrue("s3." in east.config_templates_url, "Did not regenerate region specific values")
+        self.assertTrue("s3-us-west-1." in deploy_ctx.config_templates_url, "Modified the parent context")
+        self.assertIs(east.template_manager, deploy_ctx.template_manager, "Did not share template manager")
+
     def _validate_deploy_ctx(self, deploy_ctx):
         # type: (DeployContext) -> None
         self.assertEqual(deploy_ctx.cf_bucket_name, "unit-test-foo-cloudformation-deploy-resources",
@@ -153,3 +211,13 @@ class DeployContextTestCase(ParentTestCase):
                                                                   defaults=self.default_config)
         ds_command.do_command(deploy_ctx=deploy_ctx,dry_run=True)
 
+
+    def test_prepare_change_sets(self):
+        stacks = [FakePreparedDeploy('main', 'update'), FakePreparedDeploy('new', None),
+                  FakePreparedDeploy('mod', 'noop')]
+        client = FakeChangeSetClient()
+        ds_command._prepare_change_sets(stacks, client)
+        self.assertEqual(client.calls, 2, "Did not wait for prepared change sets together")
+        self.assertEqual(stacks[0].description['Status'], 'CREATE_COMPLETE', "Did not record change set")
+        self.assertIsNone(stacks[1].description, "Prepared a change set for a new stack")
+        self.assertEqual(stacks[2].description['Status'], 'FAILED', "Did not record no-op change set")
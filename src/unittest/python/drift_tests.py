@@ -0,0 +1,49 @@
+import unittest
+
+from botocore.exceptions import ClientError
+
+from infra_buddy.aws.drift import StackDriftDetector
+
+
+class FakeDriftClient(object):
+    def __init__(self):
+        super(FakeDriftClient, self).__init__()
+        self.polls = {}
+        self.resource_drift_calls = []
+
+    def detect_stack_drift(self, StackName):
+        if StackName == 'busy':
+            raise ClientError({'Error': {'Code': 'ValidationError', 'Message': 'Stack is in UPDATE_IN_PROGRESS'}},
+                              'DetectStackDrift')
+        return {'StackDriftDetectionId': 'id-{}'.format(StackName)}
+
+    def describe_stack_drift_detection_status(self, StackDriftDetectionId):
+        self.polls[StackDriftDetectionId] = self.polls.get(StackDriftDetectionId, 0) + 1
+        if StackDriftDetectionId == 'id-slow' and self.polls[StackDriftDetectionId] < 3:
+            return {'DetectionStatus': 'DETECTION_IN_PROGRESS'}
+        drift_status = 'DRIFTED' if StackDriftDetectionId == 'id-slow' else 'IN_SYNC'
+        return {'DetectionStatus': 'DETECTION_COMPLETE', 'StackDriftStatus': drift_status}
+
+    def describe_stack_resource_drifts(self, StackName, StackResourceDriftStatusFilters, NextToken=None):
+        self.resource_drift_calls.append(NextToken)
+        drift = {'LogicalResourceId': 'Queue{}'.format(len(self.resource_drift_calls)),
+                 'ResourceType': 'AWS::SQS::Queue',
+                 'StackResourceDriftStatus': 'MODIFIED'}
+        if NextToken:
+            return {'StackResourceDrifts': [drift]}
+        return {'StackResourceDrifts': [drift], 'NextToken': 'page-2'}
+
+
+class DriftTestCase(unittest.TestCase):
+    def test_multiplexed_detection(self):
+        client = FakeDriftClient()
+        detector = StackDriftDetector(client, initial_interval_seconds=0, max_interval_seconds=0)
+        detections = detector.start(['fast', 'slow', 'busy'])
+        self.assertEqual(detections, {'id-fast': 'fast', 'id-slow': 'slow'}, "Did not skip busy stack")
+        results = list(detector.iter_results(detections))
+        self.assertEqual([stack for stack, status, drifts in results], ['fast', 'slow'],
+                         "Did not stream results as detections completed")
+        self.assertEqual(client.polls, {'id-fast': 1, 'id-slow': 3}, "Polled completed detection again")
+        self.assertEqual(results[0][2], [], "Loaded drifts for stack in sync")
+        self.assertEqual([drift['LogicalResourceId'] for drift in results[1][2]], ['Queue1', 'Queue2'],
+                         "Did not page resource drifts")
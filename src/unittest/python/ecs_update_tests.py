@@ -1,9 +1,13 @@
 import json
 
-from infra_buddy.aws.ecs import ECSBuddy
+from infra_buddy.aws.ecs import ECSBuddy, DEFINITION_HASH_TAG, compute_task_definition_hash, \
+    _task_definition_cache
 from infra_buddy.deploy.ecs_deploy import ECSDeploy
+from fakes import FakeImageDigestResolver, DIGEST
 from testcase_parent import ParentTestCase
 
+REVISION_ARN = "arn:aws:ecs:us-west-2:271083817914:task-definition/prod-otxb-portal-yara-listener-ECSTaskFamily{}"
+
 
 class FakeEcsClient(object):
     def __init__(self, testcase):
@@ -11,24 +15,70 @@ class FakeEcsClient(object):
         path = testcase._get_resource_path("ecs_tests/task_def.json")
         with open(path,'r') as definition:
             self.test_task_definition = json.load(definition)
+        self.registered = []
+        self.revisions = {}
+        self.definitions = {}
+        self.running = self.test_task_definition['taskDefinition']['taskDefinitionArn']
+        self.deployment = None
+        self.running_digest = None
 
-    def describe_task_definition(self,taskDefinition):
+    def describe_task_definition(self,taskDefinition,include=None):
+        if taskDefinition in self.revisions:
+            return {'taskDefinition': {'taskDefinitionArn': taskDefinition},
+                    'tags': [{'key': DEFINITION_HASH_TAG, 'value': self.revisions[taskDefinition]}]}
+        if taskDefinition in self.definitions:
+            return {'taskDefinition': self.definitions[taskDefinition]}
         return self.test_task_definition
 
+    def list_task_definitions(self, familyPrefix, status, sort, maxResults):
+        return {'taskDefinitionArns': list(self.revisions)}
+
+    def list_tasks(self, cluster, desiredStatus, serviceName=None, startedBy=None):
+        return {'taskArns': ['running-task'] if serviceName else []}
+
+    def describe_tasks(self, cluster, tasks):
+        image = self.test_task_definition['taskDefinition']['containerDefinitions'][0]['image']
+        return {'tasks': [{'taskArn': 'running-task',
+                           'containers': [{'name': 'app', 'image': image, 'imageDigest': self.running_digest}]}]}
+
     def register_task_definition(self,**kwargs):
+        self.registered.append(kwargs)
         return self.test_task_definition
 
     def update_service(self,
                 cluster,
                 service,
                 taskDefinition):
-        pass
+        self.deployment = {'id': 'ecs-svc/1', 'status': 'PRIMARY', 'taskDefinition': taskDefinition,
+                           'desiredCount': 2, 'runningCount': 0, 'pendingCount': 2, 'failedTasks': 0,
+                           'rolloutState': 'IN_PROGRESS'}
+        self.polls = 0
+        return {'service': {'deployments': [self.deployment],
+                            'events': [{'id': 'old', 'createdAt': 0, 'message': 'old event'}]}}
 
-    def get_waiter(self,name):
-        return self
+    def describe_services(self, cluster, services):
+        if self.deployment is None:
+            return {'services': [{'taskDefinition': self.running, 'deployments': [], 'events': []}]}
+        self.polls += 1
+        if self.polls > 1:
+            self.deployment.update({'runningCount': 2, 'pendingCount': 0, 'rolloutState': 'COMPLETED'})
+        return {'services': [{'deployments': [self.deployment],
+                              'events': [{'id': str(self.polls), 'createdAt': self.polls, 'message': 'polled'}]}]}
 
-    def wait(self,cluster,services):
-        return
+
+class FailingEcsClient(FakeEcsClient):
+    def describe_services(self, cluster, services):
+        if self.deployment is None:
+            return super(FailingEcsClient, self).describe_services(cluster, services)
+        self.deployment['failedTasks'] = 1
+        return {'services': [{'deployments': [self.deployment], 'events': []}]}
+
+    def list_tasks(self, cluster, desiredStatus, serviceName=None, startedBy=None):
+        return {'taskArns': ['task-1'] if startedBy == 'ecs-svc/1' else []}
+
+    def describe_tasks(self, cluster, tasks):
+        return {'tasks': [{'taskArn': 'task-1', 'stoppedReason': 'Essential container in task exited',
+                           'containers': [{'name': 'app', 'exitCode': 1}]}]}
 
 class ECSUpdateTemplateTestCase(ParentTestCase):
     def tearDown(self):
@@ -49,6 +99,53 @@ class ECSUpdateTemplateTestCase(ParentTestCase):
         ecs.set_container_image("271083817914.dkr.ecr.us-west-2.amazonaws.com/otx/otxb-portal-yara-listener", "1.21")
         self.assertFalse(ecs.requires_update(),"Did not recognize udpate not required")
         ecs.perform_update()
+        self.assertEqual(len(ecs.client.registered), 1, "Did not register new definition")
+        registered = dict(ecs.client.registered[0])
+        definition_hash = registered.pop('tags')[0]['value']
+        self.assertEqual(definition_hash, compute_task_definition_hash(registered), "Did not tag definition hash")
+
+    def test_task_definition_reuse(self):
+        ecs = ECSBuddy(self.test_deploy_ctx)
+        ecs.client = FakeEcsClient(self)
+        ecs.cluster = "fake-cluster"
+        ecs.ecs_service = "fake-service"
+        ecs.ecs_task_family = "fake-task-family-reuse"
+        ecs.set_container_image("path", "rollback")
+        ecs.perform_update()
+        registered = dict(ecs.client.registered[0])
+        definition_hash = registered.pop('tags')[0]['value']
+        ecs.client = FakeEcsClient(self)
+        ecs.client.revisions = {REVISION_ARN.format("-worker:12"): definition_hash,
+                                REVISION_ARN.format(":11"): definition_hash}
+        _task_definition_cache.clear()
+        ecs.perform_update()
+        self.assertEqual(ecs.client.registered, [], "Registered duplicate definition")
+        self.assertEqual(ecs.client.deployment['taskDefinition'], REVISION_ARN.format(":11"),
+                         "Did not reuse revision of the family")
+
+    def test_compare_running_revision(self):
+        ecs = ECSBuddy(self.test_deploy_ctx)
+        ecs.client = FakeEcsClient(self)
+        ecs.cluster = "fake-cluster"
+        ecs.ecs_service = "fake-service"
+        ecs.ecs_task_family = "fake-task-family"
+        # rolled back to an older revision while the latest revision of the family has the newer image
+        ecs.client.running = REVISION_ARN.format(":11")
+        ecs.client.definitions[ecs.client.running] = {'family': 'prod-otxb-portal-yara-listener-ECSTaskFamily',
+                                                     'containerDefinitions': [{'image': 'path:rollback'}],
+                                                     'volumes': []}
+        ecs.set_container_image("271083817914.dkr.ecr.us-west-2.amazonaws.com/otx/otxb-portal-yara-listener", "1.21")
+        self.assertTrue(ecs.requires_update(), "Compared against latest revision instead of running revision")
+
+    def test_ecs_update_failure(self):
+        ecs = ECSBuddy(self.test_deploy_ctx)
+        ecs.client = FailingEcsClient(self)
+        ecs.cluster = "fake-cluster"
+        ecs.ecs_service = "fake-service"
+        ecs.ecs_task_family = "fake-task-family"
+        ecs.set_container_image("path", "bar")
+        with self.assertRaisesRegex(Exception, "app: exit code 1"):
+            ecs.perform_update()
 
     def test_ecs_deploy(self):
         deploy = ECSDeploy(deploy_ctx=self.test_deploy_ctx,artifact_id="1.21",artifact_location="271083817914.dkr.ecr.us-west-2.amazonaws.com/otx/otxb-portal-yara-listener")
@@ -58,3 +155,32 @@ class ECSUpdateTemplateTestCase(ParentTestCase):
         do_deploy = deploy.do_deploy(dry_run=True)
         self.assertIsNone(do_deploy,"Failed to dry run")
 
+    def test_lazy_construction(self):
+        deploy = ECSDeploy(deploy_ctx=self.test_deploy_ctx, artifact_id="1.21", artifact_location="path")
+        self.assertIsNone(deploy._ecs_buddy, "Built ECSBuddy before deploy")
+        ecs = deploy.ecs_buddy
+        self.assertEqual(ecs.exports, {}, "Resolved exports before use")
+        ecs.cluster = "fake-cluster"
+        self.assertEqual(ecs.cluster, "fake-cluster", "Did not respect assigned export")
+
+    def test_digest_comparison(self):
+        ecs = ECSBuddy(self.test_deploy_ctx)
+        ecs.client = FakeEcsClient(self)
+        ecs.cluster = "fake-cluster"
+        ecs.ecs_service = "fake-service"
+        ecs.ecs_task_family = "fake-task-family"
+        ecs.image_digest_resolver = FakeImageDigestResolver()
+        ecs.client.running_digest = DIGEST
+        ecs.set_container_image("271083817914.dkr.ecr.us-west-2.amazonaws.com/otx/otxb-portal-yara-listener",
+                                "1.22", digest=DIGEST)
+        self.assertTrue(ecs.new_image.endswith("@{}".format(DIGEST)), "Did not pin image to digest")
+        self.assertFalse(ecs.requires_update(), "Retagged image required update")
+        # the tag of the running image was moved to the new build
+        ecs.client.running_digest = "sha256:old"
+        self.assertTrue(ecs.requires_update(), "Compared moved tag instead of running digest")
+        self.assertEqual(ecs.image_digest_resolver.lookups, [], "Resolved the existing tag")
+        ecs.client.test_task_definition['taskDefinition']['containerDefinitions'][0]['image'] = "path@{}".format(DIGEST)
+        ecs.set_container_image("other", "bar", digest=DIGEST)
+        self.assertFalse(ecs.requires_update(), "Did not compare pinned digest")
+        ecs.set_container_image("path", "bar", digest="sha256:other")
+        self.assertTrue(ecs.requires_update(), "Did not recognize new image")
@@ -0,0 +1,97 @@
+import json
+import os
+import tempfile
+import threading
+
+from infra_buddy.deploy.cloudformation_deploy import CloudFormationDeploy
+from infra_buddy.deploy.deploy import Deploy
+from infra_buddy.deploy.execution_graph import ExecutionGraph, _StackReferences
+from infra_buddy.template.template import LocalTemplate
+from testcase_parent import ParentTestCase
+
+
+def _import(name):
+    return {"Type": "AWS::SNS::Topic", "Properties": {"TopicName": {"Fn::ImportValue": name}}}
+
+
+def _export(name):
+    return {"Value": "value", "Export": {"Name": name}}
+
+
+class FakeArtifactDeploy(Deploy):
+    def __str__(self):
+        return "FakeArtifactDeploy"
+
+
+class ExecutionGraphTestCase(ParentTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.parameter_file = os.path.join(self.directory, "parameters.json")
+        with open(self.parameter_file, 'w') as params:
+            json.dump([{"ParameterKey": "ServiceStack", "ParameterValue": "${ENVIRONMENT}-${APPLICATION}-${ROLE}"}],
+                      params)
+
+    def tearDown(self):
+        self.clean_dir(self.directory)
+
+    def _deploy(self, name, resources=None, outputs=None):
+        template_file = os.path.join(self.directory, "{}.template".format(name))
+        with open(template_file, 'w') as template:
+            json.dump({"Parameters": {"ServiceStack": {"Type": "String"}},
+                       "Resources": resources or {},
+                       "Outputs": outputs or {}}, template)
+        return CloudFormationDeploy("{}-{}".format(self.test_deploy_ctx.stack_name, name),
+                                    LocalTemplate(template_file, self.parameter_file),
+                                    self.test_deploy_ctx)
+
+    def _plan(self):
+        main = self._deploy("main", outputs={"Service": _export({"Fn::Sub": "${AWS::StackName}-ECSService"})})
+        main.stack_name = self.test_deploy_ctx.stack_name
+        return [main,
+                self._deploy("resources",
+                             outputs={"Service": {"Value": {"Fn::ImportValue": {"Fn::Sub": "${ServiceStack}-ECSService"}}}}),
+                self._deploy("autoscale", resources={"Topic": _import({"Fn::Sub": "${ServiceStack}-ECSService"})},
+                             outputs={"Policy": _export({"Fn::Join": ["-", [{"Ref": "AWS::StackName"}, "Policy"]]})}),
+                self._deploy("alarms",
+                             resources={"Topic": _import({"Fn::Sub": "${ServiceStack}-autoscale-Policy"})}),
+                self._deploy("opaque", resources={"Topic": _import({"Fn::GetAtt": ["Foo", "Bar"]})}),
+                FakeArtifactDeploy(self.test_deploy_ctx)]
+
+    def test_dependency_inference(self):
+        plan = self._plan()
+        graph = ExecutionGraph(plan)
+        self.assertFalse(any(deploy.defaults_loaded for deploy in plan[:-1]), "Loaded deploy defaults to build graph")
+        self.assertEqual(graph.dependencies[0], set(), "Service stack has dependencies")
+        self.assertEqual(graph.dependencies[1], {0}, "Did not run service stack first")
+        self.assertEqual(_StackReferences(plan[1]).imports, _StackReferences(plan[2]).imports,
+                         "Did not find import in Outputs")
+        self.assertEqual(graph.dependencies[2], {0}, "Did not resolve Sub with parameters")
+        self.assertEqual(graph.dependencies[3], {0, 2}, "Did not resolve Join export")
+        self.assertEqual(graph.dependencies[4], {0, 1, 2, 3}, "Did not fall back to plan order")
+        self.assertEqual(graph.dependencies[5], {0, 1, 2, 3, 4}, "Artifact deploy did not wait for stacks")
+
+    def test_parallel_run(self):
+        plan = self._plan()
+        graph = ExecutionGraph(plan)
+        lock = threading.Lock()
+        finished = []
+
+        def run_deploy(deploy):
+            index = plan.index(deploy)
+            with lock:
+                self.assertTrue(graph.dependencies[index] <= set(finished), "Ran before dependencies")
+                finished.append(index)
+
+        graph.run(run_deploy, 3)
+        self.assertEqual(sorted(finished), list(range(len(plan))), "Did not run every deploy")
+
+        started = []
+
+        def fail_autoscale(deploy):
+            started.append(plan.index(deploy))
+            if plan.index(deploy) == 2:
+                raise Exception("autoscale failed")
+
+        with self.assertRaises(Exception):
+            graph.run(fail_autoscale, 1)
+        self.assertTrue(3 not in started and 5 not in started, "Started deploys after a failure")
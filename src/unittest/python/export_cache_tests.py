@@ -0,0 +1,92 @@
+import os
+import tempfile
+
+from infra_buddy.aws.cloudformation import CloudFormationBuddy
+from infra_buddy.aws.export_cache import ExportCache
+from testcase_parent import ParentTestCase
+
+
+class FakeExportClient(object):
+    def __init__(self):
+        super(FakeExportClient, self).__init__()
+        self.calls = 0
+
+    def list_exports(self, NextToken=None):
+        self.calls += 1
+        if NextToken:
+            return {'Exports': [{'Name': 'second-page', 'Value': 'bar'}]}
+        return {'Exports': [{'Name': 'first-page', 'Value': 'foo'}], 'NextToken': 'next'}
+
+
+class LateExportClient(FakeExportClient):
+    def list_exports(self, NextToken=None):
+        self.calls += 1
+        exports = [{'Name': 'cluster', 'Value': 'foo'}]
+        if self.calls > 1:
+            exports.append({'Name': 'service', 'Value': 'bar'})
+        return {'Exports': exports}
+
+
+class ExportCacheTestCase(ParentTestCase):
+    def tearDown(self):
+        ExportCache.clear_all()
+        self.test_deploy_ctx.pop('AWS_ACCOUNT_ID', None)
+        self.test_deploy_ctx.pop('EXPORT_CACHE_FILE', None)
+
+    @classmethod
+    def setUpClass(cls):
+        super(ExportCacheTestCase, cls).setUpClass()
+
+    def setUp(self):
+        ExportCache.clear_all()
+        self.test_deploy_ctx['AWS_ACCOUNT_ID'] = '123456789012'
+
+    def test_shared_between_buddies(self):
+        client = FakeExportClient()
+        first = CloudFormationBuddy(self.test_deploy_ctx)
+        first.client = client
+        second = CloudFormationBuddy(self.test_deploy_ctx)
+        second.client = client
+        self.assertEqual(first.get_export_value(fully_qualified_param_name='first-page'), 'foo', "Failed to load")
+        self.assertEqual(second.get_export_value(fully_qualified_param_name='second-page'), 'bar', "Failed to page")
+        self.assertEqual(client.calls, 2, "Did not share export scan")
+        second._invalidate_exports()
+        first.get_export_value(fully_qualified_param_name='first-page')
+        self.assertEqual(client.calls, 4, "Did not rescan after invalidation")
+
+    def test_resolve_exports(self):
+        client = LateExportClient()
+        cf = CloudFormationBuddy(self.test_deploy_ctx)
+        cf.client = client
+        exports = cf.resolve_exports(required=['cluster', 'service'], optional=['role'],
+                                     initial_interval_seconds=0, max_interval_seconds=0)
+        self.assertEqual(exports, {'cluster': 'foo', 'service': 'bar', 'role': None}, "Did not resolve exports")
+        self.assertEqual(client.calls, 2, "Did not rescan for missing required export only")
+        exports = cf.resolve_exports(required=['cluster'], optional=['role'])
+        self.assertEqual(client.calls, 2, "Waited for optional export")
+
+    def test_ttl(self):
+        client = FakeExportClient()
+        cache = ExportCache(region='us-west-1', account_id='123456789012', ttl_seconds=0)
+        cache.get_exports(client)
+        cache.loaded_at -= 1
+        cache.get_exports(client)
+        self.assertEqual(client.calls, 4, "Did not expire exports")
+
+    def test_persistence(self):
+        temp_dir = tempfile.mkdtemp()
+        path = os.path.join(temp_dir, 'exports.json')
+        try:
+            client = FakeExportClient()
+            ExportCache(region='us-west-1', account_id='123456789012', ttl_seconds=300,
+                        persist_path=path).get_exports(client)
+            reloaded = ExportCache(region='us-west-1', account_id='123456789012', ttl_seconds=300,
+                                   persist_path=path)
+            self.assertEqual(reloaded.get_export_value(client, 'second-page'), 'bar', "Failed to load from file")
+            self.assertEqual(client.calls, 2, "Did not reuse persisted exports")
+            reloaded.invalidate()
+            other_region = ExportCache(region='us-east-1', account_id='123456789012', ttl_seconds=300,
+                                       persist_path=path)
+            self.assertIsNone(other_region.loaded_at, "Shared exports across regions")
+        finally:
+            self.clean_dir(temp_dir)
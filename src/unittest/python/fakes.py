@@ -0,0 +1,13 @@
+from infra_buddy.aws.image_digest import ImageDigestResolver
+
+DIGEST = "sha256:{}".format("a" * 64)
+
+
+class FakeImageDigestResolver(ImageDigestResolver):
+    def __init__(self, cache_path=None, ttl_seconds=300):
+        super(FakeImageDigestResolver, self).__init__(cache_path=cache_path, ttl_seconds=ttl_seconds)
+        self.lookups = []
+
+    def _lookup(self, location, tag):
+        self.lookups.append((location, tag))
+        return DIGEST
@@ -0,0 +1,22 @@
+import io
+
+from infra_buddy.commands.deploy_fleet import command as fleet_command
+from testcase_parent import ParentTestCase
+
+
+class FleetTestCase(ParentTestCase):
+    def tearDown(self):
+        pass
+
+    def test_load_manifest(self):
+        manifest = io.StringIO('{"artifact-directory": "./api"}\n\n{"artifact-directory": "s3://bucket/worker.zip"}\n')
+        self.assertEqual(fleet_command.load_manifest(manifest), ["./api", "s3://bucket/worker.zip"],
+                         "Did not load manifest")
+
+    def test_failed_deploy_report(self):
+        missing = self._get_resource_path('artifact_directory_tests/does_not_exist')
+        results = fleet_command.do_command(self.test_deploy_ctx, [missing, missing], dry_run=True, parallelism=2)
+        self.assertEqual(len(results), 2, "Did not report every deployment")
+        self.assertEqual(results[0]['artifact-directory'], missing, "Did not report artifact directory")
+        self.assertEqual(results[0]['status'], 'FAILED', "Did not report failure")
+        self.assertTrue('error' in results[0], "Did not report error")
@@ -0,0 +1,38 @@
+import os
+import tempfile
+import unittest
+
+from fakes import FakeImageDigestResolver, DIGEST
+from infra_buddy.aws.image_digest import split_image, split_location
+
+
+class ImageDigestTestCase(unittest.TestCase):
+    def test_parse_references(self):
+        self.assertEqual(split_image("localhost:5000/app:1.2"), ("localhost:5000/app", "1.2", None),
+                         "Confused registry port with tag")
+        self.assertEqual(split_image("repo/app@{}".format(DIGEST)), ("repo/app", None, DIGEST), "Did not parse digest")
+        self.assertEqual(split_location("123456789012.dkr.ecr.us-west-2.amazonaws.com/otx/app"),
+                         ("123456789012.dkr.ecr.us-west-2.amazonaws.com", "otx/app"), "Did not parse ECR location")
+        self.assertEqual(split_location("nginx"), ("registry-1.docker.io", "library/nginx"),
+                         "Did not default to Docker Hub")
+        self.assertEqual(split_location("https://docker.io/my-registry/artifact"), ("docker.io", "my-registry/artifact"),
+                         "Did not strip scheme")
+
+    def test_cached_resolution(self):
+        temp_dir = tempfile.mkdtemp()
+        path = os.path.join(temp_dir, 'digests.json')
+        try:
+            resolver = FakeImageDigestResolver(cache_path=path)
+            self.assertEqual(resolver.resolve("repo/app", "latest"), DIGEST, "Did not resolve tag")
+            self.assertEqual(resolver.resolve_image("repo/app:latest"), DIGEST, "Did not resolve image")
+            self.assertEqual(resolver.resolve_image("repo/app@sha256:b"), "sha256:b", "Looked up pinned image")
+            self.assertEqual(len(resolver.lookups), 1, "Did not cache digest")
+            reloaded = FakeImageDigestResolver(cache_path=path)
+            reloaded.resolve("repo/app", "latest")
+            self.assertEqual(reloaded.lookups, [], "Did not reuse cache file")
+            expired = FakeImageDigestResolver(cache_path=path, ttl_seconds=-1)
+            expired.resolve("repo/app", "latest")
+            self.assertEqual(len(expired.lookups), 1, "Did not expire moved tags")
+        finally:
+            os.remove(path)
+            os.rmdir(temp_dir)
@@ -1,6 +1,10 @@
 import json
+import os
+import tempfile
 
 from infra_buddy.aws.cloudformation import CloudFormationBuddy
+from infra_buddy.aws.resource_groups import ResourceGroupsTaggingBuddy
+from infra_buddy.aws.resource_index import ResourceIndex
 from infra_buddy.deploy.ecs_deploy import ECSDeploy
 from testcase_parent import ParentTestCase
 
@@ -14,14 +18,38 @@ class FakeCFClient(object):
         path = testcase._get_resource_path("introspect_tests/stack_resource_response.json")
         with open(path, 'r') as definition:
             self.resource = json.load(definition)
+        self.resource_calls = 0
 
     def list_stacks(self, StackStatusFilter):
         return self.stacK_list
 
     def list_stack_resources(self, StackName, NextToken=None):
+        self.resource_calls += 1
         return self.resource
 
 
+class FakeTaggingClient(object):
+    def __init__(self, stack_name):
+        # type: (str) -> None
+        self.stack_name = stack_name
+
+    def _mapping(self, arn, stack_name, logical_id):
+        return {'ResourceARN': arn,
+                'Tags': [{'Key': 'aws:cloudformation:stack-name', 'Value': stack_name},
+                         {'Key': 'aws:cloudformation:logical-id', 'Value': logical_id}]}
+
+    def get_resources(self, TagFilters, ResourcesPerPage, PaginationToken=None):
+        if not PaginationToken:
+            return {'ResourceTagMappingList': [
+                self._mapping('arn:aws:sqs:us-west-2:123456789012:queue', self.stack_name, 'Queue'),
+                self._mapping('arn:aws:sqs:us-west-2:123456789012:other', 'other-stack', 'Queue'),
+                {'ResourceARN': 'arn:aws:s3:::unmanaged', 'Tags': []}],
+                'PaginationToken': 'next'}
+        return {'ResourceTagMappingList': [
+            self._mapping('arn:aws:ec2:us-west-2:123456789012:security-group/sg-1', self.stack_name, 'SecurityGroup')],
+            'PaginationToken': ''}
+
+
 class IntrospectTestCase(ParentTestCase):
     def tearDown(self):
         pass
@@ -40,3 +68,71 @@ class IntrospectTestCase(ParentTestCase):
         resources = cf_buddy.load_resources_for_stack_list(['ci-otxb-reputation-proxy-api'])
         self.assertTrue(len(resources) == 1, "Did not load resources")
         self.assertTrue(len(resources['ci-otxb-reputation-proxy-api']) == 4, "Did not load resources for stack")
+
+    def test_streaming_resource_load(self):
+        cf_buddy = CloudFormationBuddy(self.test_deploy_ctx)
+        cf_buddy.client = FakeCFClient(self)
+        stacks = ["stack-{}".format(i) for i in range(5)]
+        loaded = dict(cf_buddy.iter_resources_for_stack_list(stacks, type_filter="AWS::IAM", max_workers=2))
+        self.assertEqual(sorted(loaded.keys()), stacks, "Did not load every stack")
+        for stack, resources in loaded.items():
+            self.assertTrue(len(resources) > 0, "Did not load resources for stack")
+            self.assertTrue(all("AWS::IAM" in r['ResourceType'] for r in resources), "Did not filter resources")
+
+    def test_resource_index(self):
+        cf_buddy = CloudFormationBuddy(self.test_deploy_ctx)
+        client = FakeCFClient(self)
+        cf_buddy.client = client
+        temp_dir = tempfile.mkdtemp()
+        lookups = []
+
+        def resolve_account(account_id):
+            lookups.append(account_id)
+            return account_id
+
+        index = ResourceIndex(os.path.join(temp_dir, 'index.db'), 'us-west-2',
+                              account_id_resolver=lambda: resolve_account('271083817914'), access_key='AKIA1')
+        try:
+            index.sync(cf_buddy)
+            stack_count = len(client.stacK_list['StackSummaries'])
+            self.assertEqual(client.resource_calls, stack_count, "Did not index every stack")
+            results = index.query(stack_prefix='ci-', type_filter='AWS::ECS')
+            self.assertEqual(len(results), 1, "Did not query by stack")
+            self.assertEqual(len(results[0][1]), 2, "Did not query by type")
+            results = index.query(logical_id=results[0][1][0]['LogicalResourceId'])
+            self.assertEqual(len(results), stack_count, "Did not query by logical id")
+            index.sync(cf_buddy)
+            self.assertEqual(client.resource_calls, stack_count, "Synced a fresh index")
+            client.stacK_list['StackSummaries'][0]['LastUpdatedTime'] = '2020-01-01T00:00:00.000Z'
+            index.sync(cf_buddy, max_age_seconds=-1)
+            self.assertEqual(client.resource_calls, stack_count + 1, "Did not incrementally sync")
+            same_account = ResourceIndex(index.path, 'us-west-2',
+                                         account_id_resolver=lambda: resolve_account('271083817914'),
+                                         access_key='AKIA1')
+            try:
+                self.assertTrue(same_account.is_fresh(300), "Did not find index of the account")
+                self.assertEqual(lookups, ['271083817914'], "Looked up the account of a known access key")
+            finally:
+                same_account.close()
+            other_account = ResourceIndex(index.path, 'us-west-2',
+                                          account_id_resolver=lambda: resolve_account('123456789012'),
+                                          access_key='AKIA2')
+            try:
+                self.assertFalse(other_account.is_fresh(300), "Shared sync state between accounts")
+                self.assertEqual(other_account.query(), [], "Shared resources between accounts")
+            finally:
+                other_account.close()
+        finally:
+            index.close()
+            self.clean_dir(temp_dir)
+
+    def test_tagging_backend(self):
+        tagging_buddy = ResourceGroupsTaggingBuddy(self.test_deploy_ctx)
+        tagging_buddy.client = FakeTaggingClient(self.test_deploy_ctx.stack_name)
+        results = tagging_buddy.load_resources_by_stack(stack_prefix=self.test_deploy_ctx.stack_name)
+        self.assertEqual(len(results), 1, "Did not map resources to stacks")
+        stack_name, resources = results[0]
+        self.assertEqual(stack_name, self.test_deploy_ctx.stack_name, "Did not map resources to stacks")
+        self.assertEqual([r['LogicalResourceId'] for r in resources], ['Queue', 'SecurityGroup'],
+                         "Did not page through resources")
+        self.assertEqual(resources[1]['ResourceType'], 'ec2:security-group', "Did not derive resource type")
@@ -0,0 +1,52 @@
+import unittest
+
+from infra_buddy.aws import clients
+from infra_buddy.aws.rate_limiter import AIMDLimiter, RateLimiter, TokenBucket, is_throttling_error
+
+
+class RateLimiterTestCase(unittest.TestCase):
+    def tearDown(self):
+        clients.clear()
+
+    def test_aimd_limiter(self):
+        limiter = AIMDLimiter(8, cooldown_seconds=0)
+        limiter.acquire()
+        limiter.release(throttled=True)
+        self.assertEqual(limiter.limit, 4, "Did not decrease multiplicatively")
+        for _ in range(5):
+            limiter.acquire()
+            limiter.release(throttled=False)
+        self.assertEqual(int(limiter.limit), 5, "Did not increase additively")
+        for _ in range(100):
+            limiter.acquire()
+            limiter.release(throttled=False)
+        self.assertEqual(limiter.limit, 8, "Grew past the maximum")
+        limiter = AIMDLimiter(8, cooldown_seconds=60)
+        limiter.on_throttle()
+        limiter.on_throttle()
+        self.assertEqual(limiter.limit, 4, "Decreased more than once for a burst of throttling")
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=1000, capacity=2)
+        self.assertEqual(bucket.acquire(), 0, "Waited within burst")
+        self.assertEqual(bucket.acquire(), 0, "Waited within burst")
+        self.assertTrue(bucket.acquire() > 0, "Did not wait for refill")
+
+    def test_client_hooks(self):
+        limiter = RateLimiter(max_concurrency=4)
+        model = clients.get_client('cloudformation', 'us-west-2').meta.service_model.operation_model('DescribeStacks')
+        context = {}
+        limiter._before_call(model=model, context=context)
+        limiter._response_received(parsed_response={'Error': {'Code': 'Throttling'}}, context=context)
+        limiter._response_received(parsed_response={'Stacks': []}, context=context)
+        limiter._after_call(context=context)
+        context = {}
+        limiter._before_call(model=model, context=context)
+        limiter._after_call_error(context=context)
+        counters = limiter.get_counters()['cloudformation.DescribeStacks']
+        self.assertEqual(counters['calls'], 2, "Did not count calls")
+        self.assertEqual(counters['throttled'], 1, "Did not count throttling")
+        self.assertEqual(counters['retried'], 1, "Did not count retries")
+        self.assertEqual(counters['concurrency_limit'], 2, "Did not shrink concurrency")
+        self.assertEqual(limiter.limiters['cloudformation.DescribeStacks'].in_flight, 0, "Leaked concurrency")
+        self.assertTrue(is_throttling_error({'Error': {'Code': 'RequestLimitExceeded'}}), "Missed throttling code")
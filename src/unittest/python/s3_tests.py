@@ -1,10 +1,13 @@
+import io
 import os
 import tempfile
 
+from botocore.exceptions import ClientError
+
 from infra_buddy.context.deploy_ctx import DeployContext
 
 from infra_buddy.aws import s3
-from infra_buddy.aws.s3 import S3Buddy, CloudFormationDeployS3Buddy
+from infra_buddy.aws.s3 import S3Buddy, CloudFormationDeployS3Buddy, StackFingerprintStore
 from infra_buddy.deploy.s3_deploy import S3Deploy
 from testcase_parent import ParentTestCase
 
@@ -22,6 +25,20 @@ class TestCloudFormationBuddy(object):
         )
 
 
+class FakeObjectClient(object):
+    def __init__(self):
+        super(FakeObjectClient, self).__init__()
+        self.objects = {}
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': 'Not Found'}}, 'GetObject')
+        return {'Body': io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self.objects[(Bucket, Key)] = Body
+
+
 class S3TestCase(ParentTestCase):
     def tearDown(self):
         pass
@@ -78,6 +95,30 @@ class S3TestCase(ParentTestCase):
         finally:
             self.clean_s3(s3_buddy)
 
+    def test_content_addressed_upload(self):
+        s3_buddy = CloudFormationDeployS3Buddy(self.test_deploy_ctx)
+        try:
+            changeset = ParentTestCase._get_resource_path("cloudformation/sample_changeset.json")
+            url = s3_buddy.upload_content_addressed(changeset)
+            self.assertEqual(s3_buddy.upload_content_addressed(changeset), url, "Content address changed")
+            s3_buddy.stage(changeset)
+            with open(changeset, 'r') as cs:
+                self.assertEqual(
+                    s3_buddy.get_file_as_string('sample_changeset.json'),
+                    cs.read(), "Failed to stage file under root path"
+                )
+        finally:
+            self.clean_s3(s3_buddy)
+
+    def test_fingerprint_store(self):
+        store = StackFingerprintStore(self.test_deploy_ctx)
+        store.client = FakeObjectClient()
+        self.assertIsNone(store.get('stack', 'stack-id@1'), "Found fingerprint that was never recorded")
+        store.put('stack', 'stack-id@1', 'fingerprint')
+        self.assertEqual(store.get('stack', 'stack-id@1'), 'fingerprint', "Did not read recorded fingerprint")
+        self.assertIsNone(store.get('stack', 'stack-id@2'), "Used fingerprint of an older stack version")
+        self.assertIsNone(store.get('other', 'stack-id@1'), "Shared fingerprint between stacks")
+
     def test_zip_download(self):
         s3_buddy = CloudFormationDeployS3Buddy(self.test_deploy_ctx)
         compress = ParentTestCase._get_resource_path("s3_tests/test_compress.json.zip")
@@ -0,0 +1,163 @@
+import unittest
+
+from botocore.exceptions import ClientError
+
+from infra_buddy.aws.stack_waiter import StackEventWaiter, ChangeSetWaiter, iter_stack_events, \
+    failed_resource_events
+
+STACK_NAME = "unit-test-foo-bar"
+
+
+def _event(event_id, status, token, logical_id=STACK_NAME, resource_type='AWS::CloudFormation::Stack'):
+    return {
+        'EventId': event_id,
+        'StackName': STACK_NAME,
+        'LogicalResourceId': logical_id,
+        'ResourceType': resource_type,
+        'ResourceStatus': status,
+        'ClientRequestToken': token,
+        'Timestamp': event_id
+    }
+
+
+class FakeEventClient(object):
+    def __init__(self, polls):
+        # type: (list) -> None
+        super(FakeEventClient, self).__init__()
+        # each poll is the full event history (oldest first) visible at that point in time
+        self.polls = polls
+        self.calls = 0
+        self.page_calls = 0
+
+    def describe_stack_events(self, StackName, NextToken=None):
+        self.page_calls += 1
+        if NextToken is None:
+            self.events = list(reversed(self.polls[min(self.calls, len(self.polls) - 1)]))
+            self.calls += 1
+            if len(self.events) > 2:
+                return {'StackEvents': self.events[:2], 'NextToken': '2'}
+            return {'StackEvents': self.events}
+        return {'StackEvents': self.events[int(NextToken):]}
+
+
+class FakeCancelClient(FakeEventClient):
+    def __init__(self, polls):
+        # type: (list) -> None
+        super(FakeCancelClient, self).__init__(polls)
+        self.cancelled = []
+
+    def cancel_update_stack(self, StackName, ClientRequestToken):
+        self.cancelled.append(ClientRequestToken)
+
+
+class FakeRollingBackClient(FakeCancelClient):
+    def cancel_update_stack(self, StackName, ClientRequestToken):
+        super(FakeRollingBackClient, self).cancel_update_stack(StackName, ClientRequestToken)
+        raise ClientError({'Error': {'Code': 'ValidationError',
+                                     'Message': 'CancelUpdateStack cannot be called from current stack status'}},
+                          'CancelUpdateStack')
+
+
+class FakeChangeSetClient(object):
+    def __init__(self, statuses):
+        # type: (dict) -> None
+        super(FakeChangeSetClient, self).__init__()
+        self.statuses = statuses
+
+    def describe_change_set(self, ChangeSetName):
+        statuses = self.statuses[ChangeSetName]
+        status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+        return {'ChangeSetId': ChangeSetName, 'Status': status}
+
+
+class StackWaiterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.previous = [_event('0', 'UPDATE_COMPLETE', 'old-token')]
+
+    def _waiter(self, client):
+        return StackEventWaiter(client=client,
+                                stack_name=STACK_NAME,
+                                client_request_token='token',
+                                initial_interval_seconds=0,
+                                max_interval_seconds=0)
+
+    def test_wait_for_success(self):
+        started = self.previous + [_event('1', 'UPDATE_IN_PROGRESS', 'token')]
+        progress = started + [_event('2', 'UPDATE_IN_PROGRESS', 'token', 'Queue', 'AWS::SQS::Queue'),
+                              _event('3', 'UPDATE_COMPLETE', 'token', 'Queue', 'AWS::SQS::Queue')]
+        complete = progress + [_event('4', 'UPDATE_COMPLETE', 'token')]
+        client = FakeEventClient([self.previous, started, progress, complete])
+        waiter = self._waiter(client)
+        self.assertTrue(waiter.wait(['UPDATE_COMPLETE']), "Failed to identify successful update")
+        self.assertEqual(client.calls, 4, "Did not stop polling on terminal event")
+        self.assertEqual([ev['EventId'] for ev in waiter.events], ['1', '2', '3', '4'],
+                         "Did not tail events in order")
+
+    def test_wait_for_failure(self):
+        failed = self.previous + [_event('1', 'UPDATE_IN_PROGRESS', 'token'),
+                                  _event('2', 'UPDATE_FAILED', 'token', 'Queue', 'AWS::SQS::Queue'),
+                                  _event('3', 'UPDATE_ROLLBACK_IN_PROGRESS', 'token'),
+                                  _event('4', 'UPDATE_ROLLBACK_COMPLETE', 'token')]
+        waiter = self._waiter(FakeEventClient([failed]))
+        self.assertFalse(waiter.wait(['UPDATE_COMPLETE']), "Failed to identify failed update")
+        self.assertEqual(waiter.final_status, 'UPDATE_ROLLBACK_COMPLETE', "Did not record final status")
+
+    def test_cancel_on_failure(self):
+        started = self.previous + [_event('1', 'UPDATE_IN_PROGRESS', 'token'),
+                                   _event('2', 'UPDATE_IN_PROGRESS', 'token', 'Service', 'AWS::ECS::Service')]
+        failed = started + [_event('3', 'UPDATE_FAILED', 'token', 'Queue', 'AWS::SQS::Queue')]
+        cancelled = _event('4', 'UPDATE_FAILED', 'token-cancel', 'Service', 'AWS::ECS::Service')
+        cancelled['ResourceStatusReason'] = 'Resource update cancelled'
+        rolled_back = failed + [cancelled,
+                                _event('5', 'UPDATE_ROLLBACK_IN_PROGRESS', 'token-cancel'),
+                                _event('6', 'UPDATE_ROLLBACK_COMPLETE', 'token-cancel')]
+        client = FakeCancelClient([started, failed, rolled_back])
+        waiter = StackEventWaiter(client=client, stack_name=STACK_NAME, client_request_token='token',
+                                  initial_interval_seconds=0, max_interval_seconds=0, cancel_on_failure=True)
+        self.assertFalse(waiter.wait(['UPDATE_COMPLETE']), "Failed to identify cancelled update")
+        self.assertEqual(client.cancelled, ['token-cancel'], "Did not cancel once on first failure")
+        self.assertEqual(waiter.final_status, 'UPDATE_ROLLBACK_COMPLETE', "Did not track rollback")
+        self.assertEqual(waiter.root_cause_event['LogicalResourceId'], 'Queue', "Did not report root cause")
+
+    def test_cancel_rejected(self):
+        started = self.previous + [_event('1', 'UPDATE_IN_PROGRESS', 'token')]
+        failed = started + [_event('2', 'UPDATE_FAILED', 'token', 'Queue', 'AWS::SQS::Queue')]
+        # the stack was already rolling back so the cancel is rejected
+        rolled_back = failed + [_event('3', 'UPDATE_ROLLBACK_IN_PROGRESS', 'token'),
+                                _event('4', 'UPDATE_ROLLBACK_COMPLETE', 'token')]
+        client = FakeRollingBackClient([started, failed, rolled_back])
+        waiter = StackEventWaiter(client=client, stack_name=STACK_NAME, client_request_token='token',
+                                  initial_interval_seconds=0, max_interval_seconds=0, cancel_on_failure=True)
+        self.assertFalse(waiter.wait(['UPDATE_COMPLETE']), "Failed to identify failed update")
+        self.assertEqual(client.cancelled, ['token-cancel'], "Did not attempt to cancel")
+        self.assertEqual(waiter.client_request_tokens, ['token'], "Tracked token of rejected cancel")
+        self.assertEqual(waiter.final_status, 'UPDATE_ROLLBACK_COMPLETE', "Did not keep waiting for rollback")
+
+    def test_change_set_wait(self):
+        client = FakeChangeSetClient({'noop': ['CREATE_PENDING', 'FAILED'],
+                                      'update': ['CREATE_PENDING', 'CREATE_IN_PROGRESS', 'CREATE_COMPLETE']})
+        waiter = ChangeSetWaiter(client, initial_interval_seconds=0, max_interval_seconds=0)
+        descriptions = waiter.wait(['noop', 'update'])
+        self.assertEqual(descriptions['noop']['Status'], 'FAILED', "Did not stop on failed change set")
+        self.assertEqual(descriptions['update']['Status'], 'CREATE_COMPLETE', "Did not wait for change set")
+
+    def test_change_set_wait_timeout(self):
+        client = FakeChangeSetClient({'stuck': ['CREATE_IN_PROGRESS']})
+        waiter = ChangeSetWaiter(client, initial_interval_seconds=0, max_interval_seconds=0, timeout_seconds=0)
+        self.assertEqual(waiter.wait(['stuck'])['stuck']['Status'], 'CREATE_IN_PROGRESS', "Did not time out")
+
+    def test_bounded_event_history(self):
+        history = [_event(str(i), 'UPDATE_COMPLETE', 'old-token', 'Queue', 'AWS::SQS::Queue') for i in range(10)]
+        history += [_event('10', 'UPDATE_IN_PROGRESS', 'token'),
+                    _event('11', 'UPDATE_FAILED', 'token', 'Queue', 'AWS::SQS::Queue'),
+                    _event('12', 'UPDATE_ROLLBACK_COMPLETE', 'token')]
+        client = FakeEventClient([history])
+        events = list(iter_stack_events(client, STACK_NAME, client_request_token='token'))
+        self.assertEqual([ev['EventId'] for ev in events], ['12', '11', '10'], "Did not bound by token")
+        self.assertEqual(client.page_calls, 2, "Paged past the start of the operation")
+        events = list(iter_stack_events(client, STACK_NAME))
+        self.assertEqual(len(events), 3, "Did not bound by operation start event")
+        events = list(iter_stack_events(client, STACK_NAME, since='11'))
+        self.assertEqual(len(events), 2, "Did not bound by timestamp")
+        failed = failed_resource_events(events)
+        self.assertEqual([ev['EventId'] for ev in failed], ['11'], "Did not summarize failed resources")
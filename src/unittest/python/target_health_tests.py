@@ -0,0 +1,44 @@
+import unittest
+
+from infra_buddy.aws.target_health import TargetHealthGate
+
+
+def _task(task_arn, ip):
+    return {'taskArn': task_arn, 'lastStatus': 'RUNNING',
+            'attachments': [{'details': [{'name': 'privateIPv4Address', 'value': ip}]}]}
+
+
+class FakeTaskClient(object):
+    def list_tasks(self, cluster, startedBy, desiredStatus):
+        return {'taskArns': ['new-task'] if startedBy == 'ecs-svc/new' else []}
+
+    def describe_tasks(self, cluster, tasks):
+        return {'tasks': [_task('new-task', '10.0.0.2')]}
+
+
+class FakeTargetHealthClient(object):
+    def __init__(self, polls):
+        super(FakeTargetHealthClient, self).__init__()
+        self.polls = polls
+
+    def describe_target_health(self, TargetGroupArn):
+        states = self.polls.pop(0)
+        return {'TargetHealthDescriptions': [{'Target': {'Id': ip, 'Port': 8080}, 'TargetHealth': {'State': state}}
+                                             for ip, state in states.items()]}
+
+
+class TargetHealthTestCase(unittest.TestCase):
+    def test_readiness(self):
+        elb = FakeTargetHealthClient([{'10.0.0.1': 'healthy', '10.0.0.2': 'initial'},
+                                      {'10.0.0.1': 'draining', '10.0.0.2': 'healthy'},
+                                      {'10.0.0.2': 'healthy'}])
+        gate = TargetHealthGate(FakeTaskClient(), elb, 'cluster',
+                                {'loadBalancers': [{'targetGroupArn': 'tg', 'containerPort': 8080}]})
+        deployment = {'id': 'ecs-svc/new', 'desiredCount': 1}
+        self.assertFalse(gate.is_ready(deployment), "Ready before new task was healthy")
+        self.assertFalse(gate.is_ready(deployment), "Ready before old task drained")
+        self.assertTrue(gate.is_ready(deployment), "Did not recognize ready deployment")
+
+    def test_no_target_groups(self):
+        gate = TargetHealthGate(FakeTaskClient(), FakeTargetHealthClient([]), 'cluster', {'loadBalancers': []})
+        self.assertFalse(gate.is_ready({'id': 'ecs-svc/new', 'desiredCount': 1}), "Gated service without targets")
@@ -1,6 +1,9 @@
 import os
 import tempfile
 
+import threading
+
+from infra_buddy.template.template import Template, GitHubTemplate
 from infra_buddy.template.template_manager import TemplateManager
 
 from infra_buddy.aws.s3 import CloudFormationDeployS3Buddy
@@ -12,6 +15,15 @@ from infra_buddy.commandline import cli
 from infra_buddy.commands.generate_service_definition import command as generate_command
 
 
+class CountingTemplate(Template):
+    def __init__(self):
+        super(CountingTemplate, self).__init__("counting", values={})
+        self.downloads = 0
+
+    def _download(self):
+        self.downloads += 1
+
+
 class TemplateManagerTestCase(ParentTestCase):
     def tearDown(self):
         pass
@@ -20,6 +32,20 @@ class TemplateManagerTestCase(ParentTestCase):
     def setUpClass(cls):
         super(TemplateManagerTestCase, cls).setUpClass()
 
+    def test_shared_template_download(self):
+        template = CountingTemplate()
+        threads = [threading.Thread(target=template.download_template) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(template.downloads, 1, "Downloaded shared template more than once")
+        values = {"type": "github", "owner": "rspitler", "repo": "cloudformation-templates", "tag": "v1"}
+        GitHubTemplate(service_type="default-api", values=values)
+        self.assertEqual(GitHubTemplate(service_type="default-api", values=values).download_url,
+                         "https://github.com/rspitler/cloudformation-templates/archive/v1.zip",
+                         "Loading a template modified its definition")
+
     def test_s3_template(self):
         s3 = CloudFormationDeployS3Buddy(self.test_deploy_ctx)
         template = ParentTestCase._get_resource_path("template_tests/test-template.zip")